@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+"""
+benchmark of the rows/s written by BatchWriter (utils/json_inserter.py) with multi-row INSERT statements
+(execute_values) against COPY through the staging tables of MyDb.copy_merge (db/pg_engine.py).
+
+synthetic officer lists and appointment lists (stub/fixtures.py) are written in batches to the ol_ and al_ tables of a
+scratch schema of the database of db/database.ini, once per path: the tables are truncated before each path. Needs a
+running postgres.
+
+run from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m benchmarks.copy_bench --companies 2000 --batch 500
+"""
+
+import argparse
+import time
+
+from db.pg_constants import DB_CONFIG_ABS_PATH, DB_CONFIG_SECTION
+from db.pg_engine import MyDb
+from db.pg_tables import officerlist_tables, appointmentlist_tables
+from stub.fixtures import synthesise
+from utils.json_inserter import BatchWriter
+from utils.json_params import officerlist_params, appointmentlist_params
+
+PATHS = {"execute_values": float("inf"), "COPY": 0}  # copy_threshold of the BatchWriter of each path.
+
+
+def make_documents(n_companies):
+    """(json, params, uid_value) of the officer lists and the appointment lists of n synthetic companies."""
+    documents = []
+    for path, (status, body) in synthesise(n_companies=n_companies, officers=(5, 40), appointments=(5, 60)).items():
+        if status == 200 and path.endswith("/officers"):
+            documents.append((body, officerlist_params, path.split("/")[2]))
+        elif status == 200 and path.endswith("/appointments"):
+            documents.append((body, appointmentlist_params, path))
+    return documents
+
+
+def time_path(engine, documents, batch, copy_threshold):
+    """returns (rows written, seconds) writing all the documents with a BatchWriter."""
+    engine.execute(mode="write", query="TRUNCATE officerlist, appointmentlist CASCADE")
+
+    writer = BatchWriter(batch_size=batch, copy_threshold=copy_threshold, db=engine)
+    start = time.perf_counter()
+    for document in documents:
+        writer.add(*document)
+    writer.flush()
+    return writer.stats["rows"], time.perf_counter() - start
+
+
+def main(n_companies, batch, schema):
+    engine = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=schema)
+    for create_stmts in (officerlist_tables, appointmentlist_tables):
+        engine.execute(mode="write", query=create_stmts)
+
+    documents = make_documents(n_companies)
+    print(f"{len(documents):,} documents, batches of {batch}, schema {schema}")
+    print(f"{'path':<16} {'rows':>10} {'seconds':>9} {'rows/s':>10}")
+    for name, copy_threshold in PATHS.items():
+        rows, seconds = time_path(engine, documents, batch, copy_threshold)
+        print(f"{name:<16} {rows:>10,} {seconds:>9.2f} {rows / seconds:>10,.0f}")
+
+    engine.close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="copy_bench.py")
+    arg_parser.add_argument("--companies", type=int, default=2000)
+    arg_parser.add_argument("--batch", type=int, default=500)
+    arg_parser.add_argument("--schema", default="copy_bench", help="scratch schema, created if missing.")
+    cli_args = arg_parser.parse_args()
+    main(n_companies=cli_args.companies, batch=cli_args.batch, schema=cli_args.schema)
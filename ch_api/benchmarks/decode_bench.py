@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+"""
+benchmark of the decoders of the response bodies available in utils.api_functions.DECODERS.
+
+the bodies are the pages of 100 items (50 for the appointments) the API would serve for the largest lists of the
+fixtures, either recorded (stub/recorder.py) or synthesised. Each decoder parses every page n times, the mean time per
+MB is measured with perf_counter and the memory allocated while decoding one page with tracemalloc. "r.json()" is
+what call_api did before: the body decoded to a str, then parsed with the stdlib json.
+
+run from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m benchmarks.decode_bench --repeat 20
+(venv) prompt$ python3 -m benchmarks.decode_bench --fixtures fixtures.jsonl
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from stub.fixtures import load_fixtures, synthesise
+from stub.server import StubApi
+from utils.api_functions import DECODERS
+
+
+def large_pages(fixtures, n_pages=50):
+    """returns the bodies (bytes) of the first page of the n lists of the fixtures with most items."""
+    api = StubApi(fixtures)
+    lists = sorted((path for path, (status, body) in fixtures.items() if status == 200 and "items" in body),
+                   key=lambda path: len(fixtures[path][1]["items"]), reverse=True)
+    return [json.dumps(api.page(path, {"items_per_page": ["100"]})[1]).encode() for path in lists[:n_pages]]
+
+
+def time_decoder(decode, pages, repeat):
+    """returns the mean seconds to decode all the pages once."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            decode(page)
+    return (time.perf_counter() - start) / repeat
+
+
+def allocations(decode, page):
+    """returns (peak bytes allocated, bytes still allocated by the decoded object) decoding one page."""
+    tracemalloc.start()
+    res = decode(page)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del res
+    return peak, retained
+
+
+def main(fixtures_path, repeat):
+    fixtures = load_fixtures(fixtures_path) if fixtures_path else synthesise(n_companies=200, officers=(50, 300),
+                                                                             appointments=(50, 300))
+    pages = large_pages(fixtures)
+    megabytes = sum(map(len, pages)) / 1024 ** 2
+
+    decoders = dict(DECODERS, **{"r.json()": lambda body: json.loads(body.decode("utf-8"))})
+    biggest = max(pages, key=len)
+
+    print(f"{len(pages)} pages, {megabytes:.2f} MB, largest page {len(biggest) / 1024:.0f} KB, repeat {repeat}")
+    print(f"{'decoder':<10} {'ms/MB':>8} {'peak KB/page':>14} {'retained KB/page':>18}")
+    for name, decode in decoders.items():
+        seconds = time_decoder(decode, pages, repeat)
+        peak, retained = allocations(decode, biggest)
+        print(f"{name:<10} {seconds / megabytes * 1000:>8.2f} {peak / 1024:>14.0f} {retained / 1024:>18.0f}")
+
+    if "orjson" not in DECODERS:
+        print("NB: orjson is not installed, pip install orjson to benchmark it.")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="decode_bench.py")
+    arg_parser.add_argument("--fixtures", default=None, help="fixtures file, synthesised if not given.")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    cli_args = arg_parser.parse_args()
+    main(fixtures_path=cli_args.fixtures, repeat=cli_args.repeat)
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+
+"""
+benchmark of the documents/s normalised by the compiled plans of utils/json_plan.py against the walk of
+Inserter.unpack() (with its engine replaced by one discarding the statements, so only the walk is timed).
+
+the documents are the synthetic companyprofile, psc, officer lists and appointment lists of stub/fixtures.py.
+
+run from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m benchmarks.plan_bench --companies 500 --repeat 5
+"""
+
+import argparse
+import time
+
+import utils.json_inserter as json_inserter
+from stub.fixtures import synthesise
+from utils.json_inserter import Inserter
+from utils.json_params import companyprofile_params, psc_params, officerlist_params, appointmentlist_params
+from utils.json_plan import plan_of
+
+
+class DiscardingEngine:
+    """stands in for the MyDb engine of utils/json_inserter.py: counts the statements instead of executing them."""
+
+    def __init__(self):
+        self.statements = 0
+
+    def execute(self, **kwargs):
+        self.statements += 1
+
+
+def make_documents(n_companies):
+    """(json, params, uid_value) of the documents of n synthetic companies, the errors left out."""
+    documents = []
+    for path, (status, body) in synthesise(n_companies=n_companies).items():
+        if status != 200:
+            continue
+        if path.endswith("/officers"):
+            documents.append((body, officerlist_params, path.split("/")[2]))
+        elif path.endswith("/appointments"):
+            documents.append((body, appointmentlist_params, path))
+        elif path.endswith("/persons-with-significant-control"):
+            documents.append((body, psc_params, path.split("/")[2]))
+        else:
+            documents.append((body, companyprofile_params, path.split("/")[2]))
+    return documents
+
+
+def unpack(documents):
+    for json, params, uid_value in documents:
+        Inserter(json=json, params=params).unpack(uid_value=uid_value)
+
+
+def walk_plan(documents):
+    out = {}
+    for json, params, uid_value in documents:
+        plan_of(params).rows(json, uid_value=uid_value, out=out)
+
+
+def time_walk(walk, documents, repeat):
+    """returns the documents normalised per second."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        walk(documents)
+    return len(documents) * repeat / (time.perf_counter() - start)
+
+
+def main(n_companies, repeat):
+    documents = make_documents(n_companies)
+
+    engine, json_inserter.engine = json_inserter.engine, DiscardingEngine()
+    try:
+        walks = {"Inserter.unpack": unpack, "Plan": walk_plan}
+        print(f"{len(documents):,} documents, repeat {repeat}")
+        print(f"{'walk':<16} {'docs/s':>10}")
+        for name, walk in walks.items():
+            print(f"{name:<16} {time_walk(walk, documents, repeat):>10,.0f}")
+    finally:
+        json_inserter.engine = engine
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="plan_bench.py")
+    arg_parser.add_argument("--companies", type=int, default=500)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    cli_args = arg_parser.parse_args()
+    main(n_companies=cli_args.companies, repeat=cli_args.repeat)
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+"""
+benchmark of the time taken to read a table into a pandas DataFrame with pd.read_sql_query (rows fetched as python
+tuples through the cursor) against MyDb.read_frame (COPY TO STDOUT parsed by pandas, see db/pg_engine.py).
+
+the ol_items table of a scratch schema (dropped and created again at the start) is filled with --rows synthetic officers
+by generate_series, 10 per company, then read by each path. Needs a running postgres.
+
+run from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m benchmarks.read_bench --rows 1000000 3000000
+"""
+
+import argparse
+import time
+
+import pandas as pd
+from psycopg2 import sql
+
+from db.pg_constants import DB_CONFIG_ABS_PATH, DB_CONFIG_SECTION
+from db.pg_engine import MyDb
+from db.pg_tables import officerlist_tables
+
+FILL = """
+INSERT INTO officerlist (company_number, active_count, items_per_page, kind, resigned_count, start_index, total_results)
+SELECT 'SY' || lpad(n::text, 6, '0'), 10, 35, 'officer-list', 0, '0', 10 FROM generate_series(0, %(companies)s - 1) n;
+
+INSERT INTO ol_items
+SELECT 'SY' || lpad((n / 10)::text, 6, '0'), n %% 10 + 1, date '2000-01-01' + n %% 7000, 'United Kingdom',
+       n %% 28 + 1, n %% 12 + 1, 1940 + n %% 60, '/officers/' || md5(n::text) || '/appointments',
+       '/company/SY' || lpad((n / 10)::text, 6, '0') || '/appointments/' || md5(n::text),
+       'SURNAME' || n || ', Forename', 'British', 'Director', 'director',
+       CASE WHEN n %% 3 = 0 THEN date '2010-01-01' + n %% 3000 END
+FROM generate_series(0, %(rows)s - 1) n;"""
+
+
+def timed(f):
+    """returns (result, seconds)."""
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+
+def main(sizes, schema):
+    admin = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION).connect()
+    with admin:
+        with admin.cursor() as curs:
+            curs.execute(sql.SQL("DROP SCHEMA IF EXISTS {schema} CASCADE").format(schema=sql.Identifier(schema)))
+    admin.close()
+
+    engine = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=schema)
+    engine.execute(mode="write", query=officerlist_tables)
+
+    print(f"schema {schema}, ol_items read into a DataFrame by each path.")
+    print(f"{'rows':>10} {'path':<18} {'seconds':>9} {'rows/s':>12}")
+    for rows in sorted(sizes):
+        with engine.transaction() as conn:
+            with conn.cursor() as curs:
+                curs.execute("TRUNCATE officerlist CASCADE")
+                curs.execute(FILL, {"rows": rows, "companies": -(-rows // 10)})
+                curs.execute("ANALYZE ol_items")
+
+        with engine.connection() as conn:
+            paths = {"read_sql_query": lambda: pd.read_sql_query("SELECT * FROM ol_items", conn),
+                     "MyDb.read_frame": lambda: engine.read_frame(table="ol_items", connection=conn)}
+            for name, path in paths.items():
+                frame, seconds = timed(path)
+                assert len(frame) == rows
+                print(f"{rows:>10,} {name:<18} {seconds:>9.2f} {rows / seconds:>12,.0f}")
+            conn.rollback()
+
+    engine.close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="read_bench.py")
+    arg_parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 3000000])
+    arg_parser.add_argument("--schema", default="read_bench", help="scratch schema, dropped and created again.")
+    cli_args = arg_parser.parse_args()
+    main(sizes=cli_args.rows, schema=cli_args.schema)
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+"""
+benchmark of the time taken to refresh records (DELETE of the root record cascading to the child tables, then INSERT
+of the new JSON) and to look them up, as the tables grow, before and after the migrations of db/pg_migrations.py.
+
+synthetic officer lists and appointment lists (stub/fixtures.py) are loaded with COPY into the ol_ and al_ tables of a
+scratch schema (dropped and created again at the start) until each size is reached. At each size:
+  * refresh: the same --refresh officer lists and appointment lists written again with a BatchWriter (one batch);
+  * lookup: the appointments of --refresh companies (al_items.appointed_to_company_number) and the officers of
+    --refresh appointment lists (ol_items.links_officer_appointments), one query each;
+timed without the lookup indexes of the migrations, then once migrate() created them (and indexed the foreign keys
+without an index, if any). Needs a running postgres.
+
+run from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m benchmarks.refresh_bench --sizes 1000 4000 16000 --refresh 200
+"""
+
+import argparse
+import re
+import time
+
+from psycopg2 import sql
+
+from db.pg_constants import DB_CONFIG_ABS_PATH, DB_CONFIG_SECTION
+from db.pg_engine import MyDb
+from db.pg_migrations import MIGRATIONS, migrate
+from db.pg_tables import officerlist_tables, appointmentlist_tables
+from stub.fixtures import synthesise, company_numbers
+from utils.json_inserter import BatchWriter
+from utils.json_params import officerlist_params, appointmentlist_params
+
+REPEAT = 3  # the best of REPEAT timings is kept.
+
+
+def make_documents(n_companies):
+    """{company_number: [(json, params, uid_value), ...]}: its officer list and the appointment list of an officer."""
+    documents = {}
+    company_number = None
+    for path, (status, body) in synthesise(n_companies=n_companies, officers=(5, 20), appointments=(5, 30)).items():
+        if status == 200 and path.endswith("/officers"):
+            company_number = path.split("/")[2]
+            documents.setdefault(company_number, []).append((body, officerlist_params, company_number))
+        elif status == 200 and path.endswith("/appointments"):
+            # the fixtures of a company are followed by the appointments of one of its officers.
+            documents.setdefault(company_number, []).append((body, appointmentlist_params, path))
+    return documents
+
+
+def write(engine, documents, batch, copy_threshold):
+    writer = BatchWriter(batch_size=batch, copy_threshold=copy_threshold, db=engine)
+    for document in documents:
+        writer.add(*document)
+    writer.flush()
+
+
+def best_of(f):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def lookups(engine, company_numbers_, appointments_links):
+    with engine.connection() as conn:
+        with conn.cursor() as curs:
+            for company_number in company_numbers_:
+                curs.execute("SELECT count(*) FROM al_items WHERE appointed_to_company_number = %s",
+                             (company_number,))
+            for link in appointments_links:
+                curs.execute("SELECT count(*) FROM ol_items WHERE links_officer_appointments = %s", (link,))
+            conn.rollback()
+
+
+def drop_lookup_indexes(engine):
+    """the scratch schema as before the migrations: without their indexes, the migrations not applied."""
+    with engine.transaction() as conn:
+        with conn.cursor() as curs:
+            for version, _, _, statements in MIGRATIONS:
+                indexes = re.findall(r"CREATE INDEX IF NOT EXISTS (\w+)", statements)
+                for index in indexes:
+                    curs.execute(sql.SQL("DROP INDEX IF EXISTS {index}").format(index=sql.Identifier(index)))
+                if indexes:
+                    curs.execute("DELETE FROM schema_migrations WHERE version = %s", (version,))
+
+
+def main(sizes, refresh, schema):
+    admin = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION).connect()
+    with admin:
+        with admin.cursor() as curs:
+            curs.execute(sql.SQL("DROP SCHEMA IF EXISTS {schema} CASCADE").format(schema=sql.Identifier(schema)))
+    admin.close()
+
+    engine = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=schema)
+    for create_stmts in (officerlist_tables, appointmentlist_tables):
+        engine.execute(mode="write", query=create_stmts)
+    migrate(engine)
+
+    documents = make_documents(max(sizes))
+    numbers = company_numbers(max(sizes))
+    refreshed = [document for number in numbers[:refresh] for document in documents.get(number, [])]
+    links = [body["items"][0]["links"]["officer"]["appointments"] for body, params, _ in refreshed
+             if params is officerlist_params]
+
+    print(f"schema {schema}, {refresh} officer lists and appointment lists refreshed and looked up at each size.")
+    print(f"{'companies':>10} {'ol_items':>10} {'al_items':>10} {'indexes':>8} {'refresh s':>10} {'lookups s':>10}")
+
+    loaded = 0
+    for size in sorted(sizes):
+        write(engine, [document for number in numbers[loaded:size] for document in documents.get(number, [])],
+              batch=1000, copy_threshold=0)
+        loaded = size
+        rows = [engine.execute(mode="read", query=f"SELECT count(*) FROM {table}")[0][0]
+                for table in ("ol_items", "al_items")]
+
+        for indexes in ("without", "with"):
+            if indexes == "without":
+                drop_lookup_indexes(engine)
+            else:
+                migrate(engine)
+            engine.execute(mode="write", query="ANALYZE")
+
+            refresh_time = best_of(lambda: write(engine, refreshed, batch=len(refreshed), copy_threshold=float("inf")))
+            lookup_time = best_of(lambda: lookups(engine, numbers[:refresh], links))
+            print(f"{size:>10,} {rows[0]:>10,} {rows[1]:>10,} {indexes:>8} {refresh_time:>10.3f} {lookup_time:>10.3f}")
+
+    engine.close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="refresh_bench.py")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 4000, 16000])
+    arg_parser.add_argument("--refresh", type=int, default=200)
+    arg_parser.add_argument("--schema", default="refresh_bench", help="scratch schema, dropped and created again.")
+    cli_args = arg_parser.parse_args()
+    main(sizes=cli_args.sizes, refresh=cli_args.refresh, schema=cli_args.schema)
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+"""
+benchmark of the latency saved per call by the pooled keep-alive session used in utils.api_functions.call_api.
+
+the stub server (stub/server.py) answering with a synthetic companyprofile is queried n times with a bare
+requests.get() (what call_api did before: new TCP connection for each call) and n times through the pooled session.
+
+run from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m benchmarks.session_bench --calls 500
+"""
+
+import argparse
+import threading
+import time
+
+import requests
+
+from stub.fixtures import synthesise
+from stub.server import make_server
+from utils.api_functions import make_session, TIMEOUT
+
+
+def time_calls(get, url, calls):
+    """returns the mean latency in milliseconds of calling get(url) n times."""
+    start = time.perf_counter()
+    for _ in range(calls):
+        get(url).json()
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def main(calls):
+    server = make_server(synthesise(n_companies=1), limit=10 * calls)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"{server.base_url}/company/SY000000"
+
+    session = make_session(api_key="benchmark")
+    bare = time_calls(lambda u: requests.get(u, auth=("benchmark", ""), timeout=TIMEOUT), url, calls)
+    pooled = time_calls(lambda u: session.get(u, timeout=TIMEOUT), url, calls)
+
+    server.shutdown()
+
+    print(f"calls per client: {calls}")
+    print(f"requests.get (new connection per call): {bare:.3f} ms/call")
+    print(f"pooled keep-alive session:               {pooled:.3f} ms/call")
+    print(f"latency saved per call:                  {bare - pooled:.3f} ms ({(1 - pooled / bare) * 100:.1f}%)")
+    print("NB: the stub is plain HTTP on loopback, over TLS to the real API the handshake saved is far larger.")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="session_bench.py")
+    arg_parser.add_argument("--calls", type=int, default=500)
+    main(calls=arg_parser.parse_args().calls)
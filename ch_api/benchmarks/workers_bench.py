@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+"""
+benchmark of the documents/s extracted and normalised by prog.py --workers N: the company numbers are sharded across
+N worker processes, each calling the stub server (stub/fixtures.py, stub/server.py) through its own KeyPool, all the
+pools sharing the budget of the key through one SharedTokenBucket (utils/rate_limiter.py).
+
+each worker extracts the companyprofile and the officer list of its companies with Getter and normalises them with the
+compiled plans of utils/json_plan.py, what prog.py does before the rows are written (no postgres needed here).
+
+with --budget the stub and the shared bucket allow that many calls per 10s window: the calls of all the workers
+together stay under it, the stub answers no 429.
+
+run from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m benchmarks.workers_bench --companies 200 --latency 0.02 --workers 1 2 4
+(venv) prompt$ python3 -m benchmarks.workers_bench --companies 200 --workers 1 4 --budget 200
+"""
+
+import argparse
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from stub.fixtures import synthesise, company_numbers
+from stub.server import make_server
+from utils.api_functions import configure_base_url, configure_keys
+from utils.json_getter import Getter
+from utils.json_params import companyprofile_params, officerlist_params
+from utils.json_plan import plan_of
+from utils.rate_limiter import SharedTokenBucket
+
+WINDOW = 10  # seconds of the rate limit window of the stub with --budget.
+
+
+def start_worker(base_url, budget, shared):
+    configure_base_url(base_url)
+    configure_keys(["benchmark"], calls=budget, shared=shared)
+
+
+def run_shard(url_ids):
+    """extracts and normalises the documents of a shard, returns the number of documents."""
+    documents = 0
+    for url_id in url_ids:
+        for params in (companyprofile_params, officerlist_params):
+            json, _, _ = Getter(json_params=params, url_id=url_id).extract()
+            if json is not None:
+                plan_of(params).rows(json, uid_value=url_id)
+                documents += 1
+    return documents
+
+
+def run(base_url, url_ids, workers, budget):
+    context = multiprocessing.get_context("spawn")
+    shared = SharedTokenBucket(calls=budget, period=WINDOW, context=context)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=start_worker,
+                             initargs=(base_url, budget, shared)) as executor:
+        executor.submit(time.sleep, 0).result()  # the workers are spawned before the clock starts.
+        start = time.perf_counter()
+        documents = sum(executor.map(run_shard, [url_ids[n::workers] for n in range(workers)]))
+        return documents, time.perf_counter() - start
+
+
+def main(companies, latency, workers, budget):
+    fixtures = synthesise(n_companies=companies, appointments=(0, 0))
+    # the stub allows the budget plus a margin: a 429 means the workers went over the shared budget.
+    limit = 10 ** 9 if budget is None else budget + 10
+    server = make_server(fixtures, latency=latency, limit=limit, window=WINDOW)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url_ids = company_numbers(companies)
+    print(f"companies: {companies}, latency of the stub: {latency * 1000:.0f} ms, "
+          f"budget: {'none' if budget is None else f'{budget} calls per {WINDOW}s'}")
+
+    for n in workers:
+        calls, too_many = server.api.stats["calls"], server.api.stats["429"]
+        documents, seconds = run(server.base_url, url_ids, n, budget or 10 ** 6)
+        print(f"{n} worker(s): {documents / seconds:,.0f} documents/s, "
+              f"{(server.api.stats['calls'] - calls) / seconds:,.1f} calls/s, "
+              f"{server.api.stats['429'] - too_many} calls answered 429")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(prog="workers_bench.py")
+    arg_parser.add_argument("--companies", type=int, default=200)
+    arg_parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response.")
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    arg_parser.add_argument("--budget", type=int, default=None, help="calls allowed per window to all the workers.")
+    cli_args = arg_parser.parse_args()
+    main(companies=cli_args.companies, latency=cli_args.latency, workers=cli_args.workers, budget=cli_args.budget)
@@ -14,3 +14,7 @@ DB_CONFIG_SECTION = "PostgreSQL"
 
 # name of the schema to be created/connected to.
 DB_SCHEMA = ""  # choose schema name
+
+# size of the pool of connections shared by all the MyDb instances connected to the same database and schema.
+DB_POOL_MIN = 1  # connections opened when the pool is created.
+DB_POOL_MAX = 10  # max connections open at the same time, callers wait for a connection beyond that.
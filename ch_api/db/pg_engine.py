@@ -1,10 +1,20 @@
 #!/usr/bin/python3
 
 from configparser import ConfigParser
+from contextlib import contextmanager, nullcontext
+import csv
+from decimal import Decimal
+import io
+import os
+import threading
+import pandas as pd
 import psycopg2
 from psycopg2 import sql
+from psycopg2.pool import ThreadedConnectionPool
 from functools import (partial, reduce,)
 
+from db.pg_constants import DB_POOL_MIN, DB_POOL_MAX
+
 
 # supporting stuff
 
@@ -48,16 +58,242 @@ def fields_has_been_wrongly_passed(args):
             return True
 
 
-class MyDb:
-    """database object to connect and execute row sql queries."""
+def copy_rows(curs, table, columns, rows):
+    """func to stream rows (tuples of the values of the columns) to a table with COPY FROM STDIN², None is NULL."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(rows)  # None is written as an unquoted empty field: NULL.
+    buffer.seek(0)
+
+    curs.copy_expert(sql.SQL("COPY {table} ({fields}) FROM STDIN WITH (FORMAT csv)").format(
+        table=sql.Identifier(table),
+        fields=sql.SQL(', ').join(map(sql.Identifier, columns))), buffer)
+
+
+# pandas dtypes of the postgres types (the OIDs of pg_type³ in the description of a cursor), read by MyDb.read_frame.
+# The integers are nullable, the types not listed (VARCHAR, arrays, JSON...) are read as strings.
+PANDAS_DTYPES = {
+    16: "boolean" if hasattr(pd, "BooleanDtype") else object,  # bool, nullable since pandas 1.0.
+    21: "Int16",  # int2
+    23: "Int32",  # int4
+    20: "Int64",  # int8
+    700: "float32",  # float4
+    701: "float64"}  # float8
+DATETIME_TYPES = {1082, 1114, 1184}  # date, timestamp, timestamptz: parsed into datetime64 columns.
+DECIMAL_TYPES = {1700}  # numeric: read as Decimal objects, exact, where a float64 would round them.
+NULL = "\\N"  # NULL of the CSV of COPY TO STDOUT, where the empty field is the empty string.
+
+
+def decimal_or_null(value):
+    """func to convert a numeric field of the CSV of COPY TO STDOUT, NULL included."""
+    return None if value == NULL else Decimal(value)
+
+
+def frame_from_csv(buffer, description):
+    """
+    func to parse the CSV written by COPY TO STDOUT WITH (FORMAT csv, NULL '\\N') into a DataFrame, with the dtypes of
+    the columns of the description of the query: NULL is \\N and the empty field ("" for COPY) the empty string, the
+    strings like "NA" (Namibia) stay strings.
+    """
+    columns = [column[0] for column in description]
+    return pd.read_csv(buffer, header=None, names=columns,
+                       dtype={column[0]: PANDAS_DTYPES.get(column[1], str) for column in description
+                              if column[1] not in DATETIME_TYPES | DECIMAL_TYPES},
+                       converters={column[0]: decimal_or_null for column in description if column[1] in DECIMAL_TYPES},
+                       parse_dates=[column[0] for column in description if column[1] in DATETIME_TYPES],
+                       true_values=["t"], false_values=["f"], keep_default_na=False, na_values=[NULL])
+
+
+def merge_query(table, columns, source, p_key=None):
+    """
+    INSERT INTO table SELECT FROM source (a query or a table), the rows in conflict are updated on p_key if passed,
+    skipped otherwise.
+    """
+    fields = sql.SQL(', ').join(map(sql.Identifier, columns))
+    if p_key is None or set(columns) <= set(p_key):  # nothing to update.
+        return sql.SQL("INSERT INTO {table} ({fields}) SELECT {fields} FROM {source} ON CONFLICT DO NOTHING").format(
+            table=sql.Identifier(table), fields=fields, source=source)
+
+    # a row can be updated once per statement: the last row staged for a p_key wins.
+    return sql.SQL("INSERT INTO {table} ({fields}) "
+                   "SELECT DISTINCT ON ({p_key}) {fields} FROM {source} ORDER BY {p_key}, ctid DESC "
+                   "ON CONFLICT ({p_key}) DO UPDATE SET {updates}").format(
+        table=sql.Identifier(table),
+        fields=fields,
+        source=source,
+        p_key=sql.SQL(', ').join(map(sql.Identifier, p_key)),
+        updates=sql.SQL(', ').join(sql.SQL("{field} = EXCLUDED.{field}").format(field=sql.Identifier(column))
+                                   for column in columns if column not in p_key))
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool¹ making the callers wait for a connection to be returned instead of raising PoolError."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self._slots.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
 
-    def __init__(self, db_config_file, db_section_name, schema=None):
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+class MyDb:
+    """
+    database object to connect and execute row sql queries.
+
+    the connections are borrowed from a pool shared by all the MyDb instances with the same config file, section and
+    schema (e.g. the engine of prog.py and the one of utils/json_inserter.py), created at the first query. Every
+    pooled connection is opened with the search_path set to the schema, which is created once when the pool is.
+
+    usage:
+    >>> engine = MyDb(db_config_file="database.ini", db_section_name="PostgreSQL", schema="test")
+    ... engine.execute(mode="write", query=...)  # borrows a connection, commits and returns it to the pool.
+    ... with engine.transaction() as conn:  # borrows one connection for a unit of work committed at the end.
+    ...     engine.execute(mode="write", query=..., connection=conn)
+    ...     engine.execute(mode="write", query=..., connection=conn)
+    """
+
+    _pools = {}  # (db_config_file, db_section_name, schema, pid): BlockingConnectionPool.
+    _pools_lock = threading.Lock()
+    _failures = threading.local()  # count of the statements failed in each thread, see failed_statements().
+
+    def __init__(self, db_config_file, db_section_name, schema=None, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX):
         self.db_config_file = db_config_file
         self.db_section_name = db_section_name
         self.params = read_config(filename=db_config_file, section=db_section_name)
         self.schema = schema  # default execution will be on public schema when schema is None.
+        self.minconn = minconn
+        self.maxconn = maxconn
+
+    @property
+    def pool(self):
+        """the pool of connections of this database and schema, one per process as connections cannot be forked."""
+        key = (self.db_config_file, self.db_section_name, self.schema, os.getpid())
+
+        with MyDb._pools_lock:
+            if key not in MyDb._pools:
+                pool = BlockingConnectionPool(self.minconn, self.maxconn, **self.pool_params())
+                if self.schema is not None:
+                    self.create_schema(pool)
+                MyDb._pools[key] = pool
+
+            return MyDb._pools[key]
+
+    def pool_params(self):
+        """connection parameters of the pool: the search_path is set when connecting, without a query per connection."""
+        params = dict(self.params)
+        if self.schema is not None:
+            schema = '"' + self.schema.replace('"', '""').replace(" ", "\\ ") + '"'
+            params["options"] = (params.get("options", "") + f" -c search_path={schema},public").strip()
+        return params
+
+    def create_schema(self, pool):
+        conn = pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {schema}").format(
+                        schema=sql.Identifier(self.schema)))
+        finally:
+            pool.putconn(conn)
+
+    @contextmanager
+    def connection(self):
+        """context manager borrowing a connection from the pool, returned (rolled back if left open) at the end."""
+        pool = self.pool
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            pool.putconn(conn)
+
+    @contextmanager
+    def transaction(self):
+        """context manager borrowing a connection for a unit of work: commit() at the end, rollback() if error."""
+        with self.connection() as conn:
+            with conn:
+                yield conn
+
+    def close(self):
+        """closes all the connections of the pool of this engine (in this process)."""
+        key = (self.db_config_file, self.db_section_name, self.schema, os.getpid())
+        with MyDb._pools_lock:
+            pool = MyDb._pools.pop(key, None)
+        if pool is not None:
+            pool.closeall()
+
+    def copy_merge(self, table, columns, rows, p_key=None, connection=None):
+        """
+        loads many rows (tuples of the values of the columns) in a table of pg_tables through a staging table: the rows
+        are streamed with COPY FROM STDIN² into a temporary table of the session, then merged in the table with one
+        set-based INSERT ... ON CONFLICT (see merge_query). Much faster than INSERT statements for large batches.
+
+        the staging table "stage_{table}" is created once per pooled connection and emptied after each merge. It has
+        the DEFAULTs of the table: the columns missing from the rows (e.g. the forenames of a former name, in its
+        primary key) get them as they would with INSERT. With a connection passed, the merge is part of the unit of
+        work of the caller. Returns the number of rows merged.
+
+        usage:
+        >>> with engine.transaction() as conn:
+        ...     engine.execute(mode="write", query="DELETE FROM {table} WHERE ...", ..., connection=conn)
+        ...     engine.copy_merge("ol_items", ["company_number", "officer_serial_id", ...], rows, connection=conn)
+        """
+        stage = "stage_" + table
+
+        with (self.transaction() if connection is None else nullcontext(connection)) as conn:
+            with conn.cursor() as curs:
+                curs.execute(sql.SQL("CREATE TEMPORARY TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS)")
+                             .format(stage=sql.Identifier(stage), table=sql.Identifier(table)))
+                copy_rows(curs, stage, columns, rows)
+                curs.execute(merge_query(table, columns, sql.Identifier(stage), p_key=p_key))
+                merged = curs.rowcount
+                curs.execute(sql.SQL("TRUNCATE {stage}").format(stage=sql.Identifier(stage)))
+
+        return merged
+
+    def read_frame(self, table=None, query=None, args=None, connection=None):
+        """
+        reads a table, or the rows of a query, into a pandas DataFrame through COPY (...) TO STDOUT²: the rows are
+        streamed by the server as one CSV into a buffer and parsed by pandas in C, instead of being fetched as python
+        tuples as by pd.read_sql_query. The dtypes come from the types of the columns (see PANDAS_DTYPES).
+
+        usage:
+        >>> engine.read_frame(table="ol_items")
+        ... engine.read_frame(query="SELECT * FROM ol_items WHERE company_number = %s", args=("OC399321",))
+        """
+        if (table is None) == (query is None):
+            raise ValueError("pass either \"table\" or \"query\".")
+        if table is not None:
+            query = sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table))
+
+        with (self.connection() if connection is None else nullcontext(connection)) as conn:
+            with conn.cursor() as curs:
+                query = curs.mogrify(query, args)  # COPY takes no parameters: they are bound here.
+                curs.execute(b"SELECT * FROM (" + query + b") AS q LIMIT 0")
+                description = curs.description  # the names and the types (OIDs) of the columns.
+
+                buffer = io.BytesIO()
+                curs.copy_expert(b"COPY (" + query + b") TO STDOUT WITH (FORMAT csv, NULL '" + NULL.encode() + b"')",
+                                 buffer)
+                buffer.seek(0)
+
+        return frame_from_csv(buffer, description)
 
     def connect(self):
+        """returns a new connection outside of the pool, to be closed by the caller."""
 
         try:
             connection = psycopg2.connect(**self.params)
@@ -87,11 +323,13 @@ class MyDb:
                 fields=None,
                 data=None,
                 drop_keys=None,
+                connection=None,
                 **kw_options):
 
         # check kw arguments are ok.
 
         kwargs = locals()
+        kwargs.pop("connection")
 
         if mode not in ["read", "write", "write + read"]:
             raise SyntaxError("\"mode\" must be: \"read\", \"write\" or \"write + read\".")
@@ -113,10 +351,12 @@ class MyDb:
                                  "If you want to drop some k:v pairs from the insertion, use the \"drop_keys\" "
                                  "kw argument")
 
+        conn = None
         try:
-            conn = self.connect()
+            # a connection passed by the caller is part of its unit of work, committed by the caller (transaction()).
+            conn = self.pool.getconn() if connection is None else connection
 
-            with conn:  # context manager will commit() automatically or rollback() if error.
+            with (conn if connection is None else nullcontext()):  # commit() automatically or rollback() if error.
 
                 with conn.cursor() as curs:
 
@@ -156,12 +396,23 @@ class MyDb:
                         return curs.fetchall()
 
         except (Exception, psycopg2.DatabaseError) as error:
+            if connection is not None:
+                raise  # the unit of work of the caller has to be rolled back.
+            MyDb._failures.count = MyDb.failed_statements() + 1
             print(error)
 
         finally:
-            # in case something when wrong in closing the connection in the try block.
-            if conn is not None:
-                conn.close()
+            # the connection goes back to the pool, open.
+            if connection is None and conn is not None:
+                self.pool.putconn(conn)
+
+    @staticmethod
+    def failed_statements() -> int:
+        """
+        number of the statements which failed in the calling thread since it started, their errors printed and
+        swallowed by execute() (no connection passed): compare it before and after a unit of work to tell if it failed.
+        """
+        return getattr(MyDb._failures, "count", 0)
 
     @staticmethod
     def reduce_fns_on_dict(fns, dic):
@@ -206,3 +457,7 @@ class MyDb:
 
         return dic
 
+
+# ¹ https://www.psycopg.org/docs/pool.html
+# ² https://www.postgresql.org/docs/12/sql-copy.html
+# ³ https://www.postgresql.org/docs/12/catalog-pg-type.html
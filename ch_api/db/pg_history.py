@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+
+"""
+append-only history (slowly changing dimension, type 2) of the companies, officers, PSCs and appointments, with
+their addresses, identifications, names and natures of control: every version of a row of the HISTORY_TABLES is kept
+in its {table}_history table with the period it was valid for, valid_from up to valid_to (NULL for the current
+version), so that the register can be queried as it was at a date, e.g. who controlled a company and how.
+
+the history tables are created by the migrations of db/pg_migrations.py (same columns as their table, content_hash
+included, plus the period) and written by DiffWriter in prog.py --history: a version is closed (its valid_to set) and
+the new one appended when the content hash of a row changes, the rows gone from the JSON are closed, and so are all
+the current versions of a record gone from the register (CLOSING_ERRORS, or a list with no item left). The versions
+are never deleted nor rewritten, the runs without --history do not write the history.
+
+each history table is indexed on:
+  * (root key, valid_from): the versions of a company (or appointment list), e.g. its PSCs at a date;
+  * the root key of the current versions (partial index): the versions DiffWriter compares with the JSON;
+  * the period, tsrange(valid_from, valid_to) with GiST: the whole register at a date.
+
+usage:
+>>> from db.pg_history import as_of, history_of
+... as_of(engine, "psc_items", "2020-01-31", root_value="OC399321")  # the PSCs of OC399321 on 31 Jan 2020.
+[{'company_number': 'OC399321', 'psc_serial_id': 1, ..., 'valid_from': datetime(...), 'valid_to': None}, ...]
+... as_of(engine, "psc_items_natures_of_control", "2020-01-31", root_value="OC399321")  # and their control.
+[{'company_number': 'OC399321', 'psc_serial_id': 1, 'natures_of_control': 'ownership-of-shares-75-to-100-percent', ...
+... history_of(engine, "companyprofile", "OC399321")  # every version of the company, oldest first.
+"""
+
+from psycopg2 import sql
+
+HISTORY_SUFFIX = "_history"
+
+# {table: root key}: the tables with a history, the column of their root record (see DiffWriter).
+HISTORY_TABLES = {
+    "companyprofile": "company_number",
+    "ol_items": "company_number",
+    "ol_items_address": "company_number",
+    "ol_items_identification": "company_number",
+    "ol_items_former_names": "company_number",
+    "psc_items": "company_number",
+    "psc_items_address": "company_number",
+    "psc_items_identification": "company_number",
+    "psc_items_name_elements": "company_number",
+    "psc_items_natures_of_control": "company_number",
+    "al_items": "appointmentlist_url_id",
+    "al_items_address": "appointmentlist_url_id",
+    "al_items_identification": "appointmentlist_url_id",
+    "al_items_name_elements": "appointmentlist_url_id",
+    "al_items_former_names": "appointmentlist_url_id"}
+
+# errors of a record gone from the register (see error_of() in utils/api_functions.py): its versions are closed.
+CLOSING_ERRORS = ("not found", "http error 410")
+
+
+def history_table(table: str) -> str:
+    """CREATE statements of the history table of a table, and its indexes (a migration of db/pg_migrations.py)."""
+    history = table + HISTORY_SUFFIX
+    root_key = HISTORY_TABLES[table]
+    return f"""
+CREATE TABLE IF NOT EXISTS {history} (LIKE {table});
+ALTER TABLE {history} ADD COLUMN IF NOT EXISTS valid_from TIMESTAMP NOT NULL DEFAULT now();
+ALTER TABLE {history} ADD COLUMN IF NOT EXISTS valid_to TIMESTAMP;
+CREATE INDEX IF NOT EXISTS {history}_key_idx ON {history} ({root_key}, valid_from);
+CREATE INDEX IF NOT EXISTS {history}_current_idx ON {history} ({root_key}) WHERE valid_to IS NULL;
+CREATE INDEX IF NOT EXISTS {history}_period_idx ON {history} USING gist (tsrange(valid_from, valid_to));"""
+
+
+def as_of_query(table: str, root_value: bool = False) -> sql.Composed:
+    """SELECT of the versions of a table valid at a timestamp (the 1st parameter), of a root record if root_value."""
+    query = sql.SQL("SELECT * FROM {history} WHERE tsrange(valid_from, valid_to) @> %s::timestamp").format(
+        history=sql.Identifier(table + HISTORY_SUFFIX))
+    if root_value:
+        query += sql.SQL(" AND {root_key} = %s").format(root_key=sql.Identifier(HISTORY_TABLES[table]))
+    return query
+
+
+def fetch_dicts(engine, query, args) -> list:
+    with engine.connection() as conn:
+        with conn.cursor() as curs:
+            curs.execute(query, args)
+            columns = [column.name for column in curs.description]
+            return [dict(zip(columns, row)) for row in curs.fetchall()]
+
+
+def as_of(engine, table: str, when, root_value=None) -> list:
+    """
+    func to read the rows of a table as they were at a date (or timestamp): [{column: value, ...}, ...].
+    :param engine: MyDb instance.
+    :param table: one of HISTORY_TABLES.
+    :param when: date, datetime or their ISO string.
+    :param root_value: company_number (appointmentlist_url_id for al_items) to read the rows of one record only.
+    """
+    if root_value is None:
+        return fetch_dicts(engine, as_of_query(table), (when,))
+    return fetch_dicts(engine, as_of_query(table, root_value=True), (when, root_value))
+
+
+def history_of(engine, table: str, root_value) -> list:
+    """func to read all the versions of the rows of a root record, in the order they were valid from."""
+    query = sql.SQL("SELECT * FROM {history} WHERE {root_key} = %s ORDER BY valid_from").format(
+        history=sql.Identifier(table + HISTORY_SUFFIX), root_key=sql.Identifier(HISTORY_TABLES[table]))
+    return fetch_dicts(engine, query, (root_value,))
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+"""
+versioned migrations of the schema. The tables of db/pg_tables.py are created as they are (CREATE TABLE IF NOT EXISTS)
+by prog.py, then migrate() applies the MIGRATIONS not applied yet and records their version in the schema_migrations
+table, so that the changes made to the tables after they were first created (e.g. indexes) reach the existing
+databases once.
+
+a migration waits until the tables it changes exist: e.g. the indexes of the ol_ tables are created by the first run
+with --ol, even if the database was created with --psc only.
+
+the foreign keys are indexed as well: the ON DELETE CASCADE of the refresh of a root record (Inserter.unpack() and
+BatchWriter delete it before writing the new JSON) looks up the rows of each child table by its foreign key, a full
+scan of the table without an index on the columns of the key. Each foreign key of the schema whose columns do not lead
+an index gets one. The foreign keys of pg_tables.py lead the primary keys of their tables, so they are indexed already:
+this covers the keys of the tables added to the schema by hand or by the next versions.
+
+usage:
+>>> from db.pg_migrations import migrate
+... migrate(engine)  # after the CREATE TABLE statements of pg_tables.py.
+[3, 4]
+"""
+
+from psycopg2 import sql
+
+from db.pg_history import history_table
+from db.pg_tables import serial_ids_migration, journal_table
+
+migrations_table = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+version INTEGER PRIMARY KEY,
+description VARCHAR NOT NULL,
+applied_at TIMESTAMP NOT NULL DEFAULT now());"""
+
+# (version, description, tables needed, statements). Append only: a migration applied is never edited, change the
+# schema with a new one. The migrations are additive: the data of the tables is kept.
+MIGRATIONS = [
+    (1, "number the array elements with their ordinals instead of SERIAL columns", [], serial_ids_migration),
+
+    (2, "journal of the runs read by --resume", [], journal_table),
+
+    (3, "lookup indexes of the companyprofile tables", ["companyprofile"], """
+CREATE INDEX IF NOT EXISTS companyprofile_company_name_idx ON companyprofile (company_name);"""),
+
+    (4, "lookup indexes of the officerlist tables", ["ol_items"], """
+CREATE INDEX IF NOT EXISTS ol_items_links_officer_appointments_idx ON ol_items (links_officer_appointments);
+CREATE INDEX IF NOT EXISTS ol_items_name_idx ON ol_items (name);"""),
+
+    (5, "lookup indexes of the psc tables", ["psc_items"], """
+CREATE INDEX IF NOT EXISTS psc_items_name_idx ON psc_items (name);"""),
+
+    (6, "lookup indexes of the appointmentlist tables", ["al_items"], """
+CREATE INDEX IF NOT EXISTS al_items_appointed_to_company_number_idx ON al_items (appointed_to_company_number);
+CREATE INDEX IF NOT EXISTS al_items_name_idx ON al_items (name);"""),
+
+    (7, "content hashes of the rows of the companyprofile tables, read by --diff", ["companyprofile"], """
+ALTER TABLE companyprofile ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_links ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_registered_office_address ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_accounts ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_annual_return ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_foreign_company_details ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_branch_company_details ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_confirmation_statement ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_previous_company_names ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE cp_sic_codes ADD COLUMN IF NOT EXISTS content_hash BIGINT;"""),
+
+    (8, "content hashes of the rows of the psc tables, read by --diff", ["psc"], """
+ALTER TABLE psc ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE psc_items ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE psc_items_address ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE psc_items_identification ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE psc_items_name_elements ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE psc_items_natures_of_control ADD COLUMN IF NOT EXISTS content_hash BIGINT;"""),
+
+    (9, "content hashes of the rows of the officerlist tables, read by --diff", ["officerlist"], """
+ALTER TABLE officerlist ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE ol_items ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE ol_items_address ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE ol_items_identification ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE ol_items_former_names ADD COLUMN IF NOT EXISTS content_hash BIGINT;"""),
+
+    (10, "content hashes of the rows of the appointmentlist tables, read by --diff", ["appointmentlist"], """
+ALTER TABLE appointmentlist ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE al_items ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE al_items_address ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE al_items_identification ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE al_items_name_elements ADD COLUMN IF NOT EXISTS content_hash BIGINT;
+ALTER TABLE al_items_former_names ADD COLUMN IF NOT EXISTS content_hash BIGINT;"""),
+
+    # after the content hashes: the history tables have the content_hash column of their table.
+    (11, "history of the companyprofile table, written by --history", ["companyprofile"],
+     history_table("companyprofile")),
+
+    (12, "history of the ol_items table, written by --history", ["ol_items"], history_table("ol_items")),
+
+    (13, "history of the psc_items table, written by --history", ["psc_items"], history_table("psc_items")),
+
+    (14, "history of the al_items table, written by --history", ["al_items"], history_table("al_items")),
+
+    (15, "history of the child tables of ol_items, written by --history", ["ol_items"],
+     history_table("ol_items_address") + history_table("ol_items_identification")
+     + history_table("ol_items_former_names")),
+
+    (16, "history of the child tables of psc_items, written by --history", ["psc_items"],
+     history_table("psc_items_address") + history_table("psc_items_identification")
+     + history_table("psc_items_name_elements") + history_table("psc_items_natures_of_control")),
+
+    (17, "history of the child tables of al_items, written by --history", ["al_items"],
+     history_table("al_items_address") + history_table("al_items_identification")
+     + history_table("al_items_name_elements") + history_table("al_items_former_names")),
+    ]
+
+# foreign keys (constraint, table, columns) of the current schema whose columns are not the leading columns of an index.
+UNINDEXED_FOREIGN_KEYS = """
+SELECT c.conname, r.relname::text, array_agg(a.attname::text ORDER BY k.n)
+FROM pg_constraint c
+JOIN pg_class r ON r.oid = c.conrelid
+CROSS JOIN LATERAL unnest(c.conkey) WITH ORDINALITY AS k(attnum, n)
+JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+WHERE c.contype = 'f'
+AND c.connamespace = current_schema()::regnamespace
+AND NOT EXISTS (SELECT 1 FROM pg_index i
+                WHERE i.indrelid = c.conrelid
+                AND (string_to_array(i.indkey::text, ' ')::int2[])[1:cardinality(c.conkey)] @> c.conkey
+                AND (string_to_array(i.indkey::text, ' ')::int2[])[1:cardinality(c.conkey)] <@ c.conkey)
+GROUP BY c.conname, r.relname
+ORDER BY 2, 1"""
+
+
+def pending_migrations(applied: set, tables: set, migrations: list = None) -> list:
+    """func to select the migrations to apply: not applied yet, with all the tables they need, in version order."""
+    migrations = MIGRATIONS if migrations is None else migrations
+    return [migration for migration in sorted(migrations)
+            if migration[0] not in applied and set(migration[2]) <= tables]
+
+
+def unindexed_foreign_keys(curs) -> list:
+    """func to list the foreign keys of the schema without an index: [(constraint, table, [column, ...]), ...]."""
+    curs.execute(UNINDEXED_FOREIGN_KEYS)
+    return curs.fetchall()
+
+
+def index_foreign_keys(curs) -> list:
+    """func to index the foreign keys without an index, returns the names of the indexes created."""
+    created = []
+    for constraint, table, columns in unindexed_foreign_keys(curs):
+        index = constraint[:59] + "_idx"  # identifiers are 63 characters at most.
+        curs.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})").format(
+            index=sql.Identifier(index),
+            table=sql.Identifier(table),
+            columns=sql.SQL(", ").join(map(sql.Identifier, columns))))
+        created.append(index)
+    return created
+
+
+def migrate(engine) -> list:
+    """
+    func to apply the pending migrations and to index the foreign keys of the schema of the engine, in one transaction.
+    the schema_migrations table is locked meanwhile: concurrent runs apply each migration once.
+    :return: the versions applied.
+    """
+    with engine.transaction() as conn:
+        with conn.cursor() as curs:
+            curs.execute(migrations_table)
+            curs.execute("LOCK TABLE schema_migrations IN SHARE ROW EXCLUSIVE MODE")
+
+            curs.execute("SELECT version FROM schema_migrations")
+            applied = {version for version, in curs.fetchall()}
+            curs.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()")
+            tables = {table for table, in curs.fetchall()}
+
+            versions = []
+            for version, description, _, statements in pending_migrations(applied, tables):
+                curs.execute(statements)
+                curs.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                             (version, description))
+                print(f"schema migration {version} applied: {description}.")
+                versions.append(version)
+
+            for index in index_foreign_keys(curs):
+                print(f"foreign key indexed: {index}.")
+
+    return versions
@@ -160,7 +160,7 @@ total_results INTEGER);
 
 CREATE TABLE IF NOT EXISTS psc_items(
 company_number VARCHAR (8) NOT NULL REFERENCES psc(company_number) ON DELETE CASCADE ON UPDATE CASCADE, 
-psc_serial_id SERIAL,
+psc_serial_id INTEGER, -- position of the psc in the JSON (1, 2, ...), see Inserter.unpack().
 PRIMARY KEY (company_number, psc_serial_id),
 ceased_on DATE,
 country_of_residence VARCHAR,
@@ -263,7 +263,7 @@ total_results INTEGER NOT NULL);
 CREATE TABLE IF NOT EXISTS ol_items (
 company_number VARCHAR REFERENCES  officerlist(company_number) 
 ON DELETE CASCADE ON UPDATE CASCADE, 
-officer_serial_id SERIAL, -- officers don't have a UID in CH db.
+officer_serial_id INTEGER, -- officers don't have a UID in CH db: position in the JSON (1, 2, ...).
 PRIMARY KEY (company_number, officer_serial_id), -- 1 company_number : 1+ officer
 appointed_on DATE,
 country_of_residence VARCHAR,
@@ -344,7 +344,7 @@ total_results INTEGER NOT NULL);
 
 CREATE TABLE IF NOT EXISTS al_items(
 appointmentlist_url_id VARCHAR NOT NULL,
-appointment_serial_id SERIAL, -- appointments don't have a UID in CH db.
+appointment_serial_id INTEGER, -- appointments don't have a UID in CH db: position in the JSON (1, 2, ...).
 FOREIGN KEY (appointmentlist_url_id) REFERENCES appointmentlist(appointmentlist_url_id) 
 ON DELETE CASCADE ON UPDATE CASCADE,
 PRIMARY KEY (appointmentlist_url_id, appointment_serial_id), -- 1 officer appointment JSON : 1+ appointments
@@ -417,3 +417,24 @@ FOREIGN KEY (appointmentlist_url_id, appointment_serial_id)
 REFERENCES al_items(appointmentlist_url_id, appointment_serial_id) ON DELETE CASCADE ON UPDATE CASCADE,
 forenames VARCHAR DEFAULT 'not provided',  -- need DEFAULT as col used in composite pkey, cannot be NULL.
 surname VARCHAR DEFAULT 'not provided'); -- need DEFAULT as col used in composite pkey, cannot be NULL."""
+
+# the *_serial_id of the tables created before they were numbered by the programme were SERIAL columns: their sequence
+# is dropped, the existing values are kept (they are replaced by ordinals when the JSON is inserted again).
+serial_ids_migration = """
+ALTER TABLE IF EXISTS psc_items ALTER COLUMN psc_serial_id DROP DEFAULT;
+DROP SEQUENCE IF EXISTS psc_items_psc_serial_id_seq;
+
+ALTER TABLE IF EXISTS ol_items ALTER COLUMN officer_serial_id DROP DEFAULT;
+DROP SEQUENCE IF EXISTS ol_items_officer_serial_id_seq;
+
+ALTER TABLE IF EXISTS al_items ALTER COLUMN appointment_serial_id DROP DEFAULT;
+DROP SEQUENCE IF EXISTS al_items_appointment_serial_id_seq;"""
+
+
+# progress of the runs: the (resource, url_id) pairs written to the database, read by prog.py --resume.
+journal_table = """
+CREATE TABLE IF NOT EXISTS run_journal (
+resource VARCHAR NOT NULL,
+url_id VARCHAR NOT NULL,
+recorded_at TIMESTAMP NOT NULL DEFAULT now(),
+PRIMARY KEY (resource, url_id));"""
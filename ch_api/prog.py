@@ -1,19 +1,36 @@
 #!/usr/bin/python3
 
-import pandas as pd
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 
 from db.pg_constants import DB_CONFIG_SECTION, DB_CONFIG_ABS_PATH, DB_SCHEMA
 from db.pg_engine import MyDb
 from db.pg_tables import companyprofile_tables, psc_tables
 from db.pg_tables import officerlist_tables, appointmentlist_tables
+from db.pg_migrations import migrate
+from utils.api_functions import configure_base_url, configure_session, enable_cache, POOL_SIZE, COALESCER
+from utils.api_functions import configure_keys, KEYS, CALLS, FIVE_MINUTES
+from utils.api_functions import configure_retries, PATIENT_RETRIES, PERMANENT_ERRORS
+from utils.rate_limiter import SharedTokenBucket
+from utils.fetch_engine import AsyncFetcher
 from utils.json_getter import Getter
-from utils.json_inserter import Inserter
+from utils.json_inserter import RowWriter, BatchWriter, DiffWriter, COPY_THRESHOLD, BATCH_SIZE
+from utils.journal import Journal
+from utils.pipeline import Pipeline
+from utils.bulk_ingest import BulkLoader
+from utils.excel_export import export_tables
+from utils import api_functions
+from utils import parquet_export
 from utils.json_params import psc_params, companyprofile_params
 from utils.json_params import officerlist_params, appointmentlist_params
 from utils.cli import parser
-from utils.cli import file_is_csv_or_txt, optional_flags_collide, data_wont_fit_excel
+from utils.cli import file_is_csv_or_txt, optional_flags_collide, bulk_flags_are_wrong
 from utils.cli import file_contains_company_codes, url_ids_examples
-from utils.helpers import read_file_with_url_ids
+from utils.helpers import read_file_with_url_ids, dedupe_url_ids
+from utils.snapshots import read_basic_company_data, read_psc_snapshot
 
 
 # cli arguments constants
@@ -51,8 +68,6 @@ ARGS_PARAMS = {'al' : {"params"      : appointmentlist_params,
                                         "cp_sic_codes",
                                         "cp_previous_company_names"]}}
 
-SELECT_ALL = "select * from {};"
-
 
 # supporting functions for main()
 def make_url_list(args):
@@ -66,9 +81,14 @@ def make_url_list(args):
     else:
         url_ids = read_file_with_url_ids(path=args.file)
 
-    if data_wont_fit_excel(args, url_ids):
-        raise ValueError("You won't be able to dump more than 1,048,576 rows in an excel file. \n"
-                         "Please reduce the number of url_ids to be queried in the csv file containing them.")
+    # analysts' lists often repeat the same url_id: each one is extracted and inserted once.
+    unique_url_ids = dedupe_url_ids(url_ids)
+    if len(unique_url_ids) < len(url_ids):
+        repeated = len(url_ids) - len(unique_url_ids)
+        flags = sum(vars(args)[flag] for flag in ("psc", "ol", "cp", "al")) or 1
+        print(f"{repeated} repeated url_ids dropped: {repeated * flags} extractions skipped, saving at least as many "
+              f"API calls.")
+        url_ids = unique_url_ids
 
     return url_ids
 
@@ -101,50 +121,272 @@ def run_flags_check(args, url_ids):
     return None
 
 
-def dump_to_excel(args, args_params, query, conn):
+def dump_to_excel(args, args_params, conn):
     """
-    iteratively apply SELECT * FROM {table} and creates Excel files, one table per Excel sheet.
+    streams the tables of each flag to an Excel file, one table per sheet (a table too long for one sheet goes on in
+    the next sheets), in constant memory: see utils/excel_export.py.
     """
 
     if args.excel is True:
+        for flag, dict_ in args_params.items():
+            if vars(args)[flag]:
+                path = DB_SCHEMA + '_' + flag + '.xlsx'
+                rows = export_tables(conn, dict_["all_tables"], path)
+                print(f"{path}: {sum(rows.values()):,} rows of {len(rows)} tables written.")
+        return
 
-        # build list of dictionaries {json flag: list of table names}.
-        # all_tables_dicts = [{"cp" : ["companyprofile", "cp_sic_codes", ...]},
-        #                     {"ol" : ["ol_items", "ol_items_address", ...]}, ...]
-        all_tables_dicts = [{key: dict_["all_tables"]} for key, dict_ in args_params.items() if vars(args)[key]]
 
-        # What we are building to do with comprehension => df_name.to_excel(writer, sheet_name='some_table_name')
-        for table_dict in all_tables_dicts:
+def dump_to_parquet(args, args_params, engine):
+    """
+    streams the tables of each flag to Parquet files, one folder per flag and one file per table, several tables at a
+    time: see utils/parquet_export.py.
+    """
 
-            # build dictionary of dataframes read from pg.
-            # {"cp" : [{"companyprofile": df}, {"cp_sic_codes": df},...]}
-            df_hash = {k: [{table: pd.read_sql_query(query.format(table), conn) for table in v}]
-                       for k, v in table_dict.items()}
+    if args.parquet is True:
+        for flag, dict_ in args_params.items():
+            if vars(args)[flag]:
+                folder = DB_SCHEMA + '_' + flag
+                rows = parquet_export.export_tables(engine, dict_["all_tables"], folder)
+                print(f"{folder}/: {sum(rows.values()):,} rows of {len(rows)} tables written.")
+        return
 
-            # create list of writer instances.
-            writers = [pd.ExcelWriter(DB_SCHEMA + '_' + k + '.xlsx', engine='xlsxwriter')
-                       for k, _ in df_hash.items()]
 
-            # write to excel file.
-            for writer, (k, v) in zip(writers, df_hash.items()):
-                for dic in v:
-                    for tab, df in dic.items():
-                        df.to_excel(writer, sheet_name=tab)
+def make_jobs(args, url_ids, params):
+    """
+    builds the list of (params dictionary, url_id) pairs to be extracted and inserted, one per url_id and flag.
+    """
+
+    # for al flag.
+    if args.al:
+        return [(appointmentlist_params, appointmentlist_id) for appointmentlist_id in url_ids]
+
+    # for all other flags (psc, ol, cp).
+    return [(params_dict, company_number) for company_number in url_ids for params_dict in params]
+
+
+def failed_jobs(engine, jobs):
+    """
+    keeps the jobs of --retry-failed: the (params dictionary, url_id) recorded in the *_http_errors tables by the
+    previous runs, except the errors the API would return again (e.g. "not found").
+    """
+    failed = set()
+    for name in {params_dict.get("name") for params_dict, _ in jobs}:
+        rows = engine.execute(mode="read",
+                              query="SELECT {fields} FROM {table} WHERE NOT error = ANY(%s)",
+                              fields=["id_item_queried"],
+                              table=name + "_http_errors",
+                              data=[list(PERMANENT_ERRORS)])
+        failed.update((name, url_id) for url_id, in rows or [])
+
+    return [(params_dict, url_id) for params_dict, url_id in jobs if (params_dict.get("name"), url_id) in failed]
+
+
+def resumed_jobs(journal, jobs):
+    """
+    keeps the jobs of --resume: the (params dictionary, url_id) not recorded in the journal of the previous run. The
+    errors of the API are not recorded, so that a --retry-failed pass resumed calls again those it had not fixed.
+    """
+    done = journal.done()
+    return [(params_dict, url_id) for params_dict, url_id in jobs if (params_dict.get("name"), url_id) not in done]
 
-                # Close the Pandas Excel writer and output the Excel file.
-                writer.save()
-        return
+
+def extract(job):
+    params_dict, url_id = job
+    json, _, _ = Getter(json_params=params_dict, url_id=url_id).extract()
+    return json
+
+
+def extract_and_insert(params_dict, url_id, writer):
+    writer.add(json=extract((params_dict, url_id)), params=params_dict, uid_value=url_id)
+
+
+async def extract_and_insert_concurrently(jobs, concurrency, writer):
+    """
+    keeps up to "concurrency" calls to the API in flight, each JSON is inserted as soon as its extraction completes.
+    the writes block on the database: they run in a thread of their own, one after the other, so that the event loop
+    keeps collecting the responses of the calls in flight meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    fetcher = AsyncFetcher(concurrency=concurrency)
+    try:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer") as write_executor:
+            async for (params_dict, url_id), (json, _, _) in fetcher.imap_unordered(
+                    lambda job: Getter(json_params=job[0], url_id=job[1]).extract_async(fetcher), jobs):
+
+                await loop.run_in_executor(write_executor,
+                                           partial(writer.add, json=json, params=params_dict, uid_value=url_id))
+    finally:
+        fetcher.close()
+
+
+def make_writer(args):
+    """
+    the JSON are written in batches, one transaction each, with --batch; row by row as they come otherwise; with --diff
+    only their rows which changed, and with --history the versions of their rows. Either way the (resource, url_id)
+    written are recorded in the journal of --resume.
+    """
+    journal = Journal(db=MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=DB_SCHEMA))
+    if args.diff or args.history:
+        return DiffWriter(batch_size=args.batch or BATCH_SIZE, journal=journal, history=args.history)
+    if args.batch > 0:
+        copy_threshold = COPY_THRESHOLD if args.copy_above is None else args.copy_above
+        return BatchWriter(batch_size=args.batch, copy_threshold=copy_threshold, journal=journal)
+    return RowWriter(journal=journal)
+
+
+def print_writers_stats(writers):
+    if all(isinstance(writer, BatchWriter) for writer in writers):
+        stats = {k: sum(writer.stats[k] for writer in writers) for k in ("documents", "statements", "rows", "copied")}
+        print(f"{stats['documents']:,} JSON written with {stats['statements']:,} statements, "
+              f"{stats['rows']:,} rows ({stats['copied']:,} with COPY).")
+
+    if all(isinstance(writer, DiffWriter) for writer in writers):
+        stats = {k: sum(writer.stats[k] for writer in writers)
+                 for k in ("documents", "unchanged", "rows", "deleted", "versions", "closed")}
+        print(f"{stats['documents']:,} JSON refreshed, {stats['unchanged']:,} unchanged: {stats['rows']:,} rows "
+              f"written, {stats['deleted']:,} deleted.")
+        if any(writer.history for writer in writers):
+            print(f"history: {stats['versions']:,} versions appended, {stats['closed']:,} closed.")
+
+
+def bulk_ingest(args, args_params):
+    """
+    loads a CH snapshot file (Basic Company Data with --cp, PSC snapshot with --psc) into the same tables the API
+    extractions are inserted into, with COPY statements.
+    """
+    if bulk_flags_are_wrong(args):
+        raise ValueError("The --bulk flag loads one snapshot file at a time: pass either --cp with the Basic Company "
+                         "Data file or --psc with the PSC snapshot file.")
+
+    flag, read_snapshot = ("cp", read_basic_company_data) if args.cp else ("psc", read_psc_snapshot)
+
+    engine = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=DB_SCHEMA)
+    engine.execute(mode="write", query=args_params[flag]["create_stmts"])
+    migrate(engine)
+
+    with engine.connection() as connection:
+        BulkLoader(connection=connection, params=args_params[flag]["params"]).load(read_snapshot(args.file))
+
+        if args.excel is True:
+            dump_to_excel(args=args, args_params=args_params, conn=connection)
+
+    dump_to_parquet(args=args, args_params=args_params, engine=engine)
+    engine.close()
+
+
+def run_jobs(args, jobs):
+    """
+    extracts and writes the jobs in this process: pipelined (--pipeline), with calls in flight (--concurrency) or one
+    after the other. Returns the writers used.
+    """
+    # the calls failing again are retried patiently: the healthy url_ids have been written by the previous run.
+    if args.retry_failed:
+        configure_retries(PATIENT_RETRIES)
+
+    if args.pipeline:
+
+        # fetchers and writers run at the same time, the JSON waiting to be written are bounded in MB.
+        if args.concurrency > POOL_SIZE:
+            configure_session(pool_size=args.concurrency)
+
+        pipeline = Pipeline(fetch=extract, open_writer=lambda: make_writer(args), fetchers=args.concurrency,
+                            writers=args.writers, max_bytes=args.queue_mb * 1024 ** 2)
+        pipeline.run(jobs)
+        print(pipeline.report())
+        writers = pipeline.open_writers
+
+    else:
+        writer = make_writer(args)
+        writers = [writer]
+
+        if args.concurrency > 1:
+
+            # one keep-alive connection per call in flight.
+            if args.concurrency > POOL_SIZE:
+                configure_session(pool_size=args.concurrency)
+
+            asyncio.run(extract_and_insert_concurrently(jobs, concurrency=args.concurrency, writer=writer))
+
+        else:
+            for params_dict, url_id in jobs:
+                extract_and_insert(params_dict, url_id, writer=writer)
+
+        writer.flush()
+
+    return writers
+
+
+def start_worker(shared_limiter, api_base_url, cache):
+    """initialiser of the worker processes of --workers: the calls of all the workers share the budget of the keys."""
+    configure_keys(KEYS, shared=shared_limiter)
+
+    if api_base_url is not None:
+        configure_base_url(api_base_url)
+
+    if cache:
+        enable_cache()
+
+
+def api_stats():
+    """the stats of the coalescer and of the response cache (None if disabled) of the calls made by this process."""
+    cache = api_functions.CACHE
+    return {"coalescer": dict(COALESCER.stats), "cache": None if cache is None else dict(cache.stats)}
+
+
+def add_stats(total: dict, stats: dict) -> None:
+    for k, v in stats.items():
+        total[k] = total.get(k, 0) + v
+
+
+def run_shard(args, jobs):
+    """
+    runs a shard of the jobs in a worker process of --workers, with its own pool of DB connections. Returns the number
+    of jobs, the seconds taken and the api_stats() of the worker.
+    """
+    start = time.perf_counter()
+    writers = run_jobs(args, jobs)
+    print_writers_stats(writers)
+
+    MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=DB_SCHEMA).close()
+    return len(jobs), time.perf_counter() - start, api_stats()
+
+
+def run_in_workers(args, jobs, cache=None):
+    """
+    shards the jobs across --workers processes, so that the normalisation of the JSON is not limited to one CPU. The
+    processes pace their calls on a rate limiter in shared memory, so that all together they stay within the quota.
+    the coalescer and cache stats of the workers are added to the COALESCER and the cache of this process, which
+    report them.
+    """
+    context = multiprocessing.get_context("spawn")  # no DB connection or socket of this process is inherited.
+    shared_limiter = SharedTokenBucket(calls=CALLS, period=FIVE_MINUTES, n=max(len(KEYS), 1), context=context)
+    shards = [jobs[n::args.workers] for n in range(args.workers)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=start_worker,
+                             initargs=(shared_limiter, args.api_base_url, args.cache)) as executor:
+        for n, (n_jobs, seconds, stats) in enumerate(executor.map(run_shard, [args] * args.workers, shards)):
+            print(f"worker {n}: {n_jobs:,} jobs in {seconds:,.0f}s ({n_jobs / max(seconds, 1e-9):,.1f} jobs/s).")
+            add_stats(COALESCER.stats, stats["coalescer"])
+            if cache is not None and stats["cache"] is not None:
+                add_stats(cache.stats, stats["cache"])
+
+    elapsed = time.perf_counter() - start
+    print(f"{len(jobs):,} jobs in {elapsed:,.0f}s with {args.workers} workers ({len(jobs) / elapsed:,.1f} jobs/s).")
 
 
 def main(args, args_params):
 
+    # snapshot files are loaded without calling the API.
+    if args.bulk:
+        return bulk_ingest(args, args_params)
+
     # get url_ids from file and check flags passed by user.
     url_ids = make_url_list(args)
     run_flags_check(args, url_ids=url_ids)
 
-    # create engine instance
+    # create engine instance, sharing its pool of connections with the engine of utils/json_inserter.py.
     engine = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=DB_SCHEMA)
-    connection = engine.connect()
 
     # create list of create statements
     create_stmts = [dict_["create_stmts"] for key, dict_ in args_params.items() if vars(args)[key]]
@@ -152,30 +394,53 @@ def main(args, args_params):
     # execute create statement
     _ = list(map(lambda x: engine.execute(mode="write", query=x), create_stmts))
 
+    # changes made to the tables since they were created (db/pg_migrations.py), journal of the runs included.
+    migrate(engine)
+
     # create list of params dictionaries.
     params = [dict_["params"] for key, dict_ in args_params.items() if vars(args)[key]]
 
-    # for al flag.
-    if args.al:
+    jobs = make_jobs(args, url_ids=url_ids, params=params)
 
-        for appointmentlist_id in url_ids:
-            extractor = Getter(appointmentlist_params, appointmentlist_id)
-            json, _, _ = extractor.extract()
-            inserter = Inserter(json=json, params=appointmentlist_params)
-            inserter.unpack(uid_value=appointmentlist_id)
+    # only the url_ids whose calls failed in the previous runs.
+    if args.retry_failed:
+        todo = failed_jobs(engine, jobs)
+        print(f"retrying the failed calls: {len(todo):,} of {len(jobs):,} jobs.")
+        jobs = todo
 
-    # for all other flags (psc, ol, cp).
-    if args.ol or args.psc or args.cp:
+    # skip the jobs written by the previous run, or start a new journal (a retry pass adds to the journal of its run).
+    journal = Journal(db=engine)
+    if args.resume:
+        todo = resumed_jobs(journal, jobs)
+        print(f"resuming: {len(jobs) - len(todo):,} of {len(jobs):,} jobs already done, skipped.")
+        jobs = todo
+    elif not args.retry_failed:
+        journal.clear()
+
+    # e.g. the stub server replaying recorded responses.
+    if args.api_base_url is not None:
+        configure_base_url(args.api_base_url)
 
-        for company_number in url_ids:
-            for params_dict in params:
-                extractor = Getter(json_params=params_dict, url_id=company_number)
-                json, _, _ = extractor.extract()
-                inserter = Inserter(json=json, params=params_dict)
-                inserter.unpack(uid_value=company_number)
+    # on-disk cache of the responses of the API, reused across runs.
+    cache = enable_cache() if args.cache else None
+
+    if args.workers > 1:
+        run_in_workers(args, jobs, cache=cache)
+    else:
+        print_writers_stats(run_jobs(args, jobs))
+
+    if COALESCER.stats["coalesced"]:
+        print(COALESCER.report())
+
+    if cache is not None:
+        print(cache.report())
 
     if args.excel is True:
-        dump_to_excel(args=ARGS, args_params=ARGS_PARAMS, query=SELECT_ALL, conn=connection)
+        with engine.connection() as connection:
+            dump_to_excel(args=ARGS, args_params=ARGS_PARAMS, conn=connection)
+
+    dump_to_parquet(args=ARGS, args_params=ARGS_PARAMS, engine=engine)
+    engine.close()
 
 if __name__ == '__main__':
 
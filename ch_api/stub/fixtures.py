@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+
+"""
+fixtures replayed by the stub server (stub/server.py): one JSON object per line, the response of the API to one path.
+
+{"path": "/company/OC399321/officers", "status": 200, "body": {..., "items": [... all the items ...]}}
+
+the body of a paginated resource holds all its items, the server slices them according to the start_index and
+items_per_page of each request. Fixtures are either recorded from the real API (stub/recorder.py) or synthesised.
+"""
+
+import json
+import random
+from datetime import date, timedelta
+
+
+def load_fixtures(path):
+    """returns the dictionary {path: (status, body)} of a fixtures file."""
+    fixtures = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                fixture = json.loads(line)
+                fixtures[fixture["path"]] = (fixture["status"], fixture["body"])
+    return fixtures
+
+
+def save_fixtures(path, fixtures):
+    """writes the dictionary {path: (status, body)} to a fixtures file, one fixture per line."""
+    with open(path, "w") as f:
+        for fixture_path, (status, body) in sorted(fixtures.items()):
+            f.write(json.dumps({"path": fixture_path, "status": status, "body": body}) + "\n")
+
+
+# synthetic fixtures: documents shaped like the CH resources, with the keys expected by utils/json_params.py and the
+# columns of db/pg_tables.py, generated deterministically from a seed.
+
+FORENAMES = ["JOHN", "MARY", "DAVID", "SARAH", "JAMES", "ANNA", "PETER", "LAURA", "MARK", "EMMA"]
+SURNAMES = ["SMITH", "JONES", "TAYLOR", "BROWN", "WILLIAMS", "WILSON", "JOHNSON", "DAVIES", "ROBINSON", "WRIGHT"]
+NATURES = ["ownership-of-shares-25-to-50-percent", "ownership-of-shares-75-to-100-percent",
+           "voting-rights-25-to-50-percent", "right-to-appoint-and-remove-directors"]
+
+
+def company_numbers(n):
+    return [f"SY{i:06d}" for i in range(n)]
+
+
+def _date(rng, start_year=1990):
+    return (date(start_year, 1, 1) + timedelta(days=rng.randrange(11000))).isoformat()
+
+
+def _address(rng):
+    return {"premises": str(rng.randrange(1, 300)),
+            "address_line_1": f"{rng.choice(SURNAMES).title()} Street",
+            "locality": rng.choice(["London", "Leeds", "Bristol", "Glasgow"]),
+            "postal_code": f"EC{rng.randrange(1, 9)}A {rng.randrange(1, 9)}BB",
+            "country": "England"}
+
+
+def _etag(rng):
+    return "%040x" % rng.getrandbits(160)
+
+
+def companyprofile(rng, company_number):
+    return {"company_name": f"{rng.choice(SURNAMES)} {rng.choice(SURNAMES)} LTD",
+            "company_number": company_number,
+            "company_status": rng.choice(["active", "active", "dissolved"]),
+            "date_of_creation": _date(rng),
+            "etag": _etag(rng),
+            "can_file": True,
+            "has_been_liquidated": False,
+            "has_charges": rng.random() < 0.3,
+            "has_insolvency_history": False,
+            "jurisdiction": "england-wales",
+            "registered_office_is_in_dispute": False,
+            "undeliverable_registered_office_address": False,
+            "type": "ltd",
+            "links": {"self": f"/company/{company_number}",
+                      "filing_history": f"/company/{company_number}/filing-history",
+                      "officers": f"/company/{company_number}/officers",
+                      "persons_with_significant_control": f"/company/{company_number}/persons-with-significant-control"},
+            "registered_office_address": _address(rng),
+            "accounts": {"accounting_reference_date": {"day": "31", "month": "12"},
+                         "last_accounts": {"made_up_to": _date(rng, 2015), "type": "micro-entity"},
+                         "next_due": _date(rng, 2020),
+                         "next_made_up_to": _date(rng, 2020),
+                         "overdue": False},
+            "confirmation_statement": {"last_made_up_to": _date(rng, 2015), "next_due": _date(rng, 2020),
+                                       "next_made_up_to": _date(rng, 2020), "overdue": False},
+            "sic_codes": sorted({str(rng.randrange(10000, 99999)) for _ in range(rng.randrange(1, 4))}),
+            "previous_company_names": [{"name": f"{rng.choice(SURNAMES)} LIMITED",
+                                        "effective_from": _date(rng, 1980),
+                                        "ceased_on": _date(rng, 2000)} for _ in range(rng.randrange(0, 3))]}
+
+
+def officer(rng, company_number):
+    forename, surname = rng.choice(FORENAMES), rng.choice(SURNAMES)
+    officer_id = "%027x" % rng.getrandbits(108)
+    item = {"name": f"{surname}, {forename}",
+            "officer_role": rng.choice(["director", "secretary", "llp-member"]),
+            "appointed_on": _date(rng),
+            "nationality": "British",
+            "occupation": "Director",
+            "country_of_residence": "England",
+            "date_of_birth": {"month": rng.randrange(1, 13), "year": rng.randrange(1940, 2000)},
+            "address": _address(rng),
+            "links": {"officer": {"appointments": f"/officers/{officer_id}/appointments"},
+                      "self": f"/company/{company_number}/appointments/{officer_id}"}}
+    if rng.random() < 0.3:
+        item["resigned_on"] = _date(rng, 2010)
+    if rng.random() < 0.1:
+        item["former_names"] = [{"forenames": rng.choice(FORENAMES), "surname": rng.choice(SURNAMES)}]
+    return item
+
+
+def officerlist(rng, company_number, n_items):
+    items = [officer(rng, company_number) for _ in range(n_items)]
+    resigned = sum("resigned_on" in item for item in items)
+    return {"etag": _etag(rng),
+            "kind": "officer-list",
+            "links": {"self": f"/company/{company_number}/officers"},
+            "active_count": n_items - resigned,
+            "inactive_count": 0,
+            "resigned_count": resigned,
+            "items_per_page": 35,
+            "start_index": 0,
+            "total_results": n_items,
+            "items": items}
+
+
+def psc_item(rng, company_number):
+    forename, surname = rng.choice(FORENAMES), rng.choice(SURNAMES)
+    return {"etag": _etag(rng),
+            "kind": "individual-person-with-significant-control",
+            "name": f"Mr {forename.title()} {surname.title()}",
+            "name_elements": {"title": "Mr", "forename": forename.title(), "surname": surname.title()},
+            "nationality": "British",
+            "country_of_residence": "England",
+            "notified_on": _date(rng, 2016),
+            "date_of_birth": {"month": rng.randrange(1, 13), "year": rng.randrange(1940, 2000)},
+            "address": _address(rng),
+            "natures_of_control": rng.sample(NATURES, rng.randrange(1, 3)),
+            "links": {"self": f"/company/{company_number}/persons-with-significant-control/individual/"
+                              f"{'%027x' % rng.getrandbits(108)}"}}
+
+
+def psc(rng, company_number, n_items):
+    return {"etag": _etag(rng),
+            "kind": "persons-with-significant-control#list",
+            "links": {"self": f"/company/{company_number}/persons-with-significant-control"},
+            "active_count": n_items,
+            "ceased_count": 0,
+            "items_per_page": 25,
+            "start_index": 0,
+            "total_results": n_items,
+            "items": [psc_item(rng, company_number) for _ in range(n_items)]}
+
+
+def appointmentlist(rng, appointments_path, n_items):
+    forename, surname = rng.choice(FORENAMES), rng.choice(SURNAMES)
+    items = []
+    for _ in range(n_items):
+        company_number = f"SY{rng.randrange(1000000):06d}"
+        items.append({"appointed_on": _date(rng),
+                      "appointed_to": {"company_name": f"{rng.choice(SURNAMES)} LTD",
+                                       "company_number": company_number,
+                                       "company_status": "active"},
+                      "name": f"{forename} {surname}",
+                      "name_elements": {"forename": forename.title(), "surname": surname, "title": "Mr"},
+                      "officer_role": "director",
+                      "nationality": "British",
+                      "occupation": "Director",
+                      "country_of_residence": "England",
+                      "address": _address(rng),
+                      "links": {"company": f"/company/{company_number}"}})
+    return {"date_of_birth": {"month": rng.randrange(1, 13), "year": rng.randrange(1940, 2000)},
+            "etag": _etag(rng),
+            "is_corporate_officer": False,
+            "items_per_page": 35,
+            "kind": "personal-appointment",
+            "links": {"self": appointments_path},
+            "name": f"{forename} {surname}",
+            "start_index": 0,
+            "total_results": n_items,
+            "items": items}
+
+
+def synthesise(n_companies, officers=(1, 40), pscs=(0, 4), appointments=(1, 120), seed=0):
+    """
+    returns synthetic fixtures {path: (status, body)} for n companies (companyprofile, officers and psc) and for the
+    appointments of one officer of each company. The number of items of each list is drawn from the (min, max) ranges.
+    """
+    rng = random.Random(seed)
+    fixtures = {}
+
+    for company_number in company_numbers(n_companies):
+        fixtures[f"/company/{company_number}"] = (200, companyprofile(rng, company_number))
+
+        officers_body = officerlist(rng, company_number, rng.randint(*officers))
+        fixtures[f"/company/{company_number}/officers"] = (200, officers_body)
+
+        n_pscs = rng.randint(*pscs)
+        fixtures[f"/company/{company_number}/persons-with-significant-control"] = (
+            (200, psc(rng, company_number, n_pscs)) if n_pscs else (404, {"errors": [{"error": "company-psc-not-found",
+                                                                                        "type": "ch:service"}]}))
+
+        appointments_path = officers_body["items"][0]["links"]["officer"]["appointments"]
+        fixtures[appointments_path] = (200, appointmentlist(rng, appointments_path, rng.randint(*appointments)))
+
+    return fixtures
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(prog="fixtures.py", description="write synthetic fixtures to a file.")
+    arg_parser.add_argument("out", help="path of the fixtures file to write.")
+    arg_parser.add_argument("--companies", type=int, default=1000)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    cli_args = arg_parser.parse_args()
+
+    save_fixtures(cli_args.out, synthesise(n_companies=cli_args.companies, seed=cli_args.seed))
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+"""
+recorder of the responses of the real Companies House API into fixtures replayed by the stub server (stub/server.py).
+
+the url_ids are extracted with the Getter of the programme, exactly as prog.py does, through a session recording
+every response. The pages of a list are then merged back into one fixture holding all its items.
+
+usage, from ch_api/ (the root folder of the programme), with your key(s) in utils/api_key:
+(venv) prompt$ python3 -m stub.recorder url_file.txt --cp --psc --ol --out fixtures.jsonl
+(venv) prompt$ python3 -m stub.recorder appointments_file.txt --al --out fixtures_al.jsonl
+"""
+
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from stub.fixtures import save_fixtures
+
+
+class RecordingSession(requests.Session):
+    """requests.Session keeping (url, status, body) of every response with a JSON body."""
+
+    def __init__(self):
+        super().__init__()
+        self.recorded = []
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        r = super().get(url, **kwargs)
+        if r.status_code in (200, 400, 404):
+            try:
+                body = r.json()
+            except ValueError:
+                body = {}
+            with self._lock:
+                self.recorded.append((url, r.status_code, body))
+        return r
+
+
+def merge_pages(recorded: list) -> dict:
+    """
+    func to turn the recorded responses into fixtures {path: (status, body)}: the pages of a path are merged into the
+    body of its 1st page, with the items of the following pages appended in the order of their start_index.
+    """
+    pages = {}
+    for url, status, body in recorded:
+        split = urlsplit(url)
+        start_index = int(parse_qs(split.query).get("start_index", [0])[0])
+        pages.setdefault(split.path.rstrip("/"), {})[start_index] = (status, body)
+
+    fixtures = {}
+    for path, by_start_index in pages.items():
+        status, body = by_start_index[min(by_start_index)]
+        if status == 200 and isinstance(body.get("items"), list):
+            body = dict(body, start_index=0, items=[item for start_index in sorted(by_start_index)
+                                                    for item in by_start_index[start_index][1].get("items", [])])
+        fixtures[path] = (status, body)
+
+    return fixtures
+
+
+def record(jobs: list) -> dict:
+    """
+    func to extract the (params dictionary, url_id) jobs from the API and record the fixtures of the responses.
+    :return: fixtures {path: (status, body)}, see stub/fixtures.py.
+    """
+    import utils.api_functions as api_functions
+    from utils.json_getter import Getter
+
+    session = RecordingSession()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=api_functions.POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    api_functions.SESSION = session
+
+    for params_dict, url_id in jobs:
+        Getter(json_params=params_dict, url_id=url_id).extract()
+
+    return merge_pages(session.recorded)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from utils.helpers import read_file_with_url_ids
+    from utils.json_params import psc_params, companyprofile_params, officerlist_params, appointmentlist_params
+
+    arg_parser = argparse.ArgumentParser(prog="recorder.py", description="record responses of the CH API.")
+    arg_parser.add_argument("file", help="path to csv file containing the url ids to be queried.")
+    arg_parser.add_argument("--out", default="fixtures.jsonl", help="path of the fixtures file to write.")
+    for flag in ("cp", "psc", "ol", "al"):
+        arg_parser.add_argument(f"--{flag}", action="store_true")
+    cli_args = arg_parser.parse_args()
+
+    flags_params = {"cp": companyprofile_params, "psc": psc_params, "ol": officerlist_params,
+                    "al": appointmentlist_params}
+    url_ids = read_file_with_url_ids(path=cli_args.file)
+    jobs = [(params_dict, url_id) for url_id in url_ids
+            for flag, params_dict in flags_params.items() if vars(cli_args)[flag]]
+
+    fixtures = record(jobs)
+    save_fixtures(cli_args.out, fixtures)
+    print(f"{len(fixtures)} fixtures recorded in {cli_args.out}")
@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+"""
+local stub of the Companies House API replaying fixtures (see stub/fixtures.py), to test and benchmark the programme
+deterministically and without network.
+
+it emulates what the programme relies on of the real API:
+  * basic auth: a call without key, or with a key not in "keys" (if given), is answered 401.
+  * rate limiting: "limit" calls per key every "window" seconds in fixed windows, X-Ratelimit-* headers with every
+    response and 429 once the budget of the window is spent.
+  * pagination: the items of a list are sliced with the start_index and items_per_page of the query string, capped
+    at 100 items per page (50 for the appointments) like the real API.
+  * 404 for the paths without fixture, the status recorded otherwise.
+  * ETag header and 304 Not Modified to a conditional call (If-None-Match) with the current etag.
+  * latency: every response is delayed by "latency" seconds.
+
+usage, from ch_api/ (the root folder of the programme):
+(venv) prompt$ python3 -m stub.fixtures fixtures.jsonl --companies 1000  # or python3 -m stub.recorder, see there.
+(venv) prompt$ python3 -m stub.server fixtures.jsonl --port 8000 --latency 0.05
+(venv) prompt$ CH_API_BASE_URL=http://127.0.0.1:8000 python3 prog.py ...  # or the --api-base-url option of prog.py.
+
+or in a test/benchmark:
+>>> from stub.server import make_server
+... server = make_server(fixtures, latency=0.01)  # port 0: any free port, see server.base_url.
+... threading.Thread(target=server.serve_forever, daemon=True).start()
+"""
+
+import base64
+import hashlib
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from stub.fixtures import load_fixtures
+
+DEFAULT_ITEMS_PER_PAGE = 35
+MAX_ITEMS_PER_PAGE = {"appointments": 50}  # by last segment of the path, 100 for the others.
+
+NOT_FOUND = (404, {"errors": [{"error": "not-found", "type": "ch:service"}]})
+
+
+class StubApi:
+    """the state of the stub: fixtures and calls counted per key. Thread safe."""
+
+    def __init__(self, fixtures: dict, latency: float = 0.0, limit: int = 600, window: float = 300,
+                 keys: list = None, clock=time.time):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.keys = None if keys is None else set(keys)
+        self.clock = clock
+        self.stats = {"calls": 0, "200": 0, "304": 0, "401": 0, "404": 0, "429": 0}
+
+        self._windows = {}  # key: (reset, calls made in the window).
+        self._lock = threading.Lock()
+
+    def count_call(self, key: str) -> (bool, dict):
+        """counts a call of the key, returns (whether it is within the budget, X-Ratelimit-* headers)."""
+        now = self.clock()
+        with self._lock:
+            self.stats["calls"] += 1
+            reset, used = self._windows.get(key, (0.0, 0))
+            if now >= reset:
+                # windows are aligned to multiples of the window, as the resets of the real API.
+                reset, used = (math.floor(now / self.window) + 1) * self.window, 0
+
+            allowed = used < self.limit
+            used += allowed
+            self._windows[key] = (reset, used)
+
+        return allowed, {"X-Ratelimit-Limit": str(self.limit),
+                         "X-Ratelimit-Remaining": str(self.limit - used),
+                         "X-Ratelimit-Reset": str(int(reset)) if reset == int(reset) else str(reset),
+                         "X-Ratelimit-Window": f"{self.window:g}s"}
+
+    def count_status(self, status: int) -> None:
+        with self._lock:
+            self.stats[str(status)] = self.stats.get(str(status), 0) + 1
+
+    def page(self, path: str, query: dict) -> (int, dict):
+        """returns (status, body) of a path, the body of a list sliced on start_index and items_per_page."""
+        status, body = self.fixtures.get(path.rstrip("/"), NOT_FOUND)
+        if status != 200 or not isinstance(body.get("items"), list):
+            return status, body
+
+        resource = path.rstrip("/").rsplit("/", 1)[-1]
+        items_per_page = min(int(query.get("items_per_page", [DEFAULT_ITEMS_PER_PAGE])[0]),
+                             MAX_ITEMS_PER_PAGE.get(resource, 100))
+        start_index = int(query.get("start_index", [0])[0])
+
+        page = dict(body, items_per_page=items_per_page, start_index=start_index,
+                    items=body["items"][start_index:start_index + items_per_page])
+        page.setdefault("total_results", len(body["items"]))
+        return status, page
+
+
+def key_of(authorization: str) -> str:
+    """func to get the api key from the Authorization header of a basic auth call (key as user, empty password)."""
+    if not authorization or not authorization.startswith("Basic "):
+        return None
+    try:
+        key = base64.b64decode(authorization[len("Basic "):]).decode().split(":", 1)[0]
+    except ValueError:
+        return None
+    return key or None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive needs HTTP/1.1 and a Content-Length header.
+    disable_nagle_algorithm = True  # headers and body are written separately, do not wait for delayed ACKs.
+
+    def do_GET(self):
+        api = self.server.api
+        if api.latency:
+            time.sleep(api.latency)
+
+        key = key_of(self.headers.get("Authorization"))
+        if key is None or (api.keys is not None and key not in api.keys):
+            return self.respond(401, {"error": "Invalid Authorization", "type": "ch:service"})
+
+        allowed, headers = api.count_call(key)
+        if not allowed:
+            return self.respond(429, {"error": "Rate limit exceeded", "type": "ch:service"}, headers)
+
+        url = urlsplit(self.path)
+        status, body = api.page(url.path, parse_qs(url.query))
+        content = json.dumps(body).encode()
+
+        if status == 200:
+            headers["ETag"] = hashlib.sha1(content).hexdigest()
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                return self.respond(304, None, headers)
+
+        self.respond(status, content, headers)
+
+    def respond(self, status: int, body, headers: dict = None):
+        content = json.dumps(body).encode() if isinstance(body, dict) else (body or b"")
+        self.server.api.count_status(status)
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, api: StubApi):
+        super().__init__(address, StubHandler)
+        self.api = api
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_port}"
+
+
+def make_server(fixtures: dict, host: str = "127.0.0.1", port: int = 0, **kwargs) -> StubServer:
+    """
+    func to create a stub server replaying the fixtures, kwargs are passed to StubApi (latency, limit, window, keys).
+    :param port: int, 0 binds any free port, read it from server.base_url.
+    :return: StubServer, not started: call serve_forever() (in a thread) and shutdown().
+    """
+    return StubServer((host, port), StubApi(fixtures, **kwargs))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from utils.rate_limiter import parse_window
+
+    arg_parser = argparse.ArgumentParser(prog="server.py", description="stub of the Companies House API.")
+    arg_parser.add_argument("fixtures", help="path of the fixtures file (stub/fixtures.py, stub/recorder.py).")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response.")
+    arg_parser.add_argument("--limit", type=int, default=600, help="calls allowed per key in each window.")
+    arg_parser.add_argument("--window", default="5m", help="length of the rate limit window, e.g. 5m, 10s.")
+    arg_parser.add_argument("--keys", nargs="*", default=None, help="keys accepted, any key if not given.")
+    cli_args = arg_parser.parse_args()
+
+    stub = make_server(load_fixtures(cli_args.fixtures), host=cli_args.host, port=cli_args.port,
+                       latency=cli_args.latency, limit=cli_args.limit, window=parse_window(cli_args.window),
+                       keys=cli_args.keys)
+    print(f"stub of the CH API serving {len(stub.api.fixtures)} fixtures on {stub.base_url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        print(stub.api.stats)
@@ -1 +1,147 @@
-# todo
\ No newline at end of file
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from stub.fixtures import synthesise, company_numbers
+from stub.recorder import merge_pages
+from stub.server import make_server
+from utils import api_functions
+from utils.json_getter import Getter
+from utils.json_params import companyprofile_params, officerlist_params, psc_params, appointmentlist_params
+
+FIXTURES = synthesise(n_companies=5, officers=(120, 250), pscs=(0, 2), appointments=(60, 120), seed=1)
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    """stub server on a free port, with api_functions pointed to it and a fresh key pool."""
+
+    def start(keys=("key_1",), fixtures=FIXTURES, **kwargs):
+        server = make_server(fixtures, **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        started.append(server)
+
+        monkeypatch.setattr(api_functions, "API_BASE_URL", server.base_url)
+        monkeypatch.setattr(api_functions, "KEY_POOL", api_functions.KeyPool(keys=list(keys), calls=600, period=300))
+        monkeypatch.setattr(api_functions, "CACHE", None)
+        monkeypatch.setattr(api_functions, "DECODER", api_functions.DECODER)
+        monkeypatch.setattr(api_functions, "decode", api_functions.decode)
+        monkeypatch.setattr(api_functions, "RETRIES", api_functions.RETRIES)
+        return server
+
+    started = []
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def test_getter_extracts_every_page_from_the_stub(stub):
+    server = stub()
+    company_number = company_numbers(1)[0]
+
+    officers, _, _ = Getter(json_params=officerlist_params, url_id=company_number).extract()
+    expected = FIXTURES[f"/company/{company_number}/officers"][1]["items"]
+    assert officers["items"] == expected
+    assert server.api.stats["200"] == -(-len(expected) // 100)  # one call per page of 100 items.
+
+    profile, _, _ = Getter(json_params=companyprofile_params, url_id=company_number).extract()
+    assert profile == FIXTURES[f"/company/{company_number}"][1]
+
+    appointments_path = expected[0]["links"]["officer"]["appointments"]
+    appointments, _, _ = Getter(json_params=appointmentlist_params, url_id=appointments_path).extract()
+    assert appointments["items"] == FIXTURES[appointments_path][1]["items"]  # 50 items per page at most.
+
+
+def test_http_errors_are_returned_as_error_dictionaries(stub):
+    stub()
+    missing = [number for number in company_numbers(5)
+               if FIXTURES[f"/company/{number}/persons-with-significant-control"][0] == 404]
+
+    assert api_functions.get_companyprofile("XX000000") == {"error": "not found"}
+    for company_number in missing:
+        res, _, _ = Getter(json_params=psc_params, url_id=company_number).extract()
+        assert res == {"error": "not found"}
+
+
+def test_a_call_failing_in_vain_is_returned_as_an_error_and_retried_patiently_later(stub):
+    number = company_numbers(1)[0]
+    server = stub(fixtures=dict(FIXTURES, **{f"/company/{number}": (503, {"error": "Service Unavailable"})}))
+
+    # the waits are shortened, the number of attempts is the one of each policy.
+    api_functions.configure_retries(dict(api_functions.QUICK_RETRIES, factor=0.01, max_wait=0.01))
+    profile, _, _ = Getter(json_params=companyprofile_params, url_id=number).extract()
+    assert profile == {"error": "server error 503"}
+    assert server.api.stats["503"] == api_functions.QUICK_RETRIES["max_tries"]
+
+    api_functions.configure_retries(dict(api_functions.PATIENT_RETRIES, factor=0.01, max_wait=0.01))
+    profile, _, _ = Getter(json_params=companyprofile_params, url_id=number).extract()
+    assert profile == {"error": "server error 503"}
+    quick, patient = api_functions.QUICK_RETRIES["max_tries"], api_functions.PATIENT_RETRIES["max_tries"]
+    assert server.api.stats["503"] == quick + patient
+
+
+def test_key_rejected_with_401_is_removed_and_the_call_made_again(stub):
+    server = stub(keys=("revoked", "valid"))
+    server.api.keys = {"valid"}
+
+    for company_number in company_numbers(3):
+        assert "error" not in api_functions.get_companyprofile(company_number)
+
+    assert api_functions.KEY_POOL.keys() == ["valid"]
+    assert server.api.stats["401"] == 1
+
+
+def test_429_waits_for_the_reset_of_the_window(stub):
+    server = stub(limit=5, window=1)
+
+    for company_number in company_numbers(5) * 3:
+        assert "error" not in api_functions.get_companyprofile(company_number)
+
+    # 15 calls with 5 per second allowed: at least two windows waited, and every call answered in the end.
+    assert server.api.stats["200"] == 15
+    assert server.api.stats["429"] <= 2
+
+
+def test_429_is_made_again_at_most_as_many_times_as_the_retries_policy_allows(stub):
+    number = company_numbers(1)[0]
+    server = stub(window=0.2, fixtures=dict(FIXTURES, **{f"/company/{number}": (429, {"error": "Too Many Requests"})}))
+
+    assert api_functions.get_companyprofile(number) == {"error": "http error 429"}
+    assert server.api.stats["429"] == api_functions.QUICK_RETRIES["max_tries"]
+
+
+def test_merge_pages_rebuilds_the_fixture_of_a_paginated_resource():
+    path = "/company/SY000000/officers"
+    items = FIXTURES[path][1]["items"]
+    recorded = [(f"http://stub{path}?items_per_page=100&start_index={start}", 200,
+                 dict(FIXTURES[path][1], start_index=start, items=items[start:start + 100]))
+                for start in reversed(range(0, len(items), 100))]
+
+    assert merge_pages(recorded)[path] == (200, dict(FIXTURES[path][1], start_index=0))
+
+
+def test_decoders_agree_and_are_configurable(stub):
+    stub()
+    body = b'{"company_name": "\xc3\x89LEBEX LP", "items": [1, 2.5, null, true]}'
+    for name in api_functions.DECODERS:
+        expected = {"company_name": "ÉLEBEX LP", "items": [1, 2.5, None, True]}
+        assert api_functions.configure_decoder(name)(body) == expected
+        assert api_functions.get_companyprofile("SY000000") == FIXTURES["/company/SY000000"][1]
+
+    with pytest.raises(ValueError):
+        api_functions.configure_decoder("simdjson")
+
+
+def test_identical_calls_in_flight_are_coalesced(stub):
+    server = stub(latency=0.2)
+    coalesced_before = api_functions.COALESCER.stats["coalesced"]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: api_functions.get_companyprofile("SY000001"), range(8)))
+
+    assert server.api.stats["calls"] == 1
+    assert api_functions.COALESCER.stats["coalesced"] - coalesced_before == 7
+    assert all(res == FIXTURES["/company/SY000001"][1] for res in results)
+    assert len({id(res) for res in results}) == 8  # each caller decodes its own object, free to modify it.
@@ -0,0 +1,62 @@
+from stub.fixtures import synthesise
+from utils.json_inserter import BatchWriter
+from utils.json_params import psc_params, officerlist_params, companyprofile_params
+
+
+def documents(fixtures, suffix, params):
+    return [(body, params, path.split("/")[2]) for path, (status, body) in sorted(fixtures.items())
+            if path.endswith(suffix)]
+
+
+def rows_of(statements, table):
+    """the rows inserted in a table, as dictionaries."""
+    return [dict(zip(statement[0], row)) for name, statement, rows in statements
+            if name == table and isinstance(rows, list) for row in rows]
+
+
+def test_a_batch_of_psc_is_written_with_a_few_statements():
+    fixtures = synthesise(n_companies=50, pscs=(1, 4), seed=1)
+    batch = documents(fixtures, "/persons-with-significant-control", psc_params)
+
+    statements = list(BatchWriter.statements(batch))
+    tables = [table for table, _, _ in statements]
+
+    # one DELETE of the errors and one of the 50 companies, then one INSERT per table instead of ~20 statements per
+    # document.
+    assert tables == ["psc_http_errors", "psc", "psc", "psc_items", "psc_items_address", "psc_items_name_elements",
+                      "psc_items_natures_of_control"]
+
+    n_items = sum(len(body["items"]) for body, _, _ in batch if body.get("items"))
+    assert len(rows_of(statements, "psc_items")) == n_items
+
+
+def test_the_array_elements_are_keyed_by_their_ordinal():
+    fixtures = synthesise(n_companies=3, officers=(2, 4), seed=2)
+    batch = documents(fixtures, "/officers", officerlist_params)
+
+    items = rows_of(list(BatchWriter.statements(batch)), "ol_items")
+    keys = sorted((row["company_number"], row["officer_serial_id"]) for row in items)
+
+    assert keys == [(company_number, ordinal) for body, _, company_number in batch
+                    for ordinal in range(1, len(body["items"]) + 1)]
+
+
+def test_error_and_empty_documents_are_upserted_once():
+    batch = [({"error": "company-profile-not-found", "type": "ch:service"}, companyprofile_params, "SY000001"),
+             ({"error": "company-profile-not-found", "type": "ch:service"}, companyprofile_params, "SY000001"),
+             ({"items": [], "total_results": 0, "active_count": 0}, psc_params, "SY000002")]
+
+    statements = list(BatchWriter.statements(batch))
+
+    assert [(table, len(rows)) for table, _, rows in statements] == [("companyprofile_http_errors", 1),
+                                                                     ("psc_empty", 1)]
+
+
+def test_a_company_added_twice_is_written_once():
+    fixtures = synthesise(n_companies=3, officers=(2, 3), seed=2)
+    batch = documents(fixtures, "/officers", officerlist_params)
+
+    statements = list(BatchWriter.statements(batch + batch[:1]))
+
+    assert len(rows_of(statements, "officerlist")) == 3
+    assert len(rows_of(statements, "ol_items")) == sum(len(body["items"]) for body, _, _ in batch)
@@ -0,0 +1,211 @@
+import copy
+from contextlib import contextmanager
+
+import utils.json_inserter as json_inserter
+from db.pg_history import HISTORY_TABLES
+from stub.fixtures import synthesise
+from utils.json_inserter import DiffWriter, hashed_rows
+from utils.json_params import officerlist_params, appointmentlist_params
+from utils.json_plan import plan_of
+
+COMPANY = "SY000000"
+OFFICERS = synthesise(n_companies=1, officers=(3, 3), seed=3)[f"/company/{COMPANY}/officers"][1]
+APPOINTMENTS = next(body for path, (_, body) in synthesise(n_companies=1, appointments=(2, 2), seed=3).items()
+                    if path.endswith("/appointments"))
+
+
+class ScriptedCursor:
+    """cursor answering the SELECT statements with the results scripted by the test, in order."""
+
+    def __init__(self, results, executed):
+        self.results = results
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        self.executed.append(args)
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+
+class ScriptedEngine:
+
+    def __init__(self, results):
+        self.results = results
+        self.executed = []
+        self.upserts = []
+
+    @contextmanager
+    def transaction(self):
+        yield self
+
+    def cursor(self):
+        return ScriptedCursor(self.results, self.executed)
+
+
+def stored_state(document):
+    """the results of the SELECT statements of DiffWriter for a document written before: columns, root, tables."""
+    _, rows = hashed_rows(plan_of(officerlist_params), document, COMPANY)
+    columns = [(table, column, None) for (table, _), (row_columns, _, _) in rows.items() for column in row_columns]
+    tables = {table: [] for table in plan_of(officerlist_params).keys()}
+    for n, ((table, key), (_, _, row_hash)) in enumerate(rows.items()):
+        tables[table].append((f"(0,{n})",) + key + (row_hash,))
+    return [sorted(set(columns)) + [("ol_items", "content_hash", None)],
+            [(COMPANY, rows[("officerlist", (COMPANY,))][2])], *tables.values()]
+
+
+def test_the_hashes_do_not_depend_on_the_order_of_the_keys():
+    reordered = dict(reversed(list(copy.deepcopy(OFFICERS).items())))
+    reordered["items"][0] = dict(reversed(list(reordered["items"][0].items())))
+
+    def hashes(document):
+        document_hash, rows = hashed_rows(plan_of(officerlist_params), document, COMPANY)
+        return document_hash, {key: row_hash for key, (_, _, row_hash) in rows.items()}
+
+    assert hashes(reordered) == hashes(OFFICERS)
+
+
+def test_an_unchanged_document_is_not_written(monkeypatch):
+    monkeypatch.setattr(json_inserter, "execute_values", lambda *args, **kwargs: None)
+    engine = ScriptedEngine(stored_state(OFFICERS)[:2])
+
+    writer = DiffWriter(db=engine)
+    writer.add(json=copy.deepcopy(OFFICERS), params=officerlist_params, uid_value=COMPANY)
+    writer.flush()
+
+    # the hash of the root row, the errors resolved, nothing else.
+    assert writer.stats == {"documents": 1, "unchanged": 1, "statements": 2, "rows": 0, "deleted": 0, "versions": 0,
+                            "closed": 0}
+    assert engine.results == []
+
+
+def test_only_the_rows_changed_are_written(monkeypatch):
+    engine = ScriptedEngine(None)
+    monkeypatch.setattr(json_inserter, "insert_query", lambda table, columns, p_key: table)
+    monkeypatch.setattr(json_inserter, "execute_values",
+                        lambda curs, table, rows, page_size: engine.upserts.append((table, len(rows))))
+
+    # the 2nd officer changes occupation, the 3rd resigned and is gone from the list.
+    changed = copy.deepcopy(OFFICERS)
+    changed["items"][1]["occupation"] = "Accountant"
+    del changed["items"][2]
+
+    # columns, root hash, then the rows of officerlist, ol_items and its children: the rows of the children of the 3rd
+    # officer are deleted with it (ON DELETE CASCADE) before they are read.
+    engine.results = stored_state(OFFICERS)
+    for result in engine.results[4:]:
+        result[:] = [row for row in result if row[2] != "3"]
+
+    writer = DiffWriter(db=engine)
+    writer.add(json=changed, params=officerlist_params, uid_value=COMPANY)
+    writer.flush()
+
+    assert engine.upserts == [("officerlist", 1), ("ol_items", 1)]
+    assert writer.stats["deleted"] == 1
+    assert writer.stats["rows"] == 2
+
+
+# the tables of officerlist_params with a history, in the order DiffWriter compares them: ol_items and its children.
+OL_HISTORY_TABLES = [table for table in HISTORY_TABLES if table in plan_of(officerlist_params).keys()]
+
+
+def current_versions(document, history_table="ol_items"):
+    """the result of the SELECT of the current versions of {table}_history, the document written with --history."""
+    _, rows = hashed_rows(plan_of(officerlist_params), document, COMPANY)
+    versions = [(key, row_hash) for (table, key), (columns, values, _) in rows.items() if table == history_table
+                for row_hash in [json_inserter.row_hash(table, columns, values)]]
+    return [(f"(0,{n})",) + key + (row_hash,) for n, (key, row_hash) in enumerate(versions)]
+
+
+def test_the_first_run_with_history_appends_the_current_versions(monkeypatch):
+    monkeypatch.setattr(json_inserter, "execute_values", lambda *args, **kwargs: None)
+    columns, root = stored_state(OFFICERS)[:2]
+    # no version of the officers (nor of their addresses...) in the history yet.
+    engine = ScriptedEngine([columns, root] + [[] for _ in OL_HISTORY_TABLES])
+
+    writer = DiffWriter(db=engine, history=True)
+    writer.add(json=copy.deepcopy(OFFICERS), params=officerlist_params, uid_value=COMPANY)
+    writer.flush()
+
+    # the document is unchanged: the tables are not written, its officers and their children are appended.
+    versions = sum(len(current_versions(OFFICERS, table)) for table in OL_HISTORY_TABLES)
+    assert versions > 3
+    assert writer.stats["unchanged"] == 1
+    assert writer.stats["rows"] == 0
+    assert (writer.stats["versions"], writer.stats["closed"]) == (versions, 0)
+    assert engine.results == []
+
+
+def test_the_versions_changed_or_gone_are_closed_and_the_new_ones_appended(monkeypatch):
+    engine = ScriptedEngine(None)
+    monkeypatch.setattr(json_inserter, "insert_query", lambda table, columns, p_key: table)
+    monkeypatch.setattr(json_inserter, "execute_values",
+                        lambda curs, table, rows, page_size: engine.upserts.append((table, len(rows))))
+
+    changed = copy.deepcopy(OFFICERS)
+    changed["items"][1]["occupation"] = "Accountant"
+    del changed["items"][2]
+
+    state = stored_state(OFFICERS)
+    for result in state[4:]:
+        result[:] = [row for row in result if row[2] != "3"]
+    engine.results = state[:2] + [current_versions(OFFICERS, table) for table in OL_HISTORY_TABLES] + state[2:]
+
+    writer = DiffWriter(db=engine, history=True)
+    writer.add(json=changed, params=officerlist_params, uid_value=COMPANY)
+    writer.flush()
+
+    # the versions of the 2nd and 3rd officers closed by one UPDATE of their ctid, the 2nd officer appended. The
+    # children of the 3rd officer are closed with it, those of the 2nd did not change.
+    children = sum(1 for table in OL_HISTORY_TABLES[1:] for row in current_versions(OFFICERS, table) if row[2] == "3")
+    assert ["(0,1)", "(0,2)"] in [args[0] for args in engine.executed if args and isinstance(args[0], list)]
+    assert ("ol_items_history", 1) in engine.upserts
+    assert (writer.stats["versions"], writer.stats["closed"]) == (1, 2 + children)
+    assert engine.upserts[-2:] == [("officerlist", 1), ("ol_items", 1)]
+
+
+def test_the_versions_of_a_company_not_found_any_more_are_closed(monkeypatch):
+    monkeypatch.setattr(json_inserter, "execute_values", lambda *args, **kwargs: None)
+    columns = stored_state(OFFICERS)[0]
+    current = [current_versions(OFFICERS, table) for table in OL_HISTORY_TABLES]
+    engine = ScriptedEngine([columns] + copy.deepcopy(current))
+
+    writer = DiffWriter(db=engine, history=True)
+    writer.add(json={"error": "not found"}, params=officerlist_params, uid_value=COMPANY)
+    writer.flush()
+
+    # the officers and their children as they were: every current version closed, nothing appended.
+    assert (writer.stats["versions"], writer.stats["closed"]) == (0, sum(map(len, current)))
+    assert engine.results == []
+
+
+def test_a_row_without_a_column_of_its_key_gets_its_default(monkeypatch):
+    engine = ScriptedEngine(None)
+    monkeypatch.setattr(json_inserter, "insert_query", lambda table, columns, p_key: (table, columns))
+    monkeypatch.setattr(json_inserter, "execute_values",
+                        lambda curs, query, rows, page_size: engine.upserts.append((query, rows)))
+
+    document = copy.deepcopy(APPOINTMENTS)
+    document["items"][0]["former_names"] = [{"surname": "SMITH"}]  # no forenames: DEFAULT 'not provided'.
+    url_id = document["links"]["self"]
+
+    # the columns of al_items_former_names with their defaults, then a document never written: nothing stored.
+    schema = [("al_items_former_names", column, default) for column, default in [
+        ("appointmentlist_url_id", None), ("appointment_serial_id", None),
+        ("forenames", "'not provided'::character varying"), ("surname", "'not provided'::character varying"),
+        ("content_hash", None)]]
+    engine.results = [schema, []] + [[] for _ in plan_of(appointmentlist_params).keys()]
+
+    writer = DiffWriter(db=engine)
+    writer.add(json=document, params=appointmentlist_params, uid_value=url_id)
+    writer.flush()
+
+    [(columns, rows)] = [(columns, rows) for (table, columns), rows in engine.upserts
+                         if table == "al_items_former_names"]
+    assert [dict(zip(columns, row))["forenames"] for row in rows] == ["not provided"]
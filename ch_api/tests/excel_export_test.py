@@ -0,0 +1,74 @@
+import datetime
+import re
+import zipfile
+
+from utils.excel_export import export_tables, sheet_name
+
+
+class FakeNamedCursor:
+    """named cursor of a fake connection, serving the rows of its table chunk by chunk."""
+
+    def __init__(self, tables, name, fetches):
+        self.tables = tables
+        self.name = name
+        self.fetches = fetches
+        self.rows = None
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        table = re.search(r"Identifier\('(\w+)'\)", repr(query)).group(1)
+        columns, self.rows = self.tables[table]
+        self.rows = list(self.rows)
+        self.description = [(column,) for column in columns]
+
+    def fetchmany(self, size):
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        self.fetches.append(len(chunk))
+        return chunk
+
+
+class FakeConnection:
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.fetches = []
+
+    def cursor(self, name=None):
+        assert name is not None  # the rows are streamed from the server, never read at once.
+        return FakeNamedCursor(self.tables, name, self.fetches)
+
+
+def sheets_of(path):
+    with zipfile.ZipFile(path) as xlsx:
+        workbook = xlsx.read("xl/workbook.xml").decode()
+        dimensions = [re.search(r'<dimension ref="([^"]+)"', xlsx.read(name).decode()).group(1)
+                      for name in sorted(xlsx.namelist(), key=lambda name: [int(n) for n in re.findall(r"\d+", name)])
+                      if name.startswith("xl/worksheets/sheet")]
+    return list(zip(re.findall(r'<sheet name="([^"]+)"', workbook), dimensions))
+
+
+def test_a_table_longer_than_a_sheet_goes_on_in_the_next_sheets(tmp_path):
+    rows = [("OC%06d" % n, n, datetime.date(2020, 1, 1), ["a", "b"]) for n in range(10)]
+    conn = FakeConnection({"ol_items": (["company_number", "officer_serial_id", "appointed_on", "names"], rows),
+                           "ol_items_address": (["company_number"], [])})
+    path = str(tmp_path / "ol.xlsx")
+
+    written = export_tables(conn, ["ol_items", "ol_items_address"], path, chunk_rows=3, max_rows=5)
+
+    assert written == {"ol_items": 10, "ol_items_address": 0}
+    # 4 rows and the header per sheet; an empty table gets its header.
+    assert sheets_of(path) == [("ol_items", "A1:D5"), ("ol_items_2", "A1:D5"), ("ol_items_3", "A1:D3"),
+                               ("ol_items_address", "A1")]
+    assert max(conn.fetches) == 3
+
+
+def test_the_sheet_names_fit_excel():
+    assert sheet_name("psc_items_natures_of_control", 1) == "psc_items_natures_of_control"
+    assert sheet_name("psc_items_natures_of_control", 12) == "psc_items_natures_of_control_12"
+    assert len(sheet_name("a_table_name_far_too_long_for_excel", 2)) == 31
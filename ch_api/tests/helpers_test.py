@@ -1 +1,14 @@
-# todo
\ No newline at end of file
+from utils.helpers import read_file_with_url_ids, dedupe_url_ids
+
+
+def test_read_file_with_url_ids_strips_quotes_and_spaces(tmp_path):
+    path = tmp_path / "url_file.txt"
+    path.write_text('OC399321,\n\nAWASDF23\n"",\n"OC323310  ", XXXXXXX\n\n"OC399321"\n')
+
+    assert read_file_with_url_ids(str(path)) == ["OC399321", "AWASDF23", "OC323310", "XXXXXXX", "OC399321"]
+
+
+def test_dedupe_url_ids_keeps_first_occurrence_in_order():
+    assert dedupe_url_ids(["OC399321", "LP016212", "OC399321", "OC323310", "LP016212"]) == ["OC399321", "LP016212",
+                                                                                          "OC323310"]
+    assert dedupe_url_ids([]) == []
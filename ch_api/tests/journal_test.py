@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+
+import utils.json_inserter as json_inserter
+from utils.journal import Journal
+from utils.json_inserter import BatchWriter
+from utils.json_params import psc_params
+
+
+class RecordingCursor:
+    """cursor keeping the statements executed instead of sending them to postgres."""
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        self.executed.append(args)
+
+
+class RecordingConnection:
+
+    def __init__(self):
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return RecordingCursor(self.executed)
+
+
+class RecordingEngine:
+    """stands in for MyDb: one connection, the transactions counted."""
+
+    def __init__(self):
+        self.conn = RecordingConnection()
+
+    @contextmanager
+    def transaction(self):
+        yield self.conn
+        self.conn.commits += 1
+
+
+def test_the_pairs_are_recorded_in_batches():
+    engine = RecordingEngine()
+    journal = Journal(db=engine, batch_size=3)
+
+    for n in range(7):
+        journal.record([("psc", f"SY00000{n}")])
+
+    # 2 statements of 3 pairs, the 7th waits for the next batch or the flush.
+    assert engine.conn.executed == [(["psc"] * 3, ["SY000000", "SY000001", "SY000002"]),
+                                    (["psc"] * 3, ["SY000003", "SY000004", "SY000005"])]
+    assert journal.pending == [("psc", "SY000006")]
+
+    journal.flush()
+    assert engine.conn.executed[-1] == (["psc"], ["SY000006"])
+    assert engine.conn.commits == 3
+
+
+def test_a_batch_is_recorded_in_its_own_transaction(monkeypatch):
+    monkeypatch.setattr(json_inserter, "execute_values", lambda curs, query, rows, page_size: curs.execute(query, rows))
+    engine = RecordingEngine()
+    journal = Journal(db=engine)
+    writer = BatchWriter(batch_size=10, db=engine, journal=journal)
+
+    writer.add(json={"items": [], "total_results": 0}, params=psc_params, uid_value="SY000001")
+    writer.add(json={"items": [], "total_results": 0}, params=psc_params, uid_value="SY000002")
+    writer.add(json={"items": [], "total_results": 0}, params=psc_params, uid_value="SY000001")
+    writer.flush()
+
+    # the upsert of the empty psc, then the journal, committed together; a JSON added twice is recorded once.
+    assert engine.conn.commits == 1
+    assert engine.conn.executed[-1] == (["psc", "psc"], ["SY000001", "SY000002"])
+    assert journal.pending == []
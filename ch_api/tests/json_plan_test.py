@@ -0,0 +1,13 @@
+from utils.helpers import flatten_nested_dicts_only as flatten
+from utils.json_params import psc_params
+from utils.json_plan import plan_of, flatten_into
+
+
+def test_flatten_into_flattens_like_the_helper():
+    d = {"a": 1, "b": "", "c": {"aa": 3, "bb": {"aaa": None}, "cc": {}}, "d": ["cant be unpacked"]}
+    assert flatten_into({}, d, drop=frozenset(["d"])) == flatten(d, drop=["d"])
+
+
+def test_the_plan_is_compiled_once():
+    assert plan_of(psc_params) is plan_of(psc_params)
+    assert [table for _, table, _, _, _ in plan_of(psc_params).arrays] == ["psc_items"]
@@ -0,0 +1,78 @@
+from collections import Counter
+
+from utils.key_pool import KeyPool, read_keys
+from utils.rate_limiter import SharedTokenBucket
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def calls_made_in(pool, clock, seconds):
+    """borrows keys as fast as the pool allows for n seconds of fake time, returns the calls made with each key."""
+    made = Counter()
+    while True:
+        key, wait = pool.acquire()
+        clock.now += wait
+        pool.release(key)
+        if clock.now > seconds:
+            return made
+        made[key] += 1
+
+
+def test_throughput_scales_with_number_of_keys():
+    clock = FakeClock()
+    one = calls_made_in(KeyPool(["a"], calls=600, period=300, clock=clock), clock, 600)
+    clock = FakeClock()
+    three = calls_made_in(KeyPool(["a", "b", "c"], calls=600, period=300, clock=clock), clock, 600)
+
+    assert sum(three.values()) == 3 * sum(one.values())
+    # least loaded selection spreads the calls evenly.
+    assert max(three.values()) - min(three.values()) <= 1
+
+
+def test_the_pools_of_several_processes_share_the_budget_of_the_keys():
+    clock = FakeClock()
+    alone = calls_made_in(KeyPool(["a"], calls=600, period=300, clock=clock), clock, 600)["a"]
+
+    # three workers, each with its own pool of the same key, sharing the bucket of the key.
+    clock = FakeClock()
+    shared = SharedTokenBucket(calls=600, period=300, clock=clock)
+    pools = [KeyPool(["a"], calls=600, period=300, clock=clock, shared=shared) for _ in range(3)]
+
+    made = 0
+    while clock.now <= 600:
+        pool = pools[made % 3]
+        key, wait = pool.acquire()
+        clock.now += wait
+        pool.release(key)
+        made += 1
+
+    # not 3 times the calls of one pool: all together they stay within the budget of the keys.
+    assert 0.9 * alone <= made <= 1.05 * alone
+
+
+def test_rejected_key_is_removed():
+    pool = KeyPool(["a", "b"], calls=600, period=300, clock=FakeClock())
+    pool.remove("a")
+
+    assert pool.keys() == ["b"]
+    assert {pool.acquire()[0] for _ in range(20)} == {"b"}
+
+    pool.remove("b")
+    try:
+        pool.acquire()
+        assert False, "an empty pool should raise PermissionError"
+    except PermissionError:
+        pass
+
+
+def test_read_keys(tmp_path):
+    path = tmp_path / "api_key"
+    path.write_text("key_1\n\n# old key\nkey_2  \nkey_1\n")
+    assert read_keys(str(path)) == ["key_1", "key_2"]
@@ -0,0 +1,59 @@
+import asyncio
+
+from utils import json_getter
+from utils.fetch_engine import AsyncFetcher
+from utils.json_getter import Getter, plan_pages, assemble_pages
+
+
+def make_resource(total_results, items_per_page):
+    """fake extractor serving "total_results" items "items_per_page" at a time, recording the pages requested."""
+    requested = []
+
+    def extractor(url_id, start_index):
+        requested.append(start_index)
+        return {"total_results": total_results,
+                "items_per_page": items_per_page,
+                "start_index": start_index,
+                "items": list(range(start_index, min(start_index + items_per_page, total_results)))}
+
+    return extractor, requested
+
+
+def test_plan_pages_skips_first_page_and_respects_cap():
+    assert plan_pages({"total_results": 10, "items_per_page": 35}) == []
+    assert plan_pages({"error": "not found"}) == []
+    assert plan_pages({"total_results": 288, "items_per_page": 50}) == [50, 100, 150, 200, 250]
+    assert plan_pages({"total_results": 2000, "items_per_page": 100}, pagination_cap=900) == list(range(100, 900, 100))
+
+
+def test_assemble_pages_keeps_order():
+    first = {"items": [1, 2]}
+    assert assemble_pages(first, [{"items": [3, 4]}, {"items": [5]}])["items"] == [1, 2, 3, 4, 5]
+
+
+def test_assemble_pages_returns_the_error_of_a_failed_page():
+    first = {"items": [1, 2], "total_results": 5}
+    assert assemble_pages(first, [{"items": [3, 4]}, {"error": "timeout"}]) == {"error": "timeout"}
+
+
+def test_extract_fetches_every_page_once_in_order(monkeypatch):
+    extractor, requested = make_resource(total_results=288, items_per_page=50)
+    monkeypatch.setattr(json_getter, "get_extractor", lambda name, items_per_page: extractor)
+
+    res, _, _ = Getter({"name": "appointmentlist", "items_per_page": 50}, "/officers/x/appointments").extract()
+
+    assert res["items"] == list(range(288))
+    assert sorted(requested) == [0, 50, 100, 150, 200, 250]
+
+
+def test_extract_async_fetches_every_page_once_in_order(monkeypatch):
+    extractor, requested = make_resource(total_results=1000, items_per_page=100)
+    monkeypatch.setattr(json_getter, "get_extractor", lambda name, items_per_page: extractor)
+
+    fetcher = AsyncFetcher(concurrency=4)
+    getter = Getter({"name": "officersearch", "items_per_page": 100, "pagination_cap": 900}, "smith")
+    res, _, _ = asyncio.run(getter.extract_async(fetcher))
+    fetcher.close()
+
+    assert res["items"] == list(range(900))
+    assert sorted(requested) == list(range(0, 900, 100))
@@ -0,0 +1,96 @@
+import datetime
+from decimal import Decimal
+from contextlib import contextmanager
+
+import pytest
+
+# (name, type OID) of the description of the cursor reading ol_items_history: varchar, int4, date, int8, timestamp.
+DESCRIPTION = [("company_number", 1043), ("officer_serial_id", 23), ("resigned_on", 1082), ("officer_role", 1043),
+               ("content_hash", 20), ("valid_from", 1114), ("valid_to", 1114)]
+
+
+class FakeNamedCursor:
+    """named cursor: the description is known once the first rows are fetched."""
+
+    def __init__(self, rows, description):
+        self.rows = rows
+        self.description = None
+        self._description = description
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        pass
+
+    def fetchmany(self, size):
+        self.description = self._description
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+
+class FakeEngine:
+
+    def __init__(self, rows, description=DESCRIPTION):
+        self.rows = rows
+        self.description = description
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    def cursor(self, name=None):
+        return FakeNamedCursor(list(self.rows), self.description)
+
+
+def test_a_table_is_written_in_row_groups_with_the_schema_of_its_columns(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from utils.parquet_export import export_table
+
+    rows = [("OC%06d" % n, n, datetime.date(2020, 1, 1) if n % 2 else None, "director", -n,
+             datetime.datetime(2021, 1, 1, 12), None) for n in range(25)]
+    path = str(tmp_path / "ol_items_history.parquet")
+
+    assert export_table(FakeEngine(rows), "ol_items_history", path, chunk_rows=4, row_group_rows=10) == 25
+
+    parquet = pq.ParquetFile(path)
+    assert [parquet.metadata.row_group(n).num_rows for n in range(parquet.num_row_groups)] == [10, 10, 5]
+    assert str(parquet.schema_arrow.field("officer_serial_id").type) == "int32"
+    assert str(parquet.schema_arrow.field("content_hash").type) == "int64"
+    assert str(parquet.schema_arrow.field("valid_to").type) == "timestamp[us]"  # all NULL, typed by the cursor.
+    assert parquet.read().column("company_number").to_pylist()[-1] == "OC000024"
+
+
+def test_an_empty_table_is_written_with_its_schema(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from utils.parquet_export import export_table
+
+    path = str(tmp_path / "ol_items_history.parquet")
+    assert export_table(FakeEngine([]), "ol_items_history", path) == 0
+    assert pq.ParquetFile(path).schema_arrow.names == [name for name, _ in DESCRIPTION]
+
+
+def test_the_numerics_are_decimals_and_the_timestamptz_are_utc(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from utils.parquet_export import export_table
+
+    # (name, type OID, display size, internal size, precision, scale, null ok): numeric(12, 4), numeric, timestamptz.
+    description = [("share", 1700, None, None, 12, 4, None), ("amount", 1700, None, None, None, None, None),
+                   ("fetched_at", 1184, None, None, None, None, None)]
+    paris = datetime.timezone(datetime.timedelta(hours=2))
+    rows = [(Decimal("0.2500"), Decimal("12345678901234567890.1"), datetime.datetime(2021, 6, 1, 14, tzinfo=paris)),
+            (None, None, None)]
+    path = str(tmp_path / "shares.parquet")
+
+    assert export_table(FakeEngine(rows, description), "shares", path) == 2
+
+    table = pq.read_table(path)
+    assert str(table.schema.field("share").type) == "decimal128(12, 4)"
+    assert str(table.schema.field("amount").type) == "string"  # no precision: any number of digits.
+    assert str(table.schema.field("fetched_at").type) == "timestamp[us, tz=UTC]"
+    assert table.column("share").to_pylist() == [Decimal("0.2500"), None]
+    assert table.column("amount").to_pylist()[0] == "12345678901234567890.1"
+    assert table.column("fetched_at").to_pylist()[0] == datetime.datetime(2021, 6, 1, 12, tzinfo=datetime.timezone.utc)
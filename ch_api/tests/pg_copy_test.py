@@ -0,0 +1,58 @@
+import csv
+import io
+
+from db.pg_engine import MyDb, copy_rows
+
+
+class RecordingCursor:
+    """cursor keeping the rows streamed by copy_expert() instead of sending them to postgres."""
+
+    def __init__(self):
+        self.copied = None
+        self.executed = []
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, args=None):
+        self.executed.append(repr(query))
+
+    def copy_expert(self, query, file):
+        self.copied = list(csv.reader(io.StringIO(file.read())))
+
+
+class RecordingConnection:
+
+    def __init__(self):
+        self.curs = RecordingCursor()
+
+    def cursor(self):
+        return self.curs
+
+
+def test_copy_rows_streams_none_as_null():
+    curs = RecordingCursor()
+    copy_rows(curs, "ol_items", ["company_number", "officer_serial_id", "name"],
+              [("SY000001", 1, "SMITH, Jane"), ("SY000001", 2, None)])
+
+    # csv: the quoted "SMITH, Jane" is one value, the unquoted empty field is NULL for COPY.
+    assert curs.copied == [["SY000001", "1", "SMITH, Jane"], ["SY000001", "2", ""]]
+
+
+def test_the_staging_table_has_the_defaults_of_the_table():
+    engine = MyDb.__new__(MyDb)  # no database.ini needed: the connection is passed.
+    conn = RecordingConnection()
+
+    # a former name with neither forenames nor surname: both in the primary key, DEFAULT 'not provided'.
+    engine.copy_merge("ol_items_former_names", ["company_number", "officer_serial_id"], [("SY000001", 1)],
+                      p_key=["company_number", "officer_serial_id", "forenames", "surname"], connection=conn)
+
+    create, merge, _ = conn.curs.executed
+    # staged without the DEFAULTs, the NULL forenames and surname would break the NOT NULL of the primary key.
+    assert "INCLUDING DEFAULTS" in create
+    assert "Identifier('forenames')" not in merge.split("SELECT")[0]  # the table fills them on INSERT too.
+    assert conn.curs.copied == [["SY000001", "1"]]
@@ -0,0 +1,27 @@
+import re
+
+from db import pg_tables
+from db.pg_migrations import MIGRATIONS, pending_migrations
+
+
+def test_migrations_are_numbered_once_in_order():
+    versions = [version for version, _, _, _ in MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+
+def test_the_tables_needed_by_the_migrations_are_created_by_pg_tables():
+    created = set(re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)", " ".join(
+        value for value in vars(pg_tables).values() if isinstance(value, str))))
+    for _, _, tables, _ in MIGRATIONS:
+        assert set(tables) <= created
+
+
+def test_a_migration_waits_for_its_tables_and_is_applied_once():
+    pending = pending_migrations(applied={1, 2}, tables={"psc", "psc_items"})
+    assert [version for version, _, _, _ in pending] == [5, 8, 13, 16]
+
+    # the --ol tables created by a later run.
+    pending = pending_migrations(applied={1, 2, 5, 8, 13, 16}, tables={"psc", "psc_items", "officerlist", "ol_items"})
+    assert [version for version, _, _, _ in pending] == [4, 9, 12, 15]
+
+    assert pending_migrations(applied={version for version, _, _, _ in MIGRATIONS}, tables={"ol_items"}) == []
@@ -0,0 +1,33 @@
+from db.pg_engine import MyDb, BlockingConnectionPool
+
+
+def make_config(tmp_path):
+    path = tmp_path / "database.ini"
+    path.write_text("[PostgreSQL]\nhost=localhost\ndatabase=ch\nuser=ch\npassword=secret\n")
+    return str(path)
+
+
+def test_engines_of_the_same_database_and_schema_share_one_pool(tmp_path):
+    config = make_config(tmp_path)
+
+    # minconn=0: the pool opens no connection until one is borrowed.
+    engine = MyDb(db_config_file=config, db_section_name="PostgreSQL", schema=None, minconn=0)
+    other_engine = MyDb(db_config_file=config, db_section_name="PostgreSQL", schema=None, minconn=0)
+
+    pool = engine.pool
+    assert isinstance(pool, BlockingConnectionPool)
+    assert other_engine.pool is pool
+
+    # once closed, the next query creates a new pool.
+    engine.close()
+    assert other_engine.pool is not pool
+    other_engine.close()
+
+
+def test_pooled_connections_are_opened_on_the_schema(tmp_path):
+    engine = MyDb(db_config_file=make_config(tmp_path), db_section_name="PostgreSQL", schema="ch 2020")
+
+    params = engine.pool_params()
+    assert params["options"] == '-c search_path="ch\\ 2020",public'
+    assert params["host"] == "localhost"
+    assert "options" not in engine.params
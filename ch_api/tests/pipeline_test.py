@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from utils.pipeline import ByteBoundedQueue, Pipeline, document_size
+
+
+class ListWriter:
+    """writer keeping the documents added, flushed ones apart."""
+
+    def __init__(self, written):
+        self.written = written
+        self.buffer = []
+
+    def add(self, json, params, uid_value=None):
+        self.buffer.append((params["name"], uid_value, json))
+
+    def flush(self):
+        self.written.extend(self.buffer)
+        self.buffer = []
+
+
+def test_put_waits_for_room_in_bytes():
+    queue = ByteBoundedQueue(max_bytes=10)
+    assert queue.put("a", size=6)
+
+    put_done = threading.Event()
+    threading.Thread(target=lambda: queue.put("b", size=6) and put_done.set(), daemon=True).start()
+    assert not put_done.wait(0.2)  # 12 bytes would not fit.
+
+    assert queue.get() == "a"
+    assert put_done.wait(1)
+    assert queue.bytes == 6
+
+    queue.close()
+    assert queue.get() == "b"
+    assert queue.get() is None
+
+
+def test_an_item_larger_than_the_bound_goes_through_an_empty_queue():
+    queue = ByteBoundedQueue(max_bytes=10)
+    assert queue.put("big", size=100)
+    assert queue.stats["peak_bytes"] == 100
+
+
+def test_all_the_documents_are_written_once():
+    params = {"name": "companyprofile"}
+    jobs = [(params, f"SY{n:06d}") for n in range(200)]
+    written = []
+
+    def fetch(job):
+        time.sleep(0.001)
+        return {"company_number": job[1]}
+
+    pipeline = Pipeline(fetch=fetch, open_writer=lambda: ListWriter(written), fetchers=4, writers=3,
+                        max_bytes=10 * document_size({"company_number": "SY000000"}))
+    stats = pipeline.run(jobs)
+
+    assert sorted(uid_value for _, uid_value, _ in written) == [url_id for _, url_id in jobs]
+    assert stats["fetched"] == stats["written"] == 200
+    assert pipeline.queue.stats["peak_items"] <= 10
+    assert len(pipeline.open_writers) == 3
+    assert "bottleneck" in pipeline.report()
+
+
+def test_the_error_of_a_stage_stops_the_pipeline():
+    params = {"name": "psc"}
+
+    def fetch(job):
+        if job[1] == "SY000013":
+            raise ValueError("no json")
+        return {}
+
+    pipeline = Pipeline(fetch=fetch, open_writer=lambda: ListWriter([]), fetchers=2, writers=1)
+    with pytest.raises(ValueError):
+        pipeline.run((params, f"SY{n:06d}") for n in range(10 ** 6))
+    assert pipeline.stats["fetched"] < 10 ** 6
@@ -0,0 +1,141 @@
+import asyncio
+import copy
+import importlib
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from row_writer_test import RecordingDb
+from utils.api_functions import PERMANENT_ERRORS
+from utils.request_coalescer import RequestCoalescer
+from utils.json_params import psc_params, officerlist_params
+
+# rows of the *_http_errors tables: (table, id_item_queried, error).
+HTTP_ERRORS = [("psc_http_errors", "SY000001", "server error 503"),
+               ("psc_http_errors", "SY000002", "not found"),
+               ("officerlist_http_errors", "SY000003", "timeout"),
+               ("officerlist_http_errors", "SY000004", "bad request")]
+
+
+@pytest.fixture(scope="module")
+def prog():
+    """prog.py parses its command line when imported."""
+    argv, sys.argv = sys.argv, ["prog.py", "url_file.txt", "--psc", "--ol"]
+    try:
+        return importlib.import_module("prog")
+    finally:
+        sys.argv = argv
+
+
+def select_errors(query, data):
+    """the SELECT of failed_jobs on HTTP_ERRORS: the url_ids of the table whose error is not in the 1st parameter."""
+    return [(url_id,) for table, url_id, error in HTTP_ERRORS
+            if f"Identifier('{table}')" in query and error not in data[0]]
+
+
+def test_retry_failed_keeps_the_errors_which_can_be_retried(prog):
+    engine = RecordingDb(rows=select_errors)
+    jobs = [(params, f"SY00000{n}") for n in range(5) for params in (psc_params, officerlist_params)]
+
+    assert prog.failed_jobs(engine, jobs) == [(psc_params, "SY000001"), (officerlist_params, "SY000003")]
+    # the errors the API would return again are not retried.
+    assert all(data == [list(PERMANENT_ERRORS)] for _, data in engine.executed)
+
+
+class StubGetter:
+    """Getter answering every job with an empty list, without calling the API."""
+
+    def __init__(self, json_params, url_id):
+        self.json_params, self.url_id = json_params, url_id
+
+    async def extract_async(self, fetcher):
+        return {"total_results": 0}, self.json_params, self.url_id
+
+
+class ThreadRecordingWriter:
+
+    def __init__(self, fail_after=None):
+        self.threads = []
+        self.fail_after = fail_after
+
+    def add(self, json, params, uid_value=None):
+        if len(self.threads) == self.fail_after:
+            raise ValueError("write failed")
+        self.threads.append(threading.current_thread())
+
+
+def test_the_concurrent_writes_run_off_the_event_loop_and_the_fetcher_is_closed(prog, monkeypatch):
+    closed = []
+
+    class ClosingFetcher(prog.AsyncFetcher):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    monkeypatch.setattr(prog, "Getter", StubGetter)
+    monkeypatch.setattr(prog, "AsyncFetcher", ClosingFetcher)
+    jobs = [(psc_params, f"SY00000{n}") for n in range(5)]
+
+    writer = ThreadRecordingWriter()
+    asyncio.run(prog.extract_and_insert_concurrently(jobs, concurrency=3, writer=writer))
+    assert len(writer.threads) == 5
+    assert threading.main_thread() not in writer.threads
+    assert len(closed) == 1
+
+    with pytest.raises(ValueError):
+        asyncio.run(prog.extract_and_insert_concurrently(jobs, concurrency=3, writer=ThreadRecordingWriter(2)))
+    assert len(closed) == 2
+
+
+class InlineExecutor:
+    """stands in for the ProcessPoolExecutor of run_in_workers: the shards are run one after the other, here."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+def test_the_api_stats_of_the_workers_are_reported_by_the_parent(prog, monkeypatch):
+    worker_stats = {"coalescer": {"calls": 3, "coalesced": 1},
+                    "cache": {"hits": 2, "revalidated": 1, "misses": 4, "evicted": 0}}
+    monkeypatch.setattr(prog, "ProcessPoolExecutor", InlineExecutor)
+    monkeypatch.setattr(prog, "run_shard", lambda args, jobs: (len(jobs), 1.0, copy.deepcopy(worker_stats)))
+    monkeypatch.setattr(prog, "COALESCER", RequestCoalescer())
+    cache = SimpleNamespace(stats={"hits": 0, "revalidated": 0, "misses": 0, "evicted": 0})
+
+    args = SimpleNamespace(workers=2, api_base_url=None, cache=True)
+    prog.run_in_workers(args, [(psc_params, f"SY00000{n}") for n in range(4)], cache=cache)
+
+    assert prog.COALESCER.stats == {"calls": 6, "coalesced": 2}
+    assert cache.stats == {"hits": 4, "revalidated": 2, "misses": 8, "evicted": 0}
+
+
+class DoneJournal:
+
+    def __init__(self, done):
+        self._done = done
+
+    def done(self):
+        return set(self._done)
+
+
+def test_a_retry_pass_resumed_calls_again_the_errors_it_has_not_fixed(prog):
+    # --retry-failed --resume: the pass retried SY000001 and SY000003, SY000001 succeeded and is journaled, the error
+    # of SY000003 is still in officerlist_http_errors and not journaled.
+    args = prog.parser.parse_args(["url_file.txt", "--psc", "--ol", "--retry-failed", "--resume"])
+    assert args.retry_failed and args.resume
+
+    jobs = [(params, f"SY00000{n}") for n in range(5) for params in (psc_params, officerlist_params)]
+    jobs = prog.failed_jobs(RecordingDb(rows=select_errors), jobs)
+
+    assert prog.resumed_jobs(DoneJournal({("psc", "SY000001")}), jobs) == [(officerlist_params, "SY000003")]
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import multiprocessing
+import time
+
+from utils.fetch_engine import AsyncFetcher
+from utils.rate_limiter import AdaptiveLimiter, SharedTokenBucket
+
+
+class FakeClock:
+    """clock whose time only moves when the test says so."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_never_exceeds_calls_in_any_window():
+    clock = FakeClock()
+    bucket = SharedTokenBucket(calls=600, period=300, burst=10, clock=clock)
+
+    timestamps = []
+    for _ in range(3000):
+        clock.sleep(bucket.reserve())
+        timestamps.append(clock.now)
+
+    # sliding window over all the calls made: never more than 600 in 300 seconds.
+    start = 0
+    for end, t in enumerate(timestamps):
+        while timestamps[start] <= t - 300:
+            start += 1
+        assert end - start + 1 <= 600
+
+    # and the bucket does not leave budget unused: 3000 calls take ~(3000 - 10) / 2 seconds.
+    assert timestamps[-1] <= (3000 - 10) / ((600 - 10) / 300) + 1
+
+
+def take_tokens(bucket, n, timestamps):
+    for _ in range(n):
+        bucket.acquire()
+        timestamps.put(time.monotonic())
+
+
+def test_shared_token_bucket_is_shared_across_processes():
+    bucket = SharedTokenBucket(calls=20, period=2, burst=5)
+    timestamps = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=take_tokens, args=(bucket, 8, timestamps)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    calls = sorted(timestamps.get(timeout=30) for _ in range(24))
+    for process in processes:
+        process.join()
+
+    # 24 calls of 3 processes: 5 at once, then 7.5 calls/s shared, whatever the number of processes.
+    assert calls[-1] - calls[0] >= (24 - 5) / 7.5 - 0.1
+    start = 0
+    for end, t in enumerate(calls):
+        while calls[start] <= t - 2:
+            start += 1
+        assert end - start + 1 <= 20
+
+
+def test_async_fetcher_keeps_calls_in_flight():
+
+    def slow_call(x):
+        time.sleep(0.05)
+        return x * 2
+
+    fetcher = AsyncFetcher(concurrency=10)
+
+    async def run():
+        return [pair async for pair in fetcher.imap_unordered(lambda x: fetcher.run(slow_call, x), range(40))]
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    fetcher.close()
+
+    assert sorted(results) == [(x, x * 2) for x in range(40)]
+    assert elapsed < 40 * 0.05 / 2  # serially it would take 2 seconds.
+
+
+# simulated-clock harness for the AdaptiveLimiter: a CH like API counting the calls in fixed windows, queried by n
+# workers sharing one limiter, with a network latency. Measures the share of the quota used and the 429s received.
+
+class SimulatedApi:
+    """fixed windows of "limit" calls every "window" seconds, the first window ends at "first_reset"."""
+
+    def __init__(self, limit=600, window=300, first_reset=300.0, used=0):
+        self.limit = limit
+        self.window = window
+        self.reset = first_reset
+        self.used = used  # calls made in the current window by someone else before the simulation starts.
+        self.served = 0
+        self.throttled = 0
+
+    def call(self, now):
+        while now >= self.reset:
+            self.reset += self.window
+            self.used = 0
+
+        if self.used >= self.limit:
+            self.throttled += 1
+            status = 429
+        else:
+            self.used += 1
+            self.served += 1
+            status = 200
+
+        return status, {"X-Ratelimit-Limit": str(self.limit),
+                        "X-Ratelimit-Remaining": str(self.limit - self.used),
+                        "X-Ratelimit-Reset": str(self.reset),
+                        "X-Ratelimit-Window": f"{self.window // 60}m"}
+
+
+def simulate(api, duration, workers=8, latency=0.3):
+    """runs the workers until "duration" on a simulated clock, returns the limiter used."""
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(calls=600, period=300, clock=clock)
+
+    # events: (time, sequence, worker, kind), a worker books a call, the server receives it, the response arrives.
+    events = [(0.0, n, n, "book") for n in range(workers)]
+    sequence = workers
+    responses = {}
+
+    while events:
+        now, _, worker, kind = heapq.heappop(events)
+        clock.now = now
+        if now > duration:
+            break
+
+        if kind == "book":
+            at, kind = now + limiter.reserve(), "send"
+        elif kind == "send":
+            at, kind = now + latency / 2, "serve"
+        elif kind == "serve":
+            responses[worker] = api.call(now)
+            at, kind = now + latency / 2, "answer"
+        else:
+            status, headers = responses.pop(worker)
+            limiter.update(headers, status_code=status)
+            limiter.release()
+            at, kind = now, "book"
+
+        sequence += 1
+        heapq.heappush(events, (at, sequence, worker, kind))
+
+    return limiter
+
+
+def test_adaptive_limiter_uses_the_whole_quota_without_429():
+    api = SimulatedApi(first_reset=300.0)
+    simulate(api, duration=3 * 300 - 1)
+
+    assert api.throttled == 0
+    assert api.served / (3 * 600) > 0.97
+
+
+def test_adaptive_limiter_follows_the_budget_reported_by_the_server():
+    # we start 100 seconds before the reset, another client already used 450 calls of this window.
+    api = SimulatedApi(first_reset=100.0, used=450)
+    simulate(api, duration=100 + 2 * 300 - 1)
+
+    assert api.throttled <= 8  # at most the calls in flight before the first response is received.
+    assert api.served / (150 + 2 * 600) > 0.97
+
+
+def test_adaptive_limiter_sleeps_exactly_until_reset_on_429():
+    clock = FakeClock()
+    clock.now = 1000.0
+    limiter = AdaptiveLimiter(calls=600, period=300, clock=clock)
+
+    limiter.reserve()
+    limiter.update({"X-Ratelimit-Remaining": "0", "X-Ratelimit-Reset": "1042.5", "X-Ratelimit-Window": "5m"},
+                   status_code=429)
+    limiter.release()
+
+    assert limiter.reserve() == 42.5
+
+
+def test_adaptive_limiter_waits_for_retry_after_on_429_without_headers():
+    clock = FakeClock()
+    clock.now = 1000.0
+    limiter = AdaptiveLimiter(calls=600, period=300, clock=clock)
+
+    limiter.reserve()
+    limiter.update({"Retry-After": "7"}, status_code=429)
+    limiter.release()
+    assert limiter.reserve() == 7
+
+    clock.now = 2000.0
+    limiter.update({}, status_code=429)  # no hint at all: a whole window.
+    assert limiter.reserve() == 300
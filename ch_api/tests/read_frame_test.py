@@ -0,0 +1,85 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+from db.pg_engine import MyDb, frame_from_csv
+
+# (name, type OID) of the description of a cursor: varchar, int4, date, bool, numeric.
+DESCRIPTION = [("company_number", 1043), ("officer_serial_id", 23), ("appointed_on", 1082), ("is_pre_1992", 16),
+               ("share", 1700)]
+
+
+def test_the_columns_get_the_dtypes_of_their_types():
+    csv = b"00012345,1,2020-01-31,t,0.25\nNA,\\N,\\N,f,\\N\n"
+    frame = frame_from_csv(io.BytesIO(csv), DESCRIPTION)
+
+    assert str(frame.dtypes["officer_serial_id"]) == "Int32"
+    assert str(frame.dtypes["appointed_on"]).startswith("datetime64")
+    # the company numbers keep their zeros and "NA" is not NULL; NULL is \N.
+    assert frame["company_number"].tolist() == ["00012345", "NA"]
+    assert frame["officer_serial_id"].isna().tolist() == [False, True]
+    assert frame["is_pre_1992"].tolist() == [True, False]
+    assert frame["share"].tolist() == [Decimal("0.25"), None]
+
+
+def test_an_empty_string_is_not_null_and_a_numeric_is_exact():
+    csv = b'"",1,2020-01-31,t,12345678901234567890.123456789\n\\N,1,2020-01-31,t,0.1\n'
+    frame = frame_from_csv(io.BytesIO(csv), DESCRIPTION)
+
+    assert frame["company_number"].tolist()[0] == ""
+    assert frame["company_number"].isna().tolist() == [False, True]
+    assert frame["share"].tolist() == [Decimal("12345678901234567890.123456789"), Decimal("0.1")]
+
+
+class FakeCursor:
+
+    def __init__(self, executed):
+        self.executed = executed
+        self.description = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, query, args=None):
+        return (query % tuple(f"'{arg}'" for arg in args) if args else query).encode()
+
+    def execute(self, query, args=None):
+        self.executed.append(query)
+        self.description = DESCRIPTION
+
+    def copy_expert(self, query, file):
+        self.executed.append(query)
+        file.write(b"OC399321,2,1991-05-01,t,1\n")
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+
+def test_a_query_is_read_with_copy():
+    engine = MyDb.__new__(MyDb)  # no database.ini needed: the connection is passed.
+    conn = FakeConnection()
+
+    frame = engine.read_frame(query="SELECT * FROM ol_items WHERE company_number = %s", args=("OC399321",),
+                              connection=conn)
+
+    assert conn.executed == [b"SELECT * FROM (SELECT * FROM ol_items WHERE company_number = 'OC399321') AS q LIMIT 0",
+                             b"COPY (SELECT * FROM ol_items WHERE company_number = 'OC399321') TO STDOUT WITH "
+                             b"(FORMAT csv, NULL '\\N')"]
+    assert frame.shape == (1, 5)
+    assert frame["officer_serial_id"].tolist() == [2]
+
+
+def test_either_a_table_or_a_query():
+    engine = MyDb.__new__(MyDb)
+    with pytest.raises(ValueError):
+        engine.read_frame(table="ol_items", query="SELECT 1", connection=FakeConnection())
@@ -0,0 +1,69 @@
+from utils.response_cache import ResponseCache, normalise_url, resource_of, DAY
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_normalise_url():
+    assert (normalise_url("HTTPS://API.companieshouse.gov.uk/company/OC399321/officers/?start_index=0&items_per_page=100")
+            == "https://api.companieshouse.gov.uk/company/OC399321/officers?items_per_page=100&start_index=0")
+
+
+def test_resource_of():
+    assert resource_of("https://api.companieshouse.gov.uk/company/OC399321") == "company"
+    assert resource_of("https://api.companieshouse.gov.uk/company/OC399321/persons-with-significant-control"
+                       "?items_per_page=100") == "persons-with-significant-control"
+    assert resource_of("https://api.companieshouse.gov.uk/officers/RY_RJjPR0uGi0pOJuJi7dyCCTzo/appointments") == "appointments"
+
+
+def test_fresh_stale_and_revalidated(tmp_path):
+    clock = FakeClock()
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite"), ttl={"company": DAY}, clock=clock)
+    url = "https://api.companieshouse.gov.uk/company/OC399321"
+
+    assert cache.lookup(url) is None
+    cache.store(url, body=b'{"etag": "abc"}', etag="abc")
+
+    assert cache.lookup(url).fresh
+
+    clock.now += 2 * DAY
+    cached = cache.lookup(url)
+    assert not cached.fresh and cached.etag == "abc"
+
+    cache.revalidated(url)
+    assert cache.lookup(url).fresh
+    assert cache.stats == {"hits": 2, "revalidated": 1, "misses": 1, "evicted": 0}
+
+
+def test_least_recently_used_are_evicted(tmp_path):
+    clock = FakeClock()
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite"), max_bytes=1000, clock=clock)
+    urls = [f"https://api.companieshouse.gov.uk/company/OC{n:06d}" for n in range(10)]
+
+    for url in urls:
+        clock.now += 1
+        cache.store(url, body=b"x" * 200)
+        clock.now += 0.5
+        cache.lookup(urls[0])  # keeps the 1st url as most recently used.
+
+    assert cache.lookup(urls[0]) is not None
+    assert cache.lookup(urls[-1]) is not None
+    assert cache.lookup(urls[1]) is None
+    assert cache.stats["evicted"] > 0
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    url = "https://api.companieshouse.gov.uk/company/OC399321"
+
+    cache = ResponseCache(path=path)
+    cache.store(url, body=b"{}")
+    cache.close()
+
+    assert ResponseCache(path=path).lookup(url).body == b"{}"
@@ -0,0 +1,135 @@
+import copy
+from contextlib import contextmanager
+
+import psycopg2
+
+import utils.json_inserter as json_inserter
+from db.pg_engine import MyDb
+from stub.fixtures import synthesise
+from utils.json_inserter import RowWriter
+from utils.json_params import psc_params
+
+COMPANY = "SY000000"
+PSC = synthesise(n_companies=1, pscs=(2, 2), seed=3)[f"/company/{COMPANY}/persons-with-significant-control"][1]
+
+
+class RecordingCursor:
+    """cursor recording the statements composed by MyDb.execute: (repr of the query, data)."""
+
+    def __init__(self, executed, rows, fail=None):
+        self.executed = executed
+        self.rows = rows
+        self.fail = fail
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, data=None):
+        if self.fail is not None and self.fail(repr(query)):
+            raise psycopg2.DataError(f"statement failed: {query!r}")
+        self.executed.append((repr(query), data))
+
+    def fetchall(self):
+        # rows may be a function of the last statement: (query, data) -> rows.
+        return self.rows(*self.executed[-1]) if callable(self.rows) else self.rows
+
+
+class RecordingConnection:
+
+    def __init__(self, executed, rows, fail=None):
+        self.executed = executed
+        self.rows = rows
+        self.fail = fail
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return RecordingCursor(self.executed, self.rows, self.fail)
+
+
+class RecordingPool:
+
+    def __init__(self, executed, rows, fail=None):
+        self.executed = executed
+        self.rows = rows
+        self.fail = fail
+
+    def getconn(self):
+        return RecordingConnection(self.executed, self.rows, self.fail)
+
+    def putconn(self, conn):
+        pass
+
+
+class RecordingDb(MyDb):
+    """MyDb running its own execute() (checks of the arguments included) on connections recording the statements."""
+
+    def __init__(self, rows=None, fail=None):
+        """:param fail: function of the repr of a query, the statements for which it is true raise a DataError."""
+        self.executed = []
+        self.rows = [] if rows is None else rows
+        self.recording_pool = RecordingPool(self.executed, self.rows, fail)
+
+    @property
+    def pool(self):
+        return self.recording_pool
+
+
+def test_a_document_written_clears_its_http_error(monkeypatch):
+    engine = RecordingDb()
+    monkeypatch.setattr(json_inserter, "engine", engine)
+
+    writer = RowWriter()
+    writer.add(json=copy.deepcopy(PSC), params=psc_params, uid_value=COMPANY)
+
+    deletes = [data for query, data in engine.executed if "DELETE" in query and "psc_http_errors" in query]
+    assert deletes == [[COMPANY]]
+    assert writer.stats["documents"] == 1
+
+
+class RecordingJournal:
+
+    def __init__(self):
+        self.recorded = []
+
+    def record(self, pairs):
+        self.recorded.extend(pairs)
+
+    def flush(self):
+        pass
+
+
+def test_only_the_documents_written_are_journaled(monkeypatch):
+    journal = RecordingJournal()
+    writer = RowWriter(journal=journal)
+
+    # a PSC too long for its column: the error is printed by MyDb.execute, the document is not journaled.
+    monkeypatch.setattr(json_inserter, "engine", RecordingDb(fail=lambda query: "'psc_items'" in query))
+    writer.add(json=copy.deepcopy(PSC), params=psc_params, uid_value=COMPANY)
+
+    monkeypatch.setattr(json_inserter, "engine", RecordingDb())
+    writer.add(json=copy.deepcopy(PSC), params=psc_params, uid_value=COMPANY)
+
+    assert journal.recorded == [("psc", COMPANY)]
+    assert writer.stats == {"documents": 1, "failed": 1}
+
+
+def test_the_errors_of_the_api_are_not_journaled(monkeypatch):
+    engine = RecordingDb()
+    monkeypatch.setattr(json_inserter, "engine", engine)
+    journal = RecordingJournal()
+    writer = RowWriter(journal=journal)
+
+    # written to psc_http_errors, but called again by --resume.
+    writer.add(json={"error": "server error 503"}, params=psc_params, uid_value=COMPANY)
+
+    assert any("psc_http_errors" in query for query, _ in engine.executed)
+    assert journal.recorded == []
+    assert writer.stats == {"documents": 1, "failed": 0}
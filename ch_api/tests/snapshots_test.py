@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import re
+import zipfile
+
+import pytest
+
+from db.pg_tables import companyprofile_tables, psc_tables, officerlist_tables, appointmentlist_tables
+from stub.fixtures import synthesise
+from utils.json_params import companyprofile_params, psc_params, officerlist_params, appointmentlist_params
+from utils.bulk_ingest import BulkLoader
+from utils.json_plan import plan_of
+from utils.snapshots import read_basic_company_data, read_psc_snapshot
+
+HEADER = ("CompanyName, CompanyNumber,RegAddress.CareOf,RegAddress.POBox,RegAddress.AddressLine1, "
+          "RegAddress.AddressLine2,RegAddress.PostTown,RegAddress.County,RegAddress.Country,RegAddress.PostCode,"
+          "CompanyCategory,CompanyStatus,CountryOfOrigin,DissolutionDate,IncorporationDate,Accounts.AccountRefDay,"
+          "Accounts.AccountRefMonth,Accounts.NextDueDate,Accounts.LastMadeUpDate,Accounts.AccountCategory,"
+          "Returns.NextDueDate,Returns.LastMadeUpDate,Mortgages.NumMortCharges,Mortgages.NumMortOutstanding,"
+          "Mortgages.NumMortPartSatisfied,Mortgages.NumMortSatisfied,SICCode.SicText_1,SICCode.SicText_2,"
+          "SICCode.SicText_3,SICCode.SicText_4,LimitedPartnerships.NumGenPartners,"
+          "LimitedPartnerships.NumLimPartners,URI,PreviousName_1.CONDATE, PreviousName_1.CompanyName,"
+          " PreviousName_2.CONDATE, PreviousName_2.CompanyName,ConfStmtNextDueDate, ConfStmtLastMadeUpDate")
+
+ROW = ('"ELEBEX LP",LP016212,"","","1 MAIN STREET","","LONDON","","UNITED KINGDOM","EC1A 1BB",'
+       '"Limited Partnership","Active","United Kingdom","","03/02/2015","31","12","31/12/2020","31/03/2019",'
+       '"TOTAL EXEMPTION FULL","","","2","1","0","1","70229 - Management consultancy","None Supplied","","","1","2",'
+       'http://business.data.gov.uk/id/company/LP016212,12/05/2018,"ELEBEX TWO LP",01/01/2016,"ELEBEX ONE LP",'
+       '17/02/2021,03/02/2020')
+
+
+def table_columns(*create_stmts):
+    """{table: set of columns} parsed from the create statements of db/pg_tables.py."""
+    columns = {}
+    for stmt in create_stmts:
+        for table, body in re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)\s*\((.*?)\);", stmt, flags=re.S):
+            columns[table] = {line.split()[0] for line in body.splitlines()
+                              if line.strip() and not line.strip().startswith(("--", "PRIMARY", "FOREIGN", "REFERENCES",
+                                                                               "ON DELETE", "ON UPDATE"))}
+    return columns
+
+
+def rows_of(document, params, uid_value):
+    """the rows of a document normalised by the plan of its params: [(table, {column: value}), ...]."""
+    return [(table, dict(zip(columns, values)))
+            for table, groups in plan_of(params).rows(document, uid_value=uid_value).items()
+            for columns, values_list in groups.items() for values in values_list]
+
+
+def test_basic_company_data_rows_map_onto_the_companyprofile_tables(tmp_path):
+    path = tmp_path / "BasicCompanyData.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("BasicCompanyData.csv", HEADER + "\n" + ROW + "\n")
+
+    [document] = list(read_basic_company_data(str(path)))
+    assert document["type"] == "limited-partnership"
+    assert document["date_of_creation"] == "2015-02-03"
+    assert document["sic_codes"] == ["70229"]
+    assert document["previous_company_names"] == [
+        {"name": "ELEBEX TWO LP", "ceased_on": "2018-05-12", "effective_from": "2016-01-01"},
+        {"name": "ELEBEX ONE LP", "ceased_on": "2016-01-01", "effective_from": "2015-02-03"}]
+
+    rows = rows_of(document, companyprofile_params, uid_value="LP016212")
+    columns = table_columns(companyprofile_tables)
+    for table, row in rows:
+        assert set(row) <= columns[table], table
+    assert dict(rows)["cp_accounts"]["last_accounts_type"] == "total-exemption-full"
+    assert ("cp_sic_codes", {"company_number": "LP016212", "sic_codes": "70229"}) in rows
+
+
+def test_psc_snapshot_is_grouped_by_company(tmp_path):
+    psc = synthesise(n_companies=3, pscs=(2, 2))
+    lines = [json.dumps({"company_number": path.split("/")[2], "data": item})
+             for path, (status, body) in sorted(psc.items()) if path.endswith("control") for item in body["items"]]
+    lines.insert(1, json.dumps({"company_number": "SY000000",
+                                "data": {"kind": "persons-with-significant-control-statement"}}))
+    lines.append(json.dumps({"data": {"kind": "totals#persons-of-significant-control-snapshot"}}))
+    path = tmp_path / "psc.txt"
+    path.write_text("\n".join(lines))
+
+    documents = list(read_psc_snapshot(str(path)))
+    assert [document["company_number"] for document in documents] == ["SY000000", "SY000001", "SY000002"]
+    assert all(document["total_results"] == len(document["items"]) == 2 for document in documents)
+
+    rows = rows_of(documents[0], psc_params, uid_value="SY000000")
+    columns = table_columns(psc_tables)
+    for table, row in rows:
+        assert set(row) <= columns[table], table
+    assert [row["psc_serial_id"] for table, row in rows if table == "psc_items"] == [1, 2]
+
+
+def test_psc_snapshot_with_a_company_not_contiguous_is_rejected(tmp_path):
+    psc = synthesise(n_companies=2, pscs=(2, 2))
+    lines = [json.dumps({"company_number": path.split("/")[2], "data": item})
+             for path, (status, body) in sorted(psc.items()) if path.endswith("control") for item in body["items"]]
+    lines.append(lines.pop(1))  # SY000000, SY000001, SY000001, SY000000.
+    path = tmp_path / "psc.txt"
+    path.write_text("\n".join(lines))
+
+    documents = read_psc_snapshot(str(path))
+    assert [next(documents)["company_number"], next(documents)["company_number"]] == ["SY000000", "SY000001"]
+    # its 2nd psc would replace the 1st one.
+    with pytest.raises(ValueError, match="SY000000"):
+        next(documents)
+
+
+def test_the_plans_follow_the_table_names_of_the_inserter():
+    fixtures = synthesise(n_companies=2, seed=3)
+    columns = table_columns(officerlist_tables, appointmentlist_tables)
+
+    for path, (status, body) in fixtures.items():
+        if path.endswith("/officers"):
+            params, uid_value = officerlist_params, path.split("/")[2]
+        elif path.endswith("/appointments"):
+            params, uid_value = appointmentlist_params, path
+        else:
+            continue
+
+        rows = rows_of(body, params, uid_value=uid_value)
+        assert rows[0][0] == params["name"]
+        for table, row in rows:
+            assert set(row) <= columns[table], table
+
+        # the former names are keyed by their own forenames and surname, not by a serial.
+        former_names = [element for item in body["items"] for element in item.get("former_names", [])]
+        assert [(row["forenames"], row["surname"]) for table, row in rows if table.endswith("_former_names")] == \
+               [(element["forenames"], element["surname"]) for element in former_names]
+
+
+class CopyingConnection:
+    """connection answering the query of the columns of the tables and recording the COPY: {table: [row, ...]}."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.copied = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, args=None):
+        pass
+
+    def fetchall(self):
+        return [(table, column, None) for table, columns in self.columns.items() for column in sorted(columns)]
+
+    def copy_expert(self, query, file):
+        table = re.search(r"Identifier\('(\w+)'\)", repr(query)).group(1)
+        fields = re.findall(r"Identifier\('(\w+)'\)", repr(query))[1:]
+        self.copied.setdefault(table, []).extend(dict(zip(fields, row)) for row in csv.reader(io.StringIO(file.read())))
+
+
+def test_the_bulk_loader_copies_the_rows_of_the_plans():
+    fixtures = synthesise(n_companies=3, pscs=(2, 2), seed=2)
+    documents = [dict(body, company_number=path.split("/")[2]) for path, (status, body) in sorted(fixtures.items())
+                 if path.endswith("control") and status == 200]
+    del documents[0]["items"][1]["nationality"]  # the rows of psc_items do not all have the same columns.
+
+    conn = CopyingConnection(table_columns(psc_tables))
+    loader = BulkLoader(connection=conn, params=psc_params)
+    loader.load_batch(documents)
+
+    assert len(conn.copied["psc_items"]) == sum(len(document["items"]) for document in documents)
+    [row] = [row for row in conn.copied["psc_items"]
+             if (row["company_number"], row["psc_serial_id"]) == (documents[0]["company_number"], "2")]
+    assert row["nationality"] == ""  # NULL.
+    assert loader.stats["rows"] == sum(map(len, conn.copied.values()))
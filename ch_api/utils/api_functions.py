@@ -1,52 +1,280 @@
 #!/usr/bin/python3
 
-from utils.utils_constants import API_KEY_ABS_PATH
+from utils.utils_constants import API_KEY_ABS_PATH, CACHE_ABS_PATH
 
 from backoff import on_exception, expo
 import requests
 from requests import ConnectionError, Timeout, HTTPError
-from ratelimit import limits, sleep_and_retry
+from requests.adapters import HTTPAdapter
 from typing import Union
+import json
+import os
+import time
 
+try:
+	import orjson  # optional: faster decoding of the responses, see DECODERS below.
+except ImportError:
+	orjson = None
 
-KEY = open(API_KEY_ABS_PATH).read().strip()
+from utils.key_pool import KeyPool, read_keys
+from utils.request_coalescer import RequestCoalescer
+from utils.response_cache import ResponseCache, normalise_url
+
+
+KEYS = read_keys(API_KEY_ABS_PATH)  # one api key per line in utils/api_key.
+
+KEY = KEYS[0] if KEYS else None
 
 FIVE_MINUTES = 300  # Number of seconds in five minutes.
 
-API_BASE_URL = "https://api.companieshouse.gov.uk"
+# can be pointed to another server, e.g. the stub replaying recorded responses (see stub/server.py).
+API_BASE_URL = os.environ.get("CH_API_BASE_URL", "https://api.companieshouse.gov.uk")
+
+# CH enforces a 600 queries per 5 minutes limit. Only the starting budget of each key: the limiters then follow the
+# X-Ratelimit-* headers returned by the API, so keys credited with more calls are used in full.
+CALLS = 600
+
+POOL_SIZE = 10  # max number of keep-alive connections kept open towards the API.
+
+TIMEOUT = (3.05, 30)  # (connect, read) timeouts in seconds, a request hanging forever would stall the whole run.
+
+# backoff of the calls failing with a connection error, a timeout or a 5xx status. The 1st pass gives up quickly: the
+# error is recorded in the *_http_errors tables and the healthy url_ids go on, the calls still failing are made again
+# by prog.py --retry-failed with the patient policy. max_time in seconds, waits of factor * 2^n seconds up to max_wait.
+QUICK_RETRIES = {"max_tries": 3, "max_time": 30, "factor": 1, "max_wait": 8}
+PATIENT_RETRIES = {"max_tries": 10, "max_time": 900, "factor": 4, "max_wait": 120}
+
+# errors recorded in the *_http_errors tables that calling the API again would not change.
+PERMANENT_ERRORS = ("not found", "bad request", "http error 410")
+
+
+def make_session(api_key: str = None, pool_size: int = POOL_SIZE) -> requests.Session:
+	"""
+	func to create a requests.Session¹⁰ with a pool of keep-alive connections, so that consecutive calls to the API
+	reuse the same TCP/TLS connection instead of paying for a new handshake every time.
+	:param api_key: string, api_key set once as auth=(key, "") for every call. call_api() passes the key borrowed from
+					the KEY_POOL with each call instead, which takes precedence over the session auth.
+	:param pool_size: int, max number of connections kept alive in the pool (one per thread making calls in parallel).
+	:return: requests.Session instance.
+	"""
+	session = requests.Session()
+	if api_key is not None:
+		session.auth = (api_key, "")
+
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+	session.mount("https://", adapter)
+	session.mount("http://", adapter)
+
+	return session
+
+
+SESSION = make_session()
+
+# every key has its own rate limiter, shared by every thread/coroutine calling the API.
+KEY_POOL = KeyPool(keys=KEYS, calls=CALLS, period=FIVE_MINUTES)
+
+COALESCER = RequestCoalescer()  # identical calls in flight at the same time are made once.
+
+CACHE = None  # on-disk ResponseCache, disabled unless enable_cache() is called (--cache flag of prog.py).
+
+# functions decoding the raw bytes of a response body into a JSON object, without decoding them to a str first.
+# stdlib json.loads accepts bytes too but decodes them to a str internally, orjson¹¹ parses the bytes directly.
+DECODERS = {"json": json.loads}
+if orjson is not None:
+	DECODERS["orjson"] = orjson.loads
+
+DECODER = "orjson" if orjson is not None else "json"  # name of the decoder used by call_api(), see configure_decoder().
+
+decode = DECODERS[DECODER]
+
+RETRIES = QUICK_RETRIES  # backoff policy of request_api(), see configure_retries().
+
+
+def configure_session(pool_size: int = POOL_SIZE) -> requests.Session:
+	"""
+	func to replace the module level SESSION used by call_api(), e.g. to change the size of the pool.
+	:return: the new requests.Session instance.
+	"""
+	global SESSION
+	SESSION.close()
+	SESSION = make_session(pool_size=pool_size)
+	return SESSION
+
+
+def configure_keys(keys: list, calls: int = CALLS, shared=None) -> KeyPool:
+	"""
+	func to replace the module level KEY_POOL used by call_api(), e.g. with keys read from another file.
+	:param shared: rate_limiter.SharedTokenBucket, one bucket per key, shared with the other processes using the keys.
+	:return: the new KeyPool instance.
+	"""
+	global KEY_POOL
+	KEY_POOL = KeyPool(keys=keys, calls=calls, period=FIVE_MINUTES, shared=shared)
+	return KEY_POOL
+
+
+def configure_retries(policy: dict) -> dict:
+	"""
+	func to replace the module level RETRIES policy of request_api(), e.g. PATIENT_RETRIES for prog.py --retry-failed.
+	:param policy: dict, with the max_tries, max_time, factor and max_wait keys of QUICK_RETRIES.
+	"""
+	global RETRIES
+	RETRIES = policy
+	return RETRIES
+
+
+def configure_base_url(url: str) -> str:
+	"""func to replace the module level API_BASE_URL used to compose the urls of all the get_* functions."""
+	global API_BASE_URL
+	API_BASE_URL = url.rstrip("/")
+	return API_BASE_URL
+
+
+def configure_decoder(name: str) -> callable:
+	"""
+	func to choose the decoder of the response bodies used by call_api(), e.g. "json" to use the stdlib one even if
+	orjson is installed.
+	:param name: string, a key of DECODERS.
+	:return: the decoding function.
+	"""
+	global DECODER, decode
+	if name not in DECODERS:
+		raise ValueError(f"Unknown decoder \"{name}\", choose from {sorted(DECODERS)} (orjson has to be installed).")
+	DECODER, decode = name, DECODERS[name]
+	return decode
+
+
+def enable_cache(path: str = CACHE_ABS_PATH, **kwargs) -> ResponseCache:
+	"""
+	func to enable the on-disk response CACHE used by call_api(), kwargs are passed to ResponseCache.
+	:return: the ResponseCache instance.
+	"""
+	global CACHE
+	CACHE = ResponseCache(path=path, **kwargs)
+	return CACHE
+
+
+def retry_waits():
+	"""generator of the waits between the attempts of request_api(), exponential as set by the RETRIES policy."""
+	yield from expo(factor=RETRIES["factor"], max_value=RETRIES["max_wait"])
 
-CALLS = 500  # change if your api key gets credited with 1000 calls. Contact CH for that. 
 
+def throttled(e: Exception) -> bool:
+	"""whether a call failed with a 429: request_api() has already waited for the rate limit as long as allowed."""
+	return isinstance(e, HTTPError) and e.response is not None and e.response.status_code == 429
 
-@sleep_and_retry  # if we exceed the rate limit imposed by @limits, it forces sleep until we can start again.
-@on_exception(expo, (ConnectionError, Timeout, HTTPError), max_tries=10)
-@limits(calls=CALLS, period=FIVE_MINUTES)  # CH enforces a 600 queries per 5 minutes limit.
-def call_api(url: str, api_key: str) -> Union[None, dict]:
+
+# the policy is read at each call, a 429 is not retried here, see below.
+@on_exception(retry_waits, (ConnectionError, Timeout, HTTPError), giveup=throttled,
+			  max_tries=lambda: RETRIES["max_tries"], max_time=lambda: RETRIES["max_time"])
+def request_api(url: str, session: requests.Session, timeout: tuple, etag: str = None) -> requests.Response:
+	"""
+	func to make a call to the API through a pooled session. Decorator handles exceptions, the rate limit is
+	handled by the KEY_POOL: each call borrows the least loaded key, paced on the budget reported by the API for that
+	key. A 429 makes the key wait exactly until the window resets (or for Retry-After without the X-Ratelimit-*
+	headers), then the call is made again, at most as many times and as long as the RETRIES policy allows: past that
+	the HTTPError 429 is raised. A key rejected with 401 is removed and the call is made again with another key.
+	:param etag: string, if passed the call is conditional (If-None-Match) and the API can answer 304 Not Modified.
+	:return: the response if status_code is 200, 304, 400, 401 or 404.
+			 if status_code is anything else func re-runs as set by the RETRIES policy if exceptions in @on_exception
+			 tuple argument are raised. If the last attempt fails, the exception is raised.
 	"""
-	func to generate a query for an API with auth=(key, ""). Decorators handle rate limit calls and exceptions.
+	headers = {"If-None-Match": etag} if etag is not None else None
+	throttles, start = 0, time.monotonic()
+
+	while True:
+		# every attempt (retries included) counts against the rate limit of the key used.
+		with KEY_POOL.borrow() as key:
+			r = session.get(url, auth=(key, ""), headers=headers, timeout=timeout)
+			KEY_POOL.update(key, headers=r.headers, status_code=r.status_code)
+
+		if r.status_code == 429:
+			throttles += 1
+			if throttles < RETRIES["max_tries"] and time.monotonic() - start < RETRIES["max_time"]:
+				continue  # the limiter of the key now holds the calls until the reset reported in the headers.
+			break
+
+		if r.status_code != 401:
+			break
+
+		KEY_POOL.remove(key)
+		if not len(KEY_POOL):
+			break
+
+	if r.status_code not in (200, 304, 400, 401, 404):
+		r.raise_for_status()
+
+	return r
+
+
+def fetch_body(url: str, session: requests.Session, timeout: tuple) -> (int, bytes):
+	"""
+	func to get the raw body of a url through the response CACHE, if enabled: a fresh cached response is returned
+	without calling the API (so it does not count against the rate limit), a stale one with an etag is revalidated
+	with a conditional call.
+	:return: tuple (status_code, body), status_code 200 for a response served from the cache.
+	"""
+	cached = CACHE.lookup(url) if CACHE is not None else None
+	if cached is not None and cached.fresh:
+		return 200, cached.body
+
+	r = request_api(url, session=session, timeout=timeout, etag=cached.etag if cached is not None else None)
+
+	if r.status_code == 304:
+		CACHE.revalidated(url)
+		return 200, cached.body
+
+	if r.status_code == 200 and CACHE is not None:
+		# the resources carry their etag in the body too (e.g. companyprofile["etag"]).
+		CACHE.store(url, body=r.content, etag=r.headers.get("ETag") or decode(r.content).get("etag"))
+
+	return r.status_code, r.content
+
+
+def call_api(url: str, session: requests.Session = None, timeout: tuple = TIMEOUT) -> Union[None, dict]:
+	"""
+	func to generate a query for an API with the pooled session, the key pool and, if enabled, the response CACHE (see
+	fetch_body). Identical calls made at the same time by different threads are coalesced by the COALESCER: one call
+	is made and its body shared, each caller decoding its own JSON object from it.
 	:param url: string, url of the query.
-	:param api_key: string, apy_key.
-	:return: if status_code is 200 func returns a JSON object.
+	:param session: requests.Session, defaulted to the module level SESSION.
+	:param timeout: tuple, (connect, read) timeouts in seconds.
+	:return: if status_code is 200 (or 304 for a cached response) func returns a JSON object.
 			 if status_code is http error func returns {"error":"error_string"}
-			 if status_code is not 200/404 func re-runs up to 10 times if exceptions in @on_exception tuple
-			 argument are raised. If 11th attempt fails, return None and print 'API response: {}'.format(r.status_code).
+			 if status_code is not 200/404 the call is retried by request_api(), then {"error": "error_string"} if
+			 it still fails (see error_of).
+			 if all the keys of the pool are rejected with 401, returns {"error": "not authorised"} and the next call
+			 raises PermissionError.
 	"""
-	r = requests.get(url, auth=(api_key, ""))
+	session = SESSION if session is None else session
 
-	if not (r.status_code == 200 or r.status_code == 404 or r.status_code == 401 or r.status_code == 400):
-		r.raise_for_status()
+	try:
+		status_code, body = COALESCER.call(normalise_url(url), fetch_body, url, session=session, timeout=timeout)
+	except (ConnectionError, Timeout, HTTPError) as e:
+		# retried in vain: recorded like the other errors, to be retried by prog.py --retry-failed.
+		return dict({"error": error_of(e)})
 
-	elif r.status_code == 404:
+	if status_code == 404:
 		return dict({"error": "not found"})
 
-	elif r.status_code == 401:
+	elif status_code == 401:
 		return dict({"error": "not authorised"})
 
-	elif r.status_code == 400:
+	elif status_code == 400:
 		return dict({"error": "bad request"})
 
 	else:
-		return r.json()
+		# the raw body is decoded: r.json() would decode it to a str and parse that with the stdlib json.
+		return decode(body)
+
+
+def error_of(e: Exception) -> str:
+	"""func to describe the error of a call retried in vain, e.g. "server error 503", "timeout", "connection error"."""
+	if isinstance(e, HTTPError) and e.response is not None:
+		kind = "server error" if e.response.status_code >= 500 else "http error"
+		return f"{kind} {e.response.status_code}"
+	if isinstance(e, Timeout):
+		return "timeout"
+	return "connection error"
 
 
 def get_companyprofile(url_id: str, **kwargs) -> callable:
@@ -59,7 +287,7 @@ def get_companyprofile(url_id: str, **kwargs) -> callable:
 	:return: call_api(), with url formatted to search company whose code is "comp_code".
 	"""
 	url = API_BASE_URL + "/company/" + url_id
-	return call_api(url=url, api_key=KEY)
+	return call_api(url=url)
 
 
 def get_company_resource(url_id: str, res_type: str, items_per_page: int, start_index: int) -> callable:
@@ -79,7 +307,7 @@ def get_company_resource(url_id: str, res_type: str, items_per_page: int, start_
 
 	url = (API_BASE_URL 
 	       + f"/company/{url_id}/{res_type}?items_per_page={items_per_page}&start_index={str(start_index)}")
-	return call_api(url=url, api_key=KEY)
+	return call_api(url=url)
 
 
 def get_appointmentlist(url_id: str, items_per_page: int, start_index: int) -> callable:
@@ -96,7 +324,7 @@ def get_appointmentlist(url_id: str, items_per_page: int, start_index: int) -> c
 
 	url = (API_BASE_URL
 	       + f"{url_id}?items_per_page={str(items_per_page)}&start_index={str(start_index)}")
-	return call_api(url=url, api_key=KEY)
+	return call_api(url=url)
 
 
 def get_officersearch(url_id: str, items_per_page: int, start_index: int) -> callable:
@@ -110,7 +338,7 @@ def get_officersearch(url_id: str, items_per_page: int, start_index: int) -> cal
 	"""
 	url = (API_BASE_URL
 	       + f"/search/officers?q={url_id}&items_per_page={str(items_per_page)}&start_index={str(start_index)}")
-	return call_api(url=url, api_key=KEY)
+	return call_api(url=url)
 
 
 # Resources JSON examples and discussion from the CH developer forum
@@ -125,3 +353,5 @@ def get_officersearch(url_id: str, items_per_page: int, start_index: int) -> cal
 # ⁷ https://forum.aws.chdev.org/t/search-company-officers-returns-http-416-when-start-index-over-300/897/4
 # ⁸ https://developer.companieshouse.gov.uk/api/docs/officers/officer_id/appointments/appointmentList-resource.html
 # ⁹ https://developer.companieshouse.gov.uk/api/docs/search-overview/OfficerSearch-resource.html
+# ¹⁰ https://requests.readthedocs.io/en/master/user/advanced/#session-objects
+# ¹¹ https://github.com/ijl/orjson
@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+
+"""
+bulk ingest of the Companies House snapshots (see utils/snapshots.py) into the tables of companyprofile_params and
+psc_params, without calling the API.
+
+the documents of the snapshot are normalised in batches into per-table rows by the plan of their params (see
+utils/json_plan.py), then each batch is loaded in one transaction: the companies of the batch are deleted from the root
+table (cascading to the branch tables, like Inserter.unpack() does) and the rows of every table are streamed with COPY
+FROM STDIN¹, parents before children.
+
+usage, from ch_api/ (the root folder of the programme), the tables are created by prog.py:
+(venv) prompt$ python3 prog.py BasicCompanyDataAsOneFile-2020-03-01.zip --cp --bulk
+(venv) prompt$ python3 prog.py persons-with-significant-control-snapshot-2020-03-01.zip --psc --bulk
+"""
+
+import re
+import time
+
+from psycopg2 import sql
+
+from db.pg_engine import copy_rows
+from utils.json_plan import plan_of
+
+BATCH = 10000  # documents loaded per transaction.
+
+
+def table_columns(connection) -> dict:
+    """func to read the columns of the tables in the schema of the connection: {table: [column, ...]}."""
+    return table_schema(connection)[0]
+
+
+def table_schema(connection) -> (dict, dict):
+    """
+    func to read the columns of the tables in the schema of the connection and the constant DEFAULT of the columns
+    which have one, e.g. 'not provided' of the forenames of al_items_former_names:
+    ({table: [column, ...]}, {table: {column: default}}).
+    """
+    with connection.cursor() as curs:
+        curs.execute("SELECT table_name, column_name, column_default FROM information_schema.columns "
+                     "WHERE table_schema = current_schema() ORDER BY ordinal_position")
+        columns, defaults = {}, {}
+        for table, column, expression in curs.fetchall():
+            columns.setdefault(table, []).append(column)
+            default = constant_default(expression)
+            if default is not None:
+                defaults.setdefault(table, {})[column] = default
+    return columns, defaults
+
+
+def constant_default(expression: str):
+    """
+    func to read the value of a constant DEFAULT as reported by information_schema.columns, e.g. "'not provided'::
+    character varying" or "0". None for no DEFAULT, DEFAULT NULL and the expressions (now(), nextval(...)).
+    """
+    if expression is None:
+        return None
+    match = re.fullmatch(r"'((?:[^']|'')*)'(?:::[\w ]+)?", expression)
+    if match is not None:
+        return match.group(1).replace("''", "'")
+    return int(expression) if re.fullmatch(r"-?\d+", expression) else None
+
+
+class BulkLoader:
+    """
+    class loading documents shaped like the API resource of "params" into its tables, in batches of COPY statements.
+    the columns of the documents not found in the tables (e.g. new fields of the snapshots) are dropped and reported.
+
+    usage:
+    >>> from utils.bulk_ingest import BulkLoader
+    ... from utils.snapshots import read_basic_company_data
+    ... loader = BulkLoader(connection=engine.connect(), params=companyprofile_params)
+    ... loader.load(read_basic_company_data("BasicCompanyDataAsOneFile-2020-03-01.zip"))
+    """
+
+    def __init__(self, connection, params: dict, batch_size: int = BATCH):
+        self.connection = connection
+        self.params = params
+        self.batch_size = batch_size
+        self.root_table = params.get("name")
+        self.root_key = params.get("uid_key")[0]
+
+        self.columns = table_columns(connection)
+        if self.root_table not in self.columns:
+            raise ValueError(f"Table \"{self.root_table}\" not found: create the tables before the bulk ingest.")
+
+        self.dropped = set()  # (table, column) found in the documents but not in the tables.
+        self.stats = {"documents": 0, "rows": 0}
+
+    def rows_by_table(self, documents: list) -> dict:
+        """
+        normalises the documents into {table: {columns: [values, ...]}}, the tables in the order they have to be
+        loaded.
+        """
+        plan, tables = plan_of(self.params), {}
+        for document in documents:
+            plan.rows(document, uid_value=document[self.root_key], out=tables)
+        return tables
+
+    def load_batch(self, documents: list) -> None:
+        # the last document of a company wins, as if the documents were inserted one after the other.
+        documents = list({document[self.root_key]: document for document in documents}.values())
+
+        with self.connection:  # one transaction per batch: commit() or rollback() if error.
+            with self.connection.cursor() as curs:
+                curs.execute(sql.SQL("DELETE FROM {table} WHERE {field} = ANY(%s)").format(
+                    table=sql.Identifier(self.root_table),
+                    field=sql.Identifier(self.root_key)), ([document[self.root_key] for document in documents],))
+
+                for table, groups in self.rows_by_table(documents).items():
+                    known = self.columns.get(table, [])
+                    present = set().union(*groups)
+                    self.dropped.update((table, column) for column in present if column not in known)
+
+                    # one COPY per table: the columns of every group, NULL where a group does not have them.
+                    columns = [column for column in known if column in present]
+                    rows = []
+                    for group_columns, values_list in groups.items():
+                        positions = [group_columns.index(column) if column in group_columns else None
+                                     for column in columns]
+                        rows.extend(tuple(None if n is None else values[n] for n in positions)
+                                    for values in values_list)
+
+                    copy_rows(curs, table, columns, rows)
+                    self.stats["rows"] += len(rows)
+
+        self.stats["documents"] += len(documents)
+
+    def load(self, documents) -> dict:
+        """loads an iterable of documents in batches, printing the progress. Returns the stats."""
+        start = time.perf_counter()
+        batch = []
+
+        for document in documents:
+            batch.append(document)
+            if len(batch) == self.batch_size:
+                self.load_batch(batch)
+                batch = []
+                elapsed = time.perf_counter() - start
+                print(f"{self.stats['documents']:,} {self.root_table} documents loaded, "
+                      f"{self.stats['rows'] / elapsed:,.0f} rows/s.")
+
+        if batch:
+            self.load_batch(batch)
+
+        elapsed = time.perf_counter() - start
+        print(f"{self.stats['documents']:,} {self.root_table} documents, {self.stats['rows']:,} rows loaded in "
+              f"{elapsed:,.0f}s.")
+        if self.dropped:
+            print("columns of the snapshot not found in the tables, dropped: "
+                  + ", ".join(f"{table}.{column}" for table, column in sorted(self.dropped)))
+
+        return self.stats
+
+
+# ¹ https://www.postgresql.org/docs/12/sql-copy.html
@@ -8,6 +8,45 @@ parser.add_argument('--ol', help='add --ol flag to get companyprofile', action="
 parser.add_argument('--cp', help='add --cp flag to get companyprofile', action="store_true")
 parser.add_argument('--al', help='add --al flag to get appointmentslist', action="store_true")
 parser.add_argument('--excel', help='add --excel flag to dump data automatically to excel files.', action="store_true")
+parser.add_argument('--parquet', help='add --parquet flag to dump the tables to compressed Parquet files, one folder '
+                                      'per flag (needs pyarrow).', action="store_true")
+parser.add_argument('--bulk', help='add --bulk flag to load a CH snapshot file instead of querying the API: the Basic '
+                                   'Company Data with --cp, the PSC snapshot with --psc.', action="store_true")
+parser.add_argument('--cache', help='add --cache flag to keep the responses of the API on disk and reuse them in the '
+                                    'following runs.', action="store_true")
+parser.add_argument('--concurrency', help='number of calls to the API kept in flight at the same time (default 1).',
+                    type=int, default=1)
+parser.add_argument('--workers', help='number of processes the url_ids are shared across, each with its own DB '
+                                      'connections, all within the rate limit of the api keys (default 1).',
+                    type=int, default=1)
+parser.add_argument('--resume', help='add --resume flag to skip the url_ids written by the previous run, e.g. after '
+                                     'a crash, as recorded in the run_journal table. The failed calls are not '
+                                     'recorded: they are called again, with --retry-failed too.', action="store_true")
+parser.add_argument('--retry-failed', help='add --retry-failed flag to call the API again only for the url_ids whose '
+                                           'calls failed in the previous runs (*_http_errors tables), with a patient '
+                                           'backoff. "not found" and "bad request" errors are not retried.',
+                    action="store_true")
+parser.add_argument('--pipeline', help='add --pipeline flag to write the JSON to the database while the next ones are '
+                                       'extracted: --concurrency fetchers and --writers writers share a queue bounded '
+                                       'by --queue-mb.', action="store_true")
+parser.add_argument('--writers', help='with --pipeline, number of writers draining the queue into the database '
+                                      '(default 2).', type=int, default=2)
+parser.add_argument('--queue-mb', help='with --pipeline, max MB of JSON waiting in the queue to be written '
+                                       '(default 256).', type=int, default=256)
+parser.add_argument('--batch', help='number of JSON written per transaction with multi-row inserts (default 0: each '
+                                    'JSON is inserted row by row as soon as it is extracted).', type=int, default=0)
+parser.add_argument('--copy-above', help='with --batch, the rows of a table above this number in a batch are loaded with '
+                                         'COPY through a staging table instead of INSERT (default 5000).',
+                    type=int, default=None)
+parser.add_argument('--diff', help='add --diff flag to write only the rows which changed since the previous run, '
+                                   'compared with the content hashes stored with the rows, in transactions of --batch '
+                                   'JSON (default 500).', action="store_true")
+parser.add_argument('--history', help='add --history flag to keep every version of the companies, officers, PSCs and '
+                                      'appointments in the *_history tables, with the period each was valid for '
+                                      '(db/pg_history.py). Writes with --diff.', action="store_true")
+parser.add_argument('--api-base-url', help='base url of the API, e.g. http://127.0.0.1:8000 to query the stub server '
+                                           '(stub/server.py). Defaults to the CH_API_BASE_URL environment variable, '
+                                           'if set, or to https://api.companieshouse.gov.uk.', default=None)
 
 
 def file_is_csv_or_txt(args):
@@ -17,16 +56,15 @@ def file_is_csv_or_txt(args):
 
 def optional_flags_collide(args):
 
-    # bool(file) + bool(al) = 2
-    if (args.al is True and args.excel is not True) and (sum([bool(value) for value in vars(args).values()]) > 2):
-        return True
-    # bool(file) + bool(al) + bool(excel) = 3
-    elif (args.al is True and args.excel is True) and (sum([bool(value) for value in vars(args).values()]) > 3):
+    # --al uses officer ids, it cannot be combined with the flags using company codes.
+    if args.al is True and (args.psc is True or args.ol is True or args.cp is True):
         return True
 
 
-def data_wont_fit_excel(args, url_ids):
-    if (args.excel is True) and len(url_ids) > 1048576:
+def bulk_flags_are_wrong(args):
+
+    # a snapshot file holds either the companies (--cp) or the psc (--psc).
+    if args.bulk is True and (args.ol or args.al or args.cp == args.psc):
         return True
 
 
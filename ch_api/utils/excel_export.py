@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+
+"""
+streaming export of the tables to Excel files (prog.py --excel), in constant memory whatever the size of the tables:
+
+  * each table is read with a server-side (named) cursor, CHUNK_ROWS rows at a time, instead of a whole DataFrame;
+  * the rows are written by xlsxwriter in constant_memory mode¹, which flushes each row to disk once the next one
+    starts;
+  * a table longer than the 1,048,576 rows of a sheet² goes on in further sheets: ol_items, ol_items_2, ...
+
+usage:
+>>> from utils.excel_export import export_tables
+... with engine.connection() as conn:
+...     export_tables(conn, ["ol_items", "ol_items_address"], "public_ol.xlsx")
+{'ol_items': 1500000, 'ol_items_address': 1500000}
+"""
+
+import datetime
+import decimal
+
+import xlsxwriter
+from psycopg2 import sql
+
+EXCEL_MAX_ROWS = 1048576  # rows of a sheet, the header included.
+SHEET_NAME_MAX = 31  # characters of a sheet name.
+CHUNK_ROWS = 10000  # rows fetched from the server at a time.
+
+WORKBOOK_OPTIONS = {
+    "constant_memory": True,
+    "remove_timezone": True,  # Excel has no time zones.
+    "default_date_format": "yyyy-mm-dd",
+    # the values are written as they are in the database.
+    "strings_to_formulas": False,
+    "strings_to_urls": False}
+
+# types written as they are, the others (e.g. the arrays, the JSON columns) as their text.
+EXCEL_TYPES = (str, int, float, bool, decimal.Decimal, datetime.date, datetime.datetime, datetime.time)
+
+
+def sheet_name(table: str, n: int) -> str:
+    """func naming the n-th sheet of a table: "ol_items", "ol_items_2", ... cut to the 31 characters of Excel."""
+    suffix = "" if n == 1 else f"_{n}"
+    return table[:SHEET_NAME_MAX - len(suffix)] + suffix
+
+
+def cell(value):
+    return value if value is None or isinstance(value, EXCEL_TYPES) else str(value)
+
+
+def export_table(workbook, conn, table: str, chunk_rows: int = CHUNK_ROWS, max_rows: int = EXCEL_MAX_ROWS) -> int:
+    """
+    func to write a table to the sheets of a workbook, max_rows per sheet with the header.
+    :return: the number of rows written.
+    """
+    rows, sheets, row_n = 0, 0, max_rows
+    with conn.cursor(name=f"excel_export_{table}") as curs:  # server-side: the rows are fetched chunk by chunk.
+        curs.execute(sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table)))
+        chunk = curs.fetchmany(chunk_rows)
+        header = [column[0] for column in curs.description]
+
+        while chunk:
+            for values in chunk:
+                if row_n == max_rows:  # the sheet is full, or there is none yet.
+                    sheets += 1
+                    sheet = workbook.add_worksheet(sheet_name(table, sheets))
+                    sheet.write_row(0, 0, header)
+                    row_n = 1
+                sheet.write_row(row_n, 0, [cell(value) for value in values])
+                row_n += 1
+            rows += len(chunk)
+            chunk = curs.fetchmany(chunk_rows)
+
+    if sheets == 0:  # an empty table: its header only.
+        workbook.add_worksheet(sheet_name(table, 1)).write_row(0, 0, header)
+    return rows
+
+
+def export_tables(conn, tables: list, path: str, chunk_rows: int = CHUNK_ROWS, max_rows: int = EXCEL_MAX_ROWS) -> dict:
+    """
+    func to write tables to an Excel file, one table per sheet (or more, see export_table).
+    :param conn: psycopg2 connection, not in autocommit mode (the named cursors need a transaction).
+    :return: {table: number of rows written}.
+    """
+    workbook = xlsxwriter.Workbook(path, WORKBOOK_OPTIONS)
+    try:
+        return {table: export_table(workbook, conn, table, chunk_rows=chunk_rows, max_rows=max_rows)
+                for table in tables}
+    finally:
+        workbook.close()
+
+
+# ¹ https://xlsxwriter.readthedocs.io/working_with_memory.html
+# ² https://support.microsoft.com/en-us/office/excel-specifications-and-limits-1672b34d-7043-467e-8e27-269d656771c3
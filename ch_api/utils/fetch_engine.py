@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+CONCURRENCY = 8  # default number of calls to the API kept in flight.
+
+
+class AsyncFetcher:
+	"""
+	asyncio engine keeping up to "concurrency" calls to the API in flight at the same time.
+
+	the calls are made with the same functions used by the synchronous path (api_functions.call_api and the Getter
+	built on top of it) in a pool of worker threads, so they all share the pooled session and the token bucket of
+	api_functions. A call waiting for a token sleeps in its worker thread, never in the event loop.
+
+	usage:
+	>>> import asyncio
+	... from utils.fetch_engine import AsyncFetcher
+	... from utils.json_getter import Getter
+	... from utils.json_params import companyprofile_params
+	... fetcher = AsyncFetcher(concurrency=8)
+	... getters = [Getter(companyprofile_params, url_id) for url_id in ["OC399321", "OC323310"]]
+	... async def fetch_all():
+	...     return await asyncio.gather(*[getter.extract_async(fetcher) for getter in getters])
+	... results = asyncio.run(fetch_all())
+	"""
+
+	def __init__(self, concurrency: int = CONCURRENCY):
+		if concurrency < 1:
+			raise ValueError("\"concurrency\" should be at least 1.")
+
+		self.concurrency = concurrency
+		self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fetcher")
+
+	async def run(self, fn: callable, *args, **kwargs):
+		"""awaits fn(*args, **kwargs) executed in one of the in-flight slots."""
+		loop = asyncio.get_running_loop()
+		return await loop.run_in_executor(self._executor, partial(fn, *args, **kwargs))
+
+	async def imap_unordered(self, coro_fn: callable, iterable):
+		"""
+		async generator yielding (item, await coro_fn(item)) for each item of iterable in order of completion.
+		at most 2 * concurrency items are scheduled at any time, so iterable can be as long as the whole register.
+		"""
+		pending = set()
+
+		for item in iterable:
+			pending.add(asyncio.ensure_future(self._tagged(coro_fn, item)))
+
+			if len(pending) >= 2 * self.concurrency:
+				done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+				for task in done:
+					yield task.result()
+
+		while pending:
+			done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+			for task in done:
+				yield task.result()
+
+	@staticmethod
+	async def _tagged(coro_fn, item):
+		return item, await coro_fn(item)
+
+	def close(self) -> None:
+		self._executor.shutdown(wait=True)
@@ -86,8 +86,22 @@ def read_file_with_url_ids(path):
 			if line_string:  # empty lines will be skipped as empty str evaluates to false.
 				if "," in line_string:
 					for id in line.split(","):
-						(id.strip().replace('"', '').replace("'", '')
-						 and url_ids.append(id.strip().replace('"', '').replace("'", '')))
+						# strip again once the quotes are removed: '"OC323310  "' -> 'OC323310'.
+						(id.replace('"', '').replace("'", '').strip()
+						 and url_ids.append(id.replace('"', '').replace("'", '').strip()))
 				else:
 					url_ids.append(line_string.strip())
-	return url_ids
\ No newline at end of file
+	return url_ids
+
+
+def dedupe_url_ids(url_ids):
+	"""
+	func that drops the repeated url_ids of a list, keeping the first occurrence of each in the original order, so that
+	each url_id is extracted (and inserted) once.
+
+	usage:
+	>>> from utils.helpers import dedupe_url_ids
+	... print(dedupe_url_ids(["OC399321", "LP016212", "OC399321"]))
+	['OC399321', 'LP016212']
+	"""
+	return list(dict.fromkeys(url_ids))
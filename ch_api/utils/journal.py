@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+"""
+progress journal of the runs of prog.py: one row per (resource, url_id) written to the database, in the run_journal
+table of the schema (db/pg_tables.py), so that a run which died halfway is resumed with --resume where it stopped
+instead of calling the API again for the url_ids already done.
+
+the pairs are recorded after their JSON are committed, in batches, so that the journal costs one statement per batch
+instead of one per JSON:
+
+  * BatchWriter records the pairs of a batch in the transaction writing its JSON: the batch and its journal are
+    committed together or not at all;
+  * RowWriter commits each JSON on its own and records the pairs every JOURNAL_BATCH JSON: after a crash, at most the
+    last JOURNAL_BATCH JSON are written again, which changes nothing as each JSON replaces its own records.
+
+the resource of a pair is the "name" of the params dictionary of the JSON, e.g. ("companyprofile", "OC399321").
+"""
+
+from psycopg2 import sql
+
+JOURNAL_TABLE = "run_journal"
+JOURNAL_BATCH = 100  # pairs recorded per statement by the RowWriter.
+
+
+def record_query(table: str = JOURNAL_TABLE) -> sql.Composed:
+    """INSERT of the pairs passed as two arrays, resources and url_ids, the pairs already recorded are skipped."""
+    return sql.SQL("INSERT INTO {table} (resource, url_id) SELECT * FROM unnest(%s::VARCHAR[], %s::VARCHAR[]) "
+                   "ON CONFLICT DO NOTHING").format(table=sql.Identifier(table))
+
+
+class Journal:
+    """
+    class recording the (resource, url_id) pairs written to the database, and reading them back for --resume.
+
+    usage:
+    >>> from utils.journal import Journal
+    ... journal = Journal(db=engine)
+    ... done = journal.done()  # {("companyprofile", "OC399321"), ...}
+    ... jobs = [(params, url_id) for params, url_id in jobs if (params.get("name"), url_id) not in done]
+    ... journal.record([("companyprofile", "OC399321")])  # written every JOURNAL_BATCH pairs.
+    ... journal.flush()  # writes the last pairs.
+    """
+
+    def __init__(self, db, batch_size: int = JOURNAL_BATCH, table: str = JOURNAL_TABLE):
+        self.engine = db
+        self.batch_size = batch_size
+        self.table = table
+        self.pending = []  # pairs committed to the database but not recorded yet.
+        self.stats = {"recorded": 0, "statements": 0}
+
+    def write(self, curs, pairs: list) -> None:
+        """records the pairs with the cursor of the caller, in its transaction."""
+        if not pairs:
+            return
+        curs.execute(record_query(self.table), ([resource for resource, _ in pairs], [url_id for _, url_id in pairs]))
+        self.stats["recorded"] += len(pairs)
+        self.stats["statements"] += 1
+
+    def record(self, pairs: list) -> None:
+        """buffers the pairs of JSON already committed, recording them once batch_size of them are buffered."""
+        self.pending.extend(pairs)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """records the pairs buffered in one transaction."""
+        if not self.pending:
+            return
+
+        pairs, self.pending = self.pending, []
+        with self.engine.transaction() as conn:
+            with conn.cursor() as curs:
+                self.write(curs, pairs)
+
+    def done(self) -> set:
+        """func to read the pairs recorded: {(resource, url_id), ...}."""
+        with self.engine.connection() as conn:
+            with conn.cursor() as curs:
+                curs.execute(sql.SQL("SELECT resource, url_id FROM {table}").format(table=sql.Identifier(self.table)))
+                return set(curs.fetchall())
+
+    def clear(self) -> None:
+        """forgets the pairs recorded by the previous runs, at the start of a run which is not resumed."""
+        with self.engine.transaction() as conn:
+            with conn.cursor() as curs:
+                curs.execute(sql.SQL("TRUNCATE {table}").format(table=sql.Identifier(self.table)))
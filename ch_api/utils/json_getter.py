@@ -3,8 +3,47 @@
 from utils.api_functions import get_companyprofile, get_company_resource
 from utils.api_functions import get_appointmentlist, get_officersearch
 
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial, wraps
-from math import ceil
+from itertools import chain
+import asyncio
+
+PAGE_WORKERS = 8  # max number of pages of the resources being extracted fetched at the same time.
+
+_page_executor = ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix="pages")
+
+
+def plan_pages(first_page: dict, pagination_cap: int = None) -> list:
+	"""
+	func to plan the pagination of a resource once its 1st page (start_index=0) is known.
+	:param first_page: dict, the 1st page returned by the API.
+	:param pagination_cap: int, the API does not return any item past this index for some resources (officersearch).
+	:return: list of the start_index of the pages left to extract, 1st page excluded, empty if no pagination needed.
+	"""
+	total_results = first_page.get("total_results")
+	items_per_page = first_page.get("items_per_page")
+
+	# check that resource contains a list AND this list needs pagination.
+	if total_results is None or not items_per_page or total_results <= items_per_page:
+		return []
+
+	# ensure we never exceed the pagination limit imposed by the API for this specific resource.
+	last_index = total_results if pagination_cap is None else min(total_results, pagination_cap)
+
+	return list(range(items_per_page, last_index, items_per_page))
+
+
+def assemble_pages(first_page: dict, pages: list) -> dict:
+	"""
+	func to extend the "items" of the 1st page with the items of the following pages, in the order of the pages. If a
+	page failed, the error of the page is returned instead: the resource is recorded as failed, not half extracted.
+	"""
+	for page in pages:
+		if "error" in page:
+			return page
+	if pages:
+		first_page["items"].extend(chain.from_iterable(page["items"] for page in pages))
+	return first_page
 
 
 class Getter:
@@ -21,39 +60,18 @@ class Getter:
 			def wrapper(*args):
 				# intercept the Getter instance so we can access its arguments.
 				self_ = args[0]
-				pagination_cap = self_.pagination_cap
 
 				# extract the resource, if needs pagination this will only be the first page, if it is a resource that
 				# does not contain any list needing pagination, start_index will be ignored.
 				curried_extractor = f(self_)
 				res = curried_extractor(start_index=0)
 
-				# check that resource contains a list AND this list needs pagination.
-				if ("total_results" in res
-					and "items_per_page" in res
-					and (res.get("total_results") > res.get("items_per_page"))):
-
-					total_results = res.get("total_results")
-					items_per_page = res.get("items_per_page")
-					total_pages = ceil(total_results / items_per_page)
-					pages = []
-
-					for start_index in range(0, items_per_page * total_pages, items_per_page):
-						# ensure we never exceed the pagination limit imposed by the API for this specific resource.
-						if pagination_cap is not None:
-							if start_index < pagination_cap:
-								page = curried_extractor(start_index=start_index)["items"]
+				# all the pages left are requested at once, Executor.map returns them in the order of start_index.
+				start_indexes = plan_pages(res, pagination_cap=self_.pagination_cap)
+				pages = list(_page_executor.map(lambda start_index: curried_extractor(start_index=start_index),
+				                                start_indexes))
 
-						else:
-							page = curried_extractor(start_index=start_index)["items"]
-
-						pages.append(page)
-
-					_ = list(map(res.get("items").extend, pages[1:]))  # we already have the 1st page in json["items"]
-
-					return res, self_.json_params, self_.url_id
-				else:
-					return res, self_.json_params, self_.url_id
+				return assemble_pages(res, pages), self_.json_params, self_.url_id
 
 			return wrapper
 
@@ -62,16 +80,32 @@ class Getter:
 		self.url_id = url_id
 		self.resource_name = json_params.get("name")
 		self.items_per_page = json_params.get("items_per_page", None)
-		self.pagination_cap = (json_params.get("list_table_params").get("pagination_cap", None)
-		                       if "list_table_param" in json_params else None)
+		self.pagination_cap = json_params.get("pagination_cap", None)
 
-	@_Decorators.paginate
-	def extract(self):
+	def curried_extractor(self):
 		extractor = get_extractor(self.resource_name, self.items_per_page)
 
-		# the last step of the function composition will happen in the decorator.
+		# the last step of the function composition will happen when the start_index of the page is known.
 		return partial(extractor, url_id=self.url_id)
 
+	@_Decorators.paginate
+	def extract(self):
+		return self.curried_extractor()
+
+	async def extract_async(self, fetcher):
+		"""
+		coroutine version of extract(), the calls to the API are made in the slots of an AsyncFetcher: first the 1st
+		page, then all the pages left at once.
+		"""
+		curried_extractor = self.curried_extractor()
+		res = await fetcher.run(curried_extractor, start_index=0)
+
+		start_indexes = plan_pages(res, pagination_cap=self.pagination_cap)
+		pages = await asyncio.gather(*[fetcher.run(curried_extractor, start_index=start_index)
+		                               for start_index in start_indexes])
+
+		return assemble_pages(res, pages), self.json_params, self.url_id
+
 
 def get_extractor(name, items_per_page):
 	if name == "companyprofile":
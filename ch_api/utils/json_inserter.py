@@ -1,18 +1,31 @@
 #!/usr/bin/python3
 
+import hashlib
 from typing import Union
 
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
 from db.pg_constants import DB_SCHEMA, DB_CONFIG_ABS_PATH, DB_CONFIG_SECTION
 from db.pg_engine import MyDb
+from db.pg_history import HISTORY_TABLES, HISTORY_SUFFIX, CLOSING_ERRORS
 from utils.helpers import flatten_nested_dicts_only as flatten
 from utils.helpers import nullify_empty_str_in_dict_vals as nullify_str
 from utils.helpers import is_str_and_empty
+from utils.bulk_ingest import table_schema
+from utils.json_plan import plan_of
+from utils.json_rows import uid_pair_of, serial_key_of
 
 # define types ensembles for type checking
 Number = (int, float)
 Atom = (str, Number)
 Collection = (list, tuple, set)
 
+BATCH_SIZE = 500  # documents written per transaction by BatchWriter.
+PAGE_SIZE = 1000  # rows per INSERT statement of execute_values().
+COPY_THRESHOLD = 5000  # rows of a table in a batch above which BatchWriter loads them with COPY.
+HASH_COLUMN = "content_hash"  # hash of the values of a row (of the whole document in a root row), see DiffWriter.
+
 # how to use
 """
 from utils.json_params import officerlist_params, psc_params, companyprofile_params
@@ -29,7 +42,7 @@ for company_number in company_numbers:
         inserter.unpack(uid_value=company_number)
 """
 
-# start engine
+# start engine, its pool of connections is shared with the other MyDb instances of the same database and schema.
 engine = MyDb(db_config_file=DB_CONFIG_ABS_PATH, db_section_name=DB_CONFIG_SECTION, schema=DB_SCHEMA)
 
 
@@ -121,8 +134,9 @@ class Inserter:
         # in recursive calls branch_table_name will be name the branch table passed from the previous stack frame.
         root_table_name, branch_table_draft_name = self.create_table_variables(branch_table_name)
 
-        # perform upsert of root level data: if the record is already present in the table, it'll be overwritten
-        # returning the values of the primary key so it can be added to the branches dictionaries as foreign key.
+        # perform upsert of root level data: if the record is already present in the table, it'll be overwritten.
+        # the primary key is known before inserting (the *_serial_id of array elements are their ordinals, see below)
+        # so it can be added to the branches dictionaries as foreign key without a RETURNING round trip.
 
         # delete old records in root table, it will cascade to branch tables.
         # IMPORTANT: for this to work always add ON DELETE CASCADE ON UPDATE CASCADE to all FOREIGN KEY.
@@ -137,22 +151,22 @@ class Inserter:
                            table=root_table_name,
                            data=data_root_value)
 
+            # the error recorded by a previous run is resolved (see prog.py --retry-failed).
+            engine.execute(mode="write",
+                           query="DELETE FROM {table} WHERE {fields} = %s",
+                           fields=["id_item_queried"],
+                           table=self.params.get("name") + "_" + "http_errors",
+                           data=[uid_value])
+
         # insert new records.
-        branch_uid_value_tup = engine.execute(mode="write + read",
-                                              query=("INSERT INTO {table} ({fields}) VALUES ({placeholders}) "
-                                                     "RETURNING {p_key}"),
-                                              p_key=self.uid_key,
-                                              table=root_table_name,
-                                              data=data)
-
-        # connection.fetchall() returns tuple => single key: (["bar"],) // composite key: ([("bar", "foo"),],)
-        branch_uid_value = branch_uid_value_tup[0]
-
-        # ensure we capture any SERIAL type added by INSERT to create composite keys.
-        updated_uid_pair = (isinstance(branch_uid_value[0], Atom)  # the returned pkey is non composite.
-                            and dict(zip(self.uid_key, branch_uid_value))
-                            or isinstance(branch_uid_value[0], Collection)  # the returned pkey is composite.
-                            and dict(zip(self.uid_key, branch_uid_value[0])))
+        engine.execute(mode="write",
+                       query="INSERT INTO {table} ({fields}) VALUES ({placeholders})",
+                       table=root_table_name,
+                       data=data)
+
+        # single key: {"company_number": "bar"} // composite key: {"company_number": "bar", "psc_serial_id": 1}
+        updated_uid_pair = {k: data.get(k) for k in self.uid_key}
+        branch_uid_value = tuple(updated_uid_pair.values())
 
         # BCNF decompositions: prune leaves from the root json object.
         if self.leaves_keys:
@@ -180,12 +194,16 @@ class Inserter:
             for array_key, array_params in zip(self.arrays_keys, self.arrays_params):
                 array_data = self.json.get(array_key, None)
 
-                if array_data is not None:
+                if array_data:  # an empty array has no element to insert (nor to check the type of).
                     branch_table_name = branch_table_draft_name + array_key
 
                     if isinstance(array_data[0], dict):
 
-                        for element in array_data:
+                        # officers, psc, appointments... have no UID in CH db: they are keyed by their position in the
+                        # array (1, 2, ...), stable as the whole JSON is deleted and inserted again at every update.
+                        serial_key = serial_key_of(array_params, updated_uid_pair)
+
+                        for ordinal, element in enumerate(array_data, start=1):
 
                             # create new instance with the dictionary element in the array.
                             # reset the instance with new root data (root of the array branch)
@@ -199,8 +217,9 @@ class Inserter:
                             if array_params is not None:
                                 array_instance.unpack(branch_table_name=branch_table_name,
                                                       # uid_value of the original root level data allows to fkey
-                                                      # on root table. SERIAL type is added for each array element.
-                                                      uid_value=branch_uid_value)
+                                                      # on root table. The ordinal is added for each array element.
+                                                      uid_value=list(branch_uid_value)
+                                                      + ([ordinal] if serial_key is not None else []))
 
                     elif isinstance(array_data[0], Atom):
 
@@ -240,7 +259,7 @@ class Inserter:
                             "You reached an array of iterables in the JSON. You need to create a conditional"
                             " branch to handle this edge case.")
                 else:
-                    # makes sure that if first array key checked is not present, program continues.
+                    # makes sure that if first array key checked is not present or empty, program continues.
                     continue
 
     def create_table_variables(self, branch_table_name: str) -> [str, str]:
@@ -310,4 +329,450 @@ class Inserter:
     def prepare_bulk_insert_query(array: Collection, draft_stmt="INSERT INTO {table} ({fields}) VALUES {to_do};") -> str:
         append = (" ({placeholders})," * len(array)).rstrip(",")
         query = draft_stmt.format(table="{table}", fields="{fields}", to_do=append)
-        return query
\ No newline at end of file
+        return query
+
+
+class RowWriter:
+
+    """
+    writer inserting each document as soon as it is added, with Inserter.unpack(): the interface of BatchWriter, for
+    the callers handling both (e.g. the writer workers of utils/pipeline.py).
+
+    with a journal (utils/journal.py), the (resource, url_id) of the documents inserted are recorded in batches. The
+    errors of the statements are printed and swallowed by MyDb.execute(): a document with a statement failed is counted
+    as failed and not recorded, so that --resume writes it again. Nor are the errors of the API (written to the
+    *_http_errors tables), so that --resume calls them again.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.stats = {"documents": 0, "failed": 0}
+
+    def add(self, json, params, uid_value=None):
+        failed = engine.failed_statements()
+        inserter = Inserter(json=json, params=params)
+        inserter.unpack(uid_value=uid_value)
+        if engine.failed_statements() > failed:
+            self.stats["failed"] += 1
+            return
+
+        self.stats["documents"] += 1
+
+        if self.journal is not None and "error" not in json:
+            self.journal.record([(params.get("name"), uid_value)])
+
+    def flush(self):
+        if self.journal is not None:
+            self.journal.flush()
+
+
+class BatchWriter:
+
+    """
+    unit of work writing the documents of many Inserter.unpack() calls at once: the documents added are walked into
+    per-table row buffers (the compiled plans of utils/json_plan.py) and flushed in one transaction per batch, with
+    multi-row INSERT statements (execute_values¹) instead of one statement per row.
+
+    the semantics of Inserter.unpack() are kept:
+      * error and empty documents are upserted in the {name}_http_errors and {name}_empty tables;
+      * the root records of the batch are deleted first, cascading to the branch tables, then the rows are inserted,
+        parents before children;
+      * the errors recorded for the documents written are deleted from the {name}_http_errors tables;
+      * the *_serial_id of the array elements are their ordinals in the array, as numbered by unpack().
+
+    the rows of a table above copy_threshold in a batch (e.g. the ol_items of 500 officer lists) are streamed with COPY
+    to a staging table and merged with one INSERT ... SELECT instead (MyDb.copy_merge in db/pg_engine.py).
+
+    a document added twice in a batch is written once, the last one wins. Duplicated rows (e.g. the same sic code
+    twice) are skipped with ON CONFLICT DO NOTHING where Inserter.unpack() would have failed on them.
+
+    with a journal (utils/journal.py), the (resource, url_id) of the documents of a batch are recorded in the
+    transaction of the batch, except the errors of the API: --resume calls them again.
+
+    usage:
+    >>> from utils.json_inserter import BatchWriter
+    ... writer = BatchWriter(batch_size=500)
+    ... for company_number in company_numbers:
+    ...     json, _, _ = Getter(json_params=psc_params, url_id=company_number).extract()
+    ...     writer.add(json=json, params=psc_params, uid_value=company_number)  # flushed every 500 documents.
+    ... writer.flush()  # writes the last documents.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, copy_threshold=COPY_THRESHOLD, db=None, journal=None):
+        self.batch_size = batch_size
+        self.copy_threshold = copy_threshold
+        self.engine = engine if db is None else db
+        self.journal = journal
+        self.documents = []  # (json, params, uid_value) waiting to be written.
+        self.stats = {"documents": 0, "statements": 0, "rows": 0, "copied": 0}
+
+    def add(self, json, params, uid_value=None):
+        """buffers a document, as passed to Inserter(json, params).unpack(uid_value), flushing the full batches."""
+        self.documents.append((json, params, uid_value))
+        if len(self.documents) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """writes the documents buffered in one transaction: commit() at the end, rollback() if error."""
+        if not self.documents:
+            return
+
+        documents, self.documents = self.documents, []
+
+        with self.engine.transaction() as conn:
+            with conn.cursor() as curs:
+
+                for table, statement, args in self.statements(documents):
+                    if not isinstance(args, list):
+                        curs.execute(statement, args)
+                        self.stats["statements"] += 1
+                        continue
+
+                    columns, p_key = statement
+                    if len(args) > self.copy_threshold:  # COPY to a staging table, then INSERT ... SELECT.
+                        self.engine.copy_merge(table, columns, args, p_key=p_key, connection=conn)
+                        self.stats["statements"] += 2
+                        self.stats["copied"] += len(args)
+                    else:
+                        execute_values(curs, insert_query(table, columns, p_key), args, page_size=PAGE_SIZE)
+                        self.stats["statements"] += -(-len(args) // PAGE_SIZE)
+                    self.stats["rows"] += len(args)
+
+                if self.journal is not None:
+                    self.journal.write(curs, list(dict.fromkeys((params.get("name"), uid_value)
+                                                                for json, params, uid_value in documents
+                                                                if "error" not in json)))
+
+        self.stats["documents"] += len(documents)
+
+    @staticmethod
+    def statements(documents):
+        """
+        generator func yielding the (table, statement, args) to write the documents, without executing them:
+          * (table, query, parameters tuple) for the DELETE of the root records;
+          * (table, (columns, p_key), list of row tuples) for the rows to insert, upserted on p_key if not None.
+        """
+        by_params = {}
+        for json, params, uid_value in documents:
+            by_params.setdefault(params.get("name"), (params, []))[1].append((json, uid_value))
+
+        for name, (params, params_documents) in by_params.items():
+            errors, empties, roots = {}, {}, {}
+
+            for json, uid_value in params_documents:
+                total_results = json.get("total_results", None)
+
+                if "error" in json:
+                    errors[uid_value] = Inserter.make_data_from_dict(source=json,
+                                                                     add={"id_item_queried": uid_value},
+                                                                     drop=None)
+                elif total_results is not None and total_results == 0:
+                    empties[uid_value] = Inserter.make_data_from_dict(source=json,
+                                                                      add={"id_item_queried": uid_value},
+                                                                      drop=params.get("drop_if_empty", []))
+                else:
+                    uid_pair = uid_pair_of(json, params.get("uid_key"), uid_value)
+                    roots[tuple(uid_pair.values())] = (json, uid_value)  # the last document wins.
+
+            for table, rows in ((name + "_http_errors", errors), (name + "_empty", empties)):
+                for columns, values in group_rows(rows.values()).items():
+                    yield table, (columns, ["id_item_queried"]), values  # upsert.
+
+            if not roots:
+                continue
+
+            # the errors recorded by a previous run are resolved (see prog.py --retry-failed).
+            yield name + "_http_errors", sql.SQL("DELETE FROM {table} WHERE id_item_queried = ANY(%s)").format(
+                table=sql.Identifier(name + "_http_errors")), ([uid_value for _, uid_value in roots.values()],)
+
+            # delete old records in root table, it will cascade to branch tables.
+            root_key = params.get("uid_key")[0]
+            yield name, sql.SQL("DELETE FROM {table} WHERE {field} = ANY(%s)").format(
+                table=sql.Identifier(name),
+                field=sql.Identifier(root_key)), ([root_uid[0] for root_uid in roots],)
+
+            tables = {}
+            plan = plan_of(params)
+            for json, uid_value in roots.values():
+                plan.rows(json, uid_value=uid_value, out=tables)
+
+            for table, groups in tables.items():  # parents before children.
+                for columns, values in groups.items():
+                    yield table, (columns, None), values
+
+
+class DiffWriter:
+
+    """
+    unit of work refreshing the documents added with the rows that changed only, instead of deleting and writing again
+    the whole tree of each document as Inserter.unpack() and BatchWriter do (prog.py --diff).
+
+    every row written carries the content_hash of its values (db/pg_migrations.py adds the column to the tables), the
+    root row the hash of all the rows of its document. A batch of documents is refreshed in one transaction:
+      * the documents whose hash is the one stored in their root row are skipped, nothing is written;
+      * the rows of the other documents are compared with the hashes stored for their keys (the primary keys of the
+        tables, see Plan.keys() in utils/json_plan.py): the rows gone are deleted (their children with them, ON DELETE
+        CASCADE), the rows new or changed are upserted with all the columns of their table.
+
+    so the writes (and the WAL, the dead tuples to vacuum) follow the changes of the register, not its size. The errors
+    and the empty documents are upserted and the journal recorded as by BatchWriter.
+
+    with history=True (prog.py --history) the versions of the rows of the HISTORY_TABLES (db/pg_history.py) are kept as
+    well: the rows of each document are compared with the current versions of its {table}_history table, the versions
+    changed or gone are closed and the new ones appended, in the same transaction. All the current versions of a
+    document gone from the register (CLOSING_ERRORS, or no item left) are closed.
+
+    usage:
+    >>> from utils.json_inserter import DiffWriter
+    ... writer = DiffWriter(batch_size=500)
+    ... writer.add(json=json, params=psc_params, uid_value=company_number)  # flushed every 500 documents.
+    ... writer.flush()
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, db=None, journal=None, history=False):
+        self.batch_size = batch_size
+        self.engine = engine if db is None else db
+        self.journal = journal
+        self.history = history
+        self.documents = []  # (json, params, uid_value) waiting to be written.
+        self.columns = None  # {table: [column, ...]} read from the schema at the first flush.
+        self.defaults = None  # {table: {column: constant DEFAULT}}, read with the columns.
+        self.stats = {"documents": 0, "unchanged": 0, "statements": 0, "rows": 0, "deleted": 0,
+                      "versions": 0, "closed": 0}
+
+    def add(self, json, params, uid_value=None):
+        """buffers a document, as passed to Inserter(json, params).unpack(uid_value), flushing the full batches."""
+        self.documents.append((json, params, uid_value))
+        if len(self.documents) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """refreshes the documents buffered in one transaction: commit() at the end, rollback() if error."""
+        if not self.documents:
+            return
+
+        documents, self.documents = self.documents, []
+
+        with self.engine.transaction() as conn:
+            if self.columns is None:
+                self.columns, self.defaults = table_schema(conn)
+
+            with conn.cursor() as curs:
+
+                # errors and empty documents: upserted by the statements of BatchWriter.
+                failed = [document for document in documents if "error" in document[0] or
+                          document[0].get("total_results", None) == 0]
+                for table, (columns, p_key), args in BatchWriter.statements(failed):
+                    execute_values(curs, insert_query(table, columns, p_key), args, page_size=PAGE_SIZE)
+                    self.stats["statements"] += 1
+
+                if self.history:  # the records not found any more and the lists with no item left.
+                    self.close_history(curs, [document for document in failed if "error" not in document[0] or
+                                              document[0]["error"] in CLOSING_ERRORS])
+
+                by_params = {}
+                for json, params, uid_value in documents:
+                    if not ("error" in json or json.get("total_results", None) == 0):
+                        by_params.setdefault(params.get("name"), (params, {}))[1][uid_value] = json  # last one wins.
+
+                for params, params_documents in by_params.values():
+                    self.refresh(curs, params, params_documents)
+
+                if self.journal is not None:
+                    self.journal.write(curs, list(dict.fromkeys((params.get("name"), uid_value)
+                                                                for json, params, uid_value in documents
+                                                                if "error" not in json)))
+
+        self.stats["documents"] += len(documents)
+
+    def refresh(self, curs, params, documents: dict):
+        """writes the rows of the documents {uid_value: json} of a params dictionary which changed."""
+        plan = plan_of(params)
+        keys = plan.keys()
+        name = params.get("name")
+        root_key = params.get("uid_key")[0]
+
+        incoming = {}  # root uid: (hash of the document, its rows).
+        for uid_value, json in documents.items():
+            document_hash, rows = hashed_rows(plan, json, uid_value, defaults=self.defaults)
+            root = next(iter(uid_pair_of(json, params.get("uid_key"), uid_value).values()))
+            incoming[root] = (document_hash, rows)
+
+        curs.execute(sql.SQL("SELECT {field}, {hash} FROM {table} WHERE {field} = ANY(%s)").format(
+            field=sql.Identifier(root_key), hash=sql.Identifier(HASH_COLUMN), table=sql.Identifier(name)),
+            (list(incoming),))
+        stored_documents = dict(curs.fetchall())
+        self.stats["statements"] += 1
+
+        # the errors recorded by a previous run are resolved (see prog.py --retry-failed).
+        curs.execute(sql.SQL("DELETE FROM {table} WHERE id_item_queried = ANY(%s)").format(
+            table=sql.Identifier(name + "_http_errors")), (list(documents),))
+        self.stats["statements"] += 1
+
+        # all the documents: the history is compared on its own, the runs without --history did not write it.
+        if self.history:
+            for table in HISTORY_TABLES:
+                if table in keys:
+                    self.append_history(curs, table, keys[table], root_key, incoming)
+
+        changed = [root for root, (document_hash, _) in incoming.items() if stored_documents.get(root) != document_hash]
+        self.stats["unchanged"] += len(incoming) - len(changed)
+        if not changed:
+            return
+
+        rows = {}
+        for root in changed:
+            rows.update(incoming[root][1])
+
+        for table, key_columns in keys.items():  # parents before children.
+            # the keys as text: the dates of the keys are compared with the strings of the JSON.
+            curs.execute(sql.SQL("SELECT ctid, {keys}, {hash} FROM {table} WHERE {field} = ANY(%s)").format(
+                keys=sql.SQL(", ").join(sql.SQL("{}::text").format(sql.Identifier(column)) for column in key_columns),
+                hash=sql.Identifier(HASH_COLUMN), table=sql.Identifier(table), field=sql.Identifier(root_key)),
+                (changed,))
+            stored = {tuple(row[1:-1]): (row[0], row[-1]) for row in curs.fetchall()}
+            self.stats["statements"] += 1
+
+            gone = [ctid for key, (ctid, _) in stored.items() if (table, key) not in rows]
+            if gone:
+                curs.execute(sql.SQL("DELETE FROM {table} WHERE ctid = ANY(%s::tid[])").format(
+                    table=sql.Identifier(table)), (gone,))
+                self.stats["statements"] += 1
+                self.stats["deleted"] += len(gone)
+
+            # new and changed rows, with all the columns of the table: the values gone from the JSON are NULL.
+            upserts = {}
+            for (row_table, key), (columns, values, row_hash) in rows.items():
+                if row_table != table or (key in stored and stored[key][1] == row_hash):
+                    continue
+                missing = tuple(column for column in self.columns.get(table, [])
+                                if column not in columns and column != HASH_COLUMN)
+                upserts.setdefault(columns + missing, []).append(values + (None,) * len(missing) + (row_hash,))
+
+            for columns, args in upserts.items():
+                execute_values(curs, insert_query(table, columns + (HASH_COLUMN,), key_columns), args,
+                               page_size=PAGE_SIZE)
+                self.stats["statements"] += -(-len(args) // PAGE_SIZE)
+                self.stats["rows"] += len(args)
+
+    def close_history(self, curs, documents: list):
+        """closes the current versions of the rows of the documents (json, params, uid_value) gone from the register."""
+        by_params = {}
+        for json, params, uid_value in documents:
+            root = next(iter(uid_pair_of(json, params.get("uid_key"), uid_value).values()))
+            by_params.setdefault(params.get("name"), (params, {}))[1][root] = (None, {})  # no row left.
+
+        for params, incoming in by_params.values():
+            keys = plan_of(params).keys()
+            for table in HISTORY_TABLES:
+                if table in keys:
+                    self.append_history(curs, table, keys[table], params.get("uid_key")[0], incoming)
+
+    def append_history(self, curs, table, key_columns, root_key, incoming: dict):
+        """closes the current versions of the rows of a table changed or gone, appends the new versions."""
+        history = table + HISTORY_SUFFIX
+        rows = {}  # key: (columns, values, hash of the row alone, not of the document for the root row).
+        for _, document_rows in incoming.values():
+            for (row_table, key), (columns, values, _) in document_rows.items():
+                if row_table == table:
+                    rows[key] = (columns, values, row_hash(table, columns, values))
+
+        curs.execute(sql.SQL("SELECT ctid, {keys}, {hash} FROM {history} WHERE {field} = ANY(%s) AND valid_to IS NULL")
+                     .format(keys=sql.SQL(", ").join(sql.SQL("{}::text").format(sql.Identifier(column))
+                                                     for column in key_columns),
+                             hash=sql.Identifier(HASH_COLUMN), history=sql.Identifier(history),
+                             field=sql.Identifier(root_key)), (list(incoming),))
+        current = {tuple(row[1:-1]): (row[0], row[-1]) for row in curs.fetchall()}
+        self.stats["statements"] += 1
+
+        # valid_to and valid_from are now(), the start of the transaction: the periods of a row follow each other.
+        closed = [ctid for key, (ctid, stored_hash) in current.items()
+                  if key not in rows or rows[key][2] != stored_hash]
+        if closed:
+            curs.execute(sql.SQL("UPDATE {history} SET valid_to = now() WHERE ctid = ANY(%s::tid[])").format(
+                history=sql.Identifier(history)), (closed,))
+            self.stats["statements"] += 1
+            self.stats["closed"] += len(closed)
+
+        versions = {}
+        for key, (columns, values, version_hash) in rows.items():
+            if key in current and current[key][1] == version_hash:
+                continue
+            missing = tuple(column for column in self.columns.get(table, [])
+                            if column not in columns and column != HASH_COLUMN)
+            versions.setdefault(columns + missing, []).append(values + (None,) * len(missing) + (version_hash,))
+
+        for columns, args in versions.items():
+            execute_values(curs, insert_query(history, columns + (HASH_COLUMN,), None), args, page_size=PAGE_SIZE)
+            self.stats["statements"] += -(-len(args) // PAGE_SIZE)
+            self.stats["versions"] += len(args)
+
+
+def content_hash(values) -> int:
+    """func hashing values (with a deterministic repr) into the signed 64 bits integer of the content_hash columns."""
+    return int.from_bytes(hashlib.blake2b(repr(values).encode(), digest_size=8).digest(), "big", signed=True)
+
+
+def row_hash(table: str, columns: tuple, values: tuple) -> int:
+    """func hashing a row of a table, whatever the order of its columns."""
+    return content_hash((table, sorted(zip(columns, values))))
+
+
+def hashed_rows(plan, json, uid_value, defaults: dict = None) -> (int, dict):
+    """
+    func normalising a document with its plan into {(table, key): (columns, values, hash)}, the key being the values
+    of the primary key of the table as text (as read back by DiffWriter), and the hash of the whole document, stored
+    as the hash of its root row. The hash of a row does not depend on the order of the keys in the JSON.
+    :param defaults: {table: {column: constant DEFAULT}} (see table_schema() in utils/bulk_ingest.py), the columns
+                     missing from the rows get their DEFAULT as the database would, before the keys and the hashes
+                     are taken: e.g. 'not provided' for a former name without forenames.
+    """
+    keys = plan.keys()
+    defaults = {} if defaults is None else defaults
+    rows = {}
+    for table, groups in plan.rows(json, uid_value=uid_value).items():
+        key_columns = keys[table]
+        table_defaults = defaults.get(table, {})
+        for columns, values_list in groups.items():
+            filled = tuple(column for column in table_defaults if column not in columns)
+            if filled:
+                columns = columns + filled
+                values_list = [values + tuple(table_defaults[column] for column in filled) for values in values_list]
+            positions = [columns.index(column) if column in columns else None for column in key_columns]
+            for values in values_list:
+                key = tuple(None if n is None or values[n] is None else str(values[n]) for n in positions)
+                # a row repeated in the JSON is written once, the first one (ON CONFLICT DO NOTHING of BatchWriter).
+                rows.setdefault((table, key), (columns, values, row_hash(table, columns, values)))
+
+    document_hash = content_hash(sorted(row_hash for _, _, row_hash in rows.values()))
+    root = next(iter(rows))
+    columns, values, _ = rows[root]
+    rows[root] = (columns, values, document_hash)
+    return document_hash, rows
+
+
+def insert_query(table: str, columns: tuple, p_key: (list, None)) -> sql.Composed:
+    """multi-row INSERT of execute_values(), the rows in conflict are updated on p_key if passed, skipped otherwise."""
+    fields = sql.SQL(', ').join(map(sql.Identifier, columns))
+    if p_key is None or set(columns) <= set(p_key):  # nothing to update.
+        return sql.SQL("INSERT INTO {table} ({fields}) VALUES %s ON CONFLICT DO NOTHING").format(
+            table=sql.Identifier(table), fields=fields)
+
+    return sql.SQL("INSERT INTO {table} ({fields}) VALUES %s ON CONFLICT ({p_key}) DO UPDATE SET {updates}").format(
+        table=sql.Identifier(table),
+        fields=fields,
+        p_key=sql.SQL(', ').join(map(sql.Identifier, p_key)),
+        updates=sql.SQL(', ').join(sql.SQL("{field} = EXCLUDED.{field}").format(field=sql.Identifier(column))
+                                   for column in columns if column not in p_key))
+
+
+def group_rows(rows) -> dict:
+    """func grouping row dictionaries by their columns: {(column, ...): [row tuple, ...]}, one INSERT per group."""
+    groups = {}
+    for row in rows:
+        columns = tuple(sorted(row))
+        groups.setdefault(columns, []).append(tuple(row[column] for column in columns))
+    return groups
+
+
+# ¹ https://www.psycopg.org/docs/extras.html#fast-execution-helpers
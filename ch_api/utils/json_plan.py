@@ -0,0 +1,144 @@
+#!/usr/bin/python3
+
+"""
+normalisation plans compiled from the params dictionaries of utils/json_params.py.
+
+Inserter.unpack() derives the keys of the arrays and leaves, the drop lists, the table names
+and the uid pairs again at every node of every document, and flatten every dictionary through the iteritems_nested()
+generator (a list of suffixes per value, joined at the end). A Plan does all of this once per params dictionary, then
+walks a document in one pass, flattening with string prefixes, into per-table row tuples grouped by columns:
+
+    {table: {(column, ...): [(value, ...), ...]}}
+
+ready for the multi-row INSERT or the COPY of a batch (see BatchWriter in utils/json_inserter.py, BulkLoader in
+utils/bulk_ingest.py). The rows are the same as the ones of Inserter.unpack(): same tables, columns, keys and ordinals
+of the array elements.
+"""
+
+from utils.json_rows import table_names, serial_key_of, uid_pair_of
+
+
+def flatten_into(row: dict, dict_: dict, prefix: str = "", drop: frozenset = frozenset()) -> dict:
+    """
+    func flattening the nested dictionaries of dict_ into row, like helpers.flatten_nested_dicts_only(): the keys of
+    the nested dictionaries are joined with "_", the top level keys in drop are skipped.
+
+    usage:
+    >>> from utils.json_plan import flatten_into
+    ... print(flatten_into({}, {"a": 1, "c": {"aa": 3}, "d": ["cant be unpacked"]}, drop=frozenset(["d"])))
+    {'a': 1, 'c_aa': 3}
+    """
+    for k, v in dict_.items():
+        if k in drop:
+            continue
+        if isinstance(v, dict):
+            flatten_into(row, v, prefix + k + "_")
+        else:
+            row[prefix + k] = v
+    return row
+
+
+def add_row(out: dict, table: str, row: dict) -> None:
+    """appends the row to the rows of the table with the same columns, empty strings are NULL."""
+    values = tuple(None if isinstance(v, str) and not v.strip() else v for v in row.values())
+    out.setdefault(table, {}).setdefault(tuple(row), []).append(values)
+
+
+class Plan:
+    """
+    class holding the normalisation of the JSON of a params dictionary, compiled once: table names, keys to skip and
+    to flatten, uid keys of every node, and the wiring of the *_serial_id of the array elements.
+
+    usage:
+    >>> from utils.json_plan import plan_of
+    ... from utils.json_params import psc_params
+    ... tables = plan_of(psc_params).rows(document, uid_value="OC399321")
+    {"psc": {("active_count", ..., "company_number"): [(1, ..., "OC399321")]}, "psc_items": {...}, ...}
+    """
+
+    def __init__(self, params: dict, table: str = None, pair_keys: tuple = None):
+        arrays_params, leaves_params = params.get("arrays", []), params.get("leaves", [])
+
+        self.table, draft = table_names(params, table)
+        self.uid_key = params.get("uid_key")
+        # the keys of the uid pair of the rows of this node, the uid_key of the root.
+        self.pair_keys = tuple(self.uid_key) if pair_keys is None else pair_keys
+
+        self.skip = frozenset([dict_.get("name") for dict_ in arrays_params + leaves_params]
+                              + params.get("drop_from_root", []))
+        self.leaves = [(dict_.get("name"), draft + dict_.get("name"), frozenset(dict_.get("drop", [])))
+                       for dict_ in leaves_params]
+
+        # (array key, table, plan of the elements if dictionaries, elements numbered, columns if atoms).
+        self.arrays = []
+        for array_params in arrays_params:
+            array_key, array_table = array_params.get("name"), draft + array_params.get("name")
+            serial = serial_key_of(array_params, dict.fromkeys(self.pair_keys)) is not None
+
+            element_pair_keys = tuple(array_params.get("uid_key")[:len(self.pair_keys) + serial])
+            fields = array_params.get("uid_key")
+            if array_key not in fields:
+                fields = fields + [array_key]
+            atom_columns = tuple(fields[:len(self.pair_keys) + 1])
+
+            self.arrays.append((array_key, array_table, Plan(array_params, table=array_table,
+                                                             pair_keys=element_pair_keys), serial, atom_columns))
+
+    def keys(self) -> dict:
+        """the primary key of each table of the plan: {table: (column, ...)}, parents before children."""
+        keys = {self.table: tuple(self.uid_key)}
+        for _, leaf_table, _ in self.leaves:
+            keys[leaf_table] = self.pair_keys
+        for _, _, element_plan, _, _ in self.arrays:
+            keys.update(element_plan.keys())
+        return keys
+
+    def rows(self, document: dict, uid_value=None, out: dict = None) -> dict:
+        """
+        normalises a document, as passed to Inserter(json, params).unpack(uid_value), into per-table row tuples:
+        {table: {columns: [values, ...]}}, parents before children. Pass out to add the rows of many documents.
+        """
+        out = {} if out is None else out
+        self.walk(document, uid_pair_of(document, self.uid_key, uid_value), out)
+        return out
+
+    def walk(self, node: dict, uid_pair: dict, out: dict) -> None:
+        row = flatten_into({}, node, drop=self.skip)
+        row.update(uid_pair)
+        add_row(out, self.table, row)
+
+        for leaf_key, leaf_table, leaf_drop in self.leaves:
+            leaf_data = node.get(leaf_key)
+            if leaf_data is not None:
+                leaf_row = flatten_into({}, leaf_data, drop=leaf_drop)
+                leaf_row.update(uid_pair)
+                add_row(out, leaf_table, leaf_row)
+
+        uid_values = tuple(uid_pair.values())
+        for array_key, array_table, element_plan, serial, atom_columns in self.arrays:
+            array_data = node.get(array_key)
+            if not array_data:
+                continue
+
+            if isinstance(array_data[0], dict):
+                if serial:
+                    for ordinal, element in enumerate(array_data, start=1):
+                        element_plan.walk(element, dict(zip(element_plan.pair_keys, uid_values + (ordinal,))), out)
+                else:
+                    element_pair = dict(zip(element_plan.pair_keys, uid_values))
+                    for element in array_data:
+                        element_plan.walk(element, element_pair, out)
+            else:
+                atoms = out.setdefault(array_table, {}).setdefault(atom_columns, [])
+                for atom in array_data:
+                    atoms.append(uid_values + (None if isinstance(atom, str) and not atom.strip() else atom,))
+
+
+_plans = {}  # id(params): (params, Plan).
+
+
+def plan_of(params: dict) -> Plan:
+    """func returning the plan of a params dictionary, compiled at the first call."""
+    if id(params) not in _plans:
+        _plans[id(params)] = (params, Plan(params))
+    return _plans[id(params)][1]
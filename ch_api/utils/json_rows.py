@@ -0,0 +1,32 @@
+#!/usr/bin/python3
+
+"""
+the rules of Inserter.unpack() naming the tables and keying the rows of a JSON document: uid pairs, serial keys of the
+array elements, table names. Shared by the plans of utils/json_plan.py, which normalise whole documents into the rows of
+their tables for the writers inserting many rows per statement.
+"""
+
+
+def uid_pair_of(json_: dict, uid_key: list, uid_value) -> dict:
+    """the uid_pair of Inserter.create_uid_pair(): from uid_value if passed, from the document otherwise."""
+    if uid_value is None:
+        return {k: v for k, v in json_.items() if k in uid_key}
+    if isinstance(uid_value, (list, tuple)):
+        return dict(zip(uid_key, uid_value))
+    return dict(zip(uid_key, [uid_value]))
+
+
+def serial_key_of(array_params: dict, parent_uid_pair: dict):
+    """
+    the key of the elements of an array numbered by their ordinal in the array (e.g. "psc_serial_id"), None if the
+    elements are keyed by their own values (e.g. former_names: forenames, surname).
+    """
+    return next((k for k in array_params.get("uid_key", []) if k.endswith("_serial_id") and k not in parent_uid_pair),
+                None)
+
+
+def table_names(params: dict, table: str = None) -> (str, str):
+    """(table of the node, draft name of the tables of its branches), as in Inserter.create_table_variables()."""
+    if params.get("is_root"):
+        return params.get("name"), params.get("abbreviation") + "_"
+    return table, table + "_" if (params.get("arrays") or params.get("leaves")) else ""
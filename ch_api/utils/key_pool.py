@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.rate_limiter import AdaptiveLimiter
+
+
+def read_keys(path: str) -> list:
+	"""
+	func to read the api keys from a file, one key per line. Empty lines and lines starting with # are skipped.
+	duplicated keys are read once, as CH counts the calls per key.
+	"""
+	keys = []
+	with open(path) as f:
+		for line in f:
+			key = line.strip()
+			if key and not key.startswith("#") and key not in keys:
+				keys.append(key)
+	return keys
+
+
+class KeyPool:
+	"""
+	pool of api keys, each with its own rate limiter, so that the calls of one run are spread across all the keys and
+	the total throughput grows linearly with the number of keys. The limiter of each key starts from a budget of
+	"calls" per "period" seconds and then follows the X-Ratelimit-* headers of the responses (see AdaptiveLimiter).
+
+	every call borrows the least loaded key (the one that can be used soonest, then the one with fewest calls in
+	flight). A key rejected by the API with a 401 is removed from the pool.
+
+	the pools of several processes using the same keys share their budget through "shared", a SharedTokenBucket with
+	one bucket per key (in the order of keys): each call waits for its limiter and for the shared bucket of its key.
+
+	usage:
+	>>> from utils.key_pool import KeyPool
+	... pool = KeyPool(keys=["key_1", "key_2"], calls=600, period=300)
+	... with pool.borrow() as key:  # sleeps until the least loaded key can be used.
+	...     r = session.get(url, auth=(key, ""))
+	...     pool.update(key, headers=r.headers, status_code=r.status_code)
+	... if r.status_code == 401:
+	...     pool.remove(key)
+	"""
+
+	def __init__(self, keys: list, calls: int, period: float, clock=time.time, shared=None):
+		if shared is not None and len(shared) < len(keys):
+			raise ValueError("The shared rate limiter needs one bucket per key.")
+
+		self.calls = calls
+		self.period = period
+		self.shared = shared
+		self._shared_index = {key: index for index, key in enumerate(keys)}
+		self._limiters = {key: AdaptiveLimiter(calls=calls, period=period, clock=clock) for key in keys}
+		self._in_flight = {key: 0 for key in keys}
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._limiters)
+
+	def keys(self) -> list:
+		return list(self._limiters)
+
+	def acquire(self) -> (str, float):
+		"""picks the least loaded key, books a call on it and returns (key, seconds to wait before using it)."""
+		with self._lock:
+			if not self._limiters:
+				raise PermissionError("No api key left in the pool: add your key(s) to utils/api_key, one per line.\n"
+				                      "Keys rejected by the API (HTTP 401) are removed from the pool.")
+
+			key = min(self._limiters, key=lambda k: (self._limiters[k].delay(), self._in_flight[k]))
+			self._in_flight[key] += 1
+			wait = self._limiters[key].reserve()
+			if self.shared is not None:
+				wait = max(wait, self.shared.reserve(self._shared_index[key]))
+			return key, wait
+
+	def update(self, key: str, headers, status_code: int = 200) -> None:
+		"""feeds the X-Ratelimit-* headers of a response to the limiter of the key used for the call."""
+		limiter = self._limiters.get(key)
+		if limiter is not None:
+			limiter.update(headers=headers, status_code=status_code)
+
+	def release(self, key: str) -> None:
+		with self._lock:
+			if key in self._in_flight:
+				self._in_flight[key] -= 1
+				self._limiters[key].release()
+
+	def remove(self, key: str) -> None:
+		"""drops a key from the pool, e.g. after the API answered 401 to a call made with it."""
+		with self._lock:
+			if self._limiters.pop(key, None) is not None:
+				self._in_flight.pop(key)
+				print(f"API key ending in ...{key[-4:]} rejected by the API (HTTP 401), {len(self._limiters)} key(s) left.")
+
+	@contextmanager
+	def borrow(self):
+		"""context manager yielding the least loaded key once it can be used."""
+		key, wait = self.acquire()
+		try:
+			if wait > 0:
+				time.sleep(wait)
+			yield key
+		finally:
+			self.release(key)
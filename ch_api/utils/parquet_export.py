@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+"""
+columnar export of the tables to Parquet files (prog.py --parquet), read by pandas, DuckDB, Spark... far faster than
+the Excel files of --excel:
+
+  * the schema of each file is the one of its table in the database, as described by the cursor (VARCHAR -> string,
+    INTEGER -> int32, NUMERIC(12, 2) -> decimal128(12, 2), ...), not inferred from the values: an empty or all-NULL
+    column keeps its type, and the columns added by the migrations (content_hash, the *_history tables) are exported
+    too;
+  * each table is read with a server-side (named) cursor, CHUNK_ROWS rows at a time, converted to Arrow record batches
+    and written in row groups of ROW_GROUP_ROWS rows, compressed with zstd;
+  * the tables are exported in parallel, WORKERS at a time, each with its own connection of the pool of the engine.
+
+needs pyarrow¹ (optional, pip install pyarrow): the other modes of prog.py run without it.
+
+usage:
+>>> from utils.parquet_export import export_tables
+... export_tables(engine, ["ol_items", "ol_items_address"], "public_ol")
+{'ol_items': 1500000, 'ol_items_address': 1500000}
+>>> import pandas as pd
+... pd.read_parquet("public_ol/ol_items.parquet")
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+
+from psycopg2 import sql
+
+try:
+    import pyarrow as pa  # optional: only --parquet needs it.
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+from utils.bulk_ingest import table_columns
+
+CHUNK_ROWS = 50000  # rows fetched from the server at a time.
+ROW_GROUP_ROWS = 1000000  # rows per row group: large groups for fast scans, with statistics to skip them.
+COMPRESSION = "zstd"
+WORKERS = 4  # tables exported at the same time.
+
+# Arrow types of the postgres types (the OIDs of pg_type² in the description of a cursor): the types not listed
+# (VARCHAR, arrays, JSON...) are written as strings.
+ARROW_TYPES = {
+    16: "bool_",  # bool
+    21: "int16",  # int2
+    23: "int32",  # int4
+    20: "int64",  # int8
+    700: "float32",  # float4
+    701: "float64",  # float8
+    1082: "date32"}  # date
+TIMESTAMP_TYPES = {1114: None, 1184: "UTC"}  # timestamp, timestamptz: their time zone.
+NUMERIC = 1700  # decimal128 of the precision and scale of the column, strings if they are not declared.
+MAX_PRECISION = 38  # of decimal128.
+
+
+def arrow_schema(description):
+    """
+    func to turn the description of a cursor [(column, type OID, size, internal size, precision, scale, null ok), ...]
+    into the Arrow schema of its rows.
+    """
+    fields = []
+    for column in description:
+        name, oid = column[0], column[1]
+        if oid in TIMESTAMP_TYPES:
+            fields.append((name, pa.timestamp("us", tz=TIMESTAMP_TYPES[oid])))
+        elif oid == NUMERIC and column[4] is not None and column[4] <= MAX_PRECISION:  # NUMERIC(precision, scale).
+            fields.append((name, pa.decimal128(column[4], column[5] or 0)))
+        else:
+            fields.append((name, getattr(pa, ARROW_TYPES.get(oid, "string"))()))
+    return pa.schema(fields)
+
+
+def record_batch(schema, rows: list):
+    """
+    func to turn rows (tuples) into an Arrow record batch of the schema, the values of the string columns as text and
+    those of the timestamptz columns in UTC.
+    """
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays([pa.array(converted(values, field.type), type=field.type)
+                                       for values, field in zip(columns, schema)], schema=schema)
+
+
+def converted(values, type_):
+    if type_ == pa.string():
+        return as_text(values)
+    if pa.types.is_timestamp(type_) and type_.tz is not None:
+        return as_utc(values)
+    return values
+
+
+def as_text(values) -> list:
+    return [value if value is None or isinstance(value, str) else str(value) for value in values]
+
+
+def as_utc(values) -> list:
+    """the timestamptz (aware datetimes, in the time zone of the session) as naive UTC: pyarrow<2 drops their offset."""
+    return [value if value is None else value.astimezone(timezone.utc).replace(tzinfo=None) for value in values]
+
+
+def export_table(engine, table: str, path: str, chunk_rows: int = CHUNK_ROWS,
+                 row_group_rows: int = ROW_GROUP_ROWS) -> int:
+    """
+    func to write a table to a Parquet file, with all the columns of the table and their types.
+    :return: the number of rows written.
+    """
+    rows = 0
+    with engine.connection() as conn:
+        with conn.cursor(name=f"parquet_export_{table}") as curs:  # server-side: the rows are fetched chunk by chunk.
+            curs.execute(sql.SQL("SELECT * FROM {table}").format(table=sql.Identifier(table)))
+            chunk = curs.fetchmany(chunk_rows)
+            schema = arrow_schema(curs.description)  # a named cursor describes its rows once the first are fetched.
+
+            writer = pq.ParquetWriter(path, schema, compression=COMPRESSION)
+            try:
+                batches, batched = [], 0
+                while True:
+                    if chunk:
+                        batches.append(record_batch(schema, chunk))
+                        batched += len(chunk)
+                    # a row group at a time: the record batches are compact, the rows (tuples) of one chunk only.
+                    if batched >= row_group_rows or (not chunk and batched):
+                        group = pa.Table.from_batches(batches, schema=schema)
+                        writer.write_table(group.slice(0, row_group_rows), row_group_size=row_group_rows)
+                        rows += min(batched, row_group_rows)
+                        rest = group.slice(row_group_rows)  # zero-copy, the start of the next row group.
+                        batches, batched = rest.to_batches(), rest.num_rows
+                    if not chunk and not batched:
+                        break
+                    if chunk:
+                        chunk = curs.fetchmany(chunk_rows)
+            finally:
+                writer.close()
+    return rows
+
+
+def export_tables(engine, tables: list, folder: str, workers: int = WORKERS) -> dict:
+    """
+    func to write tables to the Parquet files {folder}/{table}.parquet, workers tables at a time.
+    :param engine: MyDb instance, its pool lends a connection to each worker.
+    :return: {table: number of rows written}.
+    """
+    if pa is None:
+        raise ImportError("--parquet needs pyarrow: pip install pyarrow.")
+
+    with engine.connection() as conn:
+        existing = table_columns(conn)
+    unknown = [table for table in tables if table not in existing]
+    if unknown:
+        raise ValueError(f"the tables {unknown} are not in the schema of the database.")
+
+    os.makedirs(folder, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {table: executor.submit(export_table, engine, table, os.path.join(folder, table + ".parquet"))
+                   for table in tables}
+        return {table: future.result() for table, future in futures.items()}
+
+
+# ¹ https://arrow.apache.org/docs/python/parquet.html
+# ² https://www.postgresql.org/docs/12/catalog-pg-type.html
@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+
+import collections
+import json
+import threading
+import time
+
+try:
+	import orjson  # optional: faster measure of the size of the documents, see document_size().
+except ImportError:
+	orjson = None
+
+WRITERS = 2  # default number of writer workers draining the queue into the database.
+QUEUE_MB = 256  # default bound of the queue, in MB of JSON documents.
+REPORT_EVERY = 10  # seconds between two progress lines.
+
+
+def document_size(document: dict) -> int:
+	"""func returning the size in bytes of a JSON document once serialised, as a measure of its memory footprint."""
+	if orjson is not None:
+		return len(orjson.dumps(document))
+	return len(json.dumps(document))
+
+
+class ByteBoundedQueue:
+	"""
+	thread safe FIFO queue bounded by the total size (bytes) of the items waiting in it instead of their number, so the
+	memory stays flat whether the documents are small company profiles or officer lists of thousands of items.
+
+	put() blocks while the queue is full, get() while it is empty. An item larger than the bound alone is let through
+	once the queue is empty. The time spent waiting on both sides is kept in stats.
+
+	usage:
+	>>> from utils.pipeline import ByteBoundedQueue
+	... queue = ByteBoundedQueue(max_bytes=256 * 1024 ** 2)
+	... queue.put(document, size=document_size(document))  # producers.
+	... queue.close()  # once all the producers are done.
+	... while (document := queue.get()) is not None:  # consumers, None once closed and drained.
+	...     ...
+	"""
+
+	def __init__(self, max_bytes: int):
+		self.max_bytes = max_bytes
+		self.bytes = 0
+		self.closed = False
+		self.stats = {"peak_items": 0, "peak_bytes": 0, "put_wait": 0.0, "get_wait": 0.0}
+		self._items = collections.deque()
+		self._cond = threading.Condition()
+
+	def __len__(self):
+		return len(self._items)
+
+	def put(self, item, size: int) -> bool:
+		"""adds the item, waiting for room if full. Returns False if the queue was aborted."""
+		with self._cond:
+			start = time.perf_counter()
+			while not self.closed and self._items and self.bytes + size > self.max_bytes:
+				self._cond.wait()
+			self.stats["put_wait"] += time.perf_counter() - start
+
+			if self.closed:
+				return False
+
+			self._items.append((item, size))
+			self.bytes += size
+			self.stats["peak_items"] = max(self.stats["peak_items"], len(self._items))
+			self.stats["peak_bytes"] = max(self.stats["peak_bytes"], self.bytes)
+			self._cond.notify_all()
+			return True
+
+	def get(self):
+		"""returns the oldest item, waiting for one if empty. Returns None once the queue is closed and drained."""
+		with self._cond:
+			start = time.perf_counter()
+			while not self._items and not self.closed:
+				self._cond.wait()
+			self.stats["get_wait"] += time.perf_counter() - start
+
+			if not self._items:
+				return None
+
+			item, size = self._items.popleft()
+			self.bytes -= size
+			self._cond.notify_all()
+			return item
+
+	def close(self) -> None:
+		"""no more items will be put: the consumers drain the items left then get() returns None."""
+		with self._cond:
+			self.closed = True
+			self._cond.notify_all()
+
+	def abort(self) -> None:
+		"""drops the items left and wakes up producers and consumers, e.g. when a stage failed."""
+		with self._cond:
+			self._items.clear()
+			self.bytes = 0
+			self.closed = True
+			self._cond.notify_all()
+
+
+class Pipeline:
+	"""
+	pipelined run: fetch workers extract the JSON of the jobs and push the complete documents onto a queue bounded by
+	bytes, writer workers drain it into the database at the same time, so that the calls to the API and the writes to
+	postgres overlap instead of alternating.
+
+	fetch(job) returns the JSON of a job, open_writer() returns a writer per writer worker (e.g. a BatchWriter) with the
+	add(json, params, uid_value) and flush() methods. The jobs are (params dictionary, url_id) pairs.
+
+	the throughput of each stage and the depth of the queue are printed every report_every seconds, and at the end the
+	time each stage waited on the other: fetchers waiting on a full queue mean the database is the bottleneck, writers
+	waiting on an empty queue mean the API is.
+
+	usage:
+	>>> from utils.pipeline import Pipeline
+	... pipeline = Pipeline(fetch=lambda job: Getter(json_params=job[0], url_id=job[1]).extract()[0],
+	...                     open_writer=lambda: BatchWriter(batch_size=500), fetchers=8, writers=2)
+	... pipeline.run([(psc_params, "OC399321"), (psc_params, "OC323310")])
+	... print(pipeline.report())
+	"""
+
+	def __init__(self, fetch: callable, open_writer: callable, fetchers: int = 1, writers: int = WRITERS,
+				 max_bytes: int = QUEUE_MB * 1024 ** 2, report_every: float = REPORT_EVERY):
+		if fetchers < 1 or writers < 1:
+			raise ValueError("A pipeline needs at least one fetcher and one writer.")
+
+		self.fetch = fetch
+		self.open_writer = open_writer
+		self.fetchers = fetchers
+		self.writers = writers
+		self.report_every = report_every
+
+		self.queue = ByteBoundedQueue(max_bytes=max_bytes)
+		self.stats = {"fetched": 0, "fetched_bytes": 0, "written": 0, "fetch_time": 0.0, "write_time": 0.0}
+		self.open_writers = []  # the writers of the writer workers, e.g. to sum their stats.
+		self.error = None  # the first exception raised by a worker, re-raised by run().
+		self._jobs = iter(())
+		self._lock = threading.Lock()
+		self._start = None
+		self._done = threading.Event()
+
+	def run(self, jobs) -> dict:
+		"""runs all the jobs through the pipeline and returns the stats, raises the first error of any worker."""
+		self._jobs = iter(jobs)
+		self._start = time.perf_counter()
+
+		fetchers = [threading.Thread(target=self._guard, args=(self._fetch_worker,), name=f"fetch-{n}")
+					for n in range(self.fetchers)]
+		writers = [threading.Thread(target=self._guard, args=(self._write_worker,), name=f"write-{n}")
+				   for n in range(self.writers)]
+		monitor = threading.Thread(target=self._monitor, name="pipeline-monitor", daemon=True)
+
+		for thread in fetchers + writers + [monitor]:
+			thread.start()
+
+		for thread in fetchers:
+			thread.join()
+		self.queue.close()  # all the documents are in the queue: the writers drain it and stop.
+
+		for thread in writers:
+			thread.join()
+		self._done.set()
+
+		if self.error is not None:
+			raise self.error
+		return self.stats
+
+	def _guard(self, worker: callable) -> None:
+		try:
+			worker()
+		except BaseException as e:
+			with self._lock:
+				if self.error is None:
+					self.error = e
+			self.queue.abort()  # the other stages stop instead of waiting on the queue forever.
+
+	def _next_job(self):
+		with self._lock:
+			return next(self._jobs, None) if self.error is None else None
+
+	def _fetch_worker(self) -> None:
+		job = self._next_job()
+		while job is not None:
+			start = time.perf_counter()
+			document = self.fetch(job)
+			size = document_size(document)
+			elapsed = time.perf_counter() - start
+
+			with self._lock:
+				self.stats["fetched"] += 1
+				self.stats["fetched_bytes"] += size
+				self.stats["fetch_time"] += elapsed
+
+			if not self.queue.put((job, document), size=size):
+				return
+			job = self._next_job()
+
+	def _write_worker(self) -> None:
+		writer = self.open_writer()
+		with self._lock:
+			self.open_writers.append(writer)
+
+		item = self.queue.get()
+		while item is not None:
+			(params, url_id), document = item
+			start = time.perf_counter()
+			writer.add(json=document, params=params, uid_value=url_id)
+			elapsed = time.perf_counter() - start
+
+			with self._lock:
+				self.stats["written"] += 1
+				self.stats["write_time"] += elapsed
+			item = self.queue.get()
+
+		if self.error is None:
+			writer.flush()
+
+	def _monitor(self) -> None:
+		while not self._done.wait(self.report_every):
+			print(self.progress())
+
+	def progress(self) -> str:
+		elapsed = time.perf_counter() - self._start
+		return (f"fetched {self.stats['fetched']:,} ({self.stats['fetched'] / elapsed:,.1f} docs/s), "
+				f"written {self.stats['written']:,} ({self.stats['written'] / elapsed:,.1f} docs/s), "
+				f"queue {len(self.queue):,} docs / {self.queue.bytes / 1024 ** 2:,.1f} MB.")
+
+	def report(self) -> str:
+		queue_stats = self.queue.stats
+		bottleneck = ("the database is the bottleneck" if queue_stats["put_wait"] > queue_stats["get_wait"]
+					  else "the API is the bottleneck")
+		return (self.progress() + "\n"
+				f"queue peak {queue_stats['peak_items']:,} docs / {queue_stats['peak_bytes'] / 1024 ** 2:,.1f} MB. "
+				f"fetchers waited {queue_stats['put_wait']:,.1f}s on a full queue, writers waited "
+				f"{queue_stats['get_wait']:,.1f}s on an empty queue: {bottleneck}.")
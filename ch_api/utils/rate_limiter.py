@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+import multiprocessing
+import re
+import threading
+import time
+
+BURST = 10  # max number of calls that can be made back to back when the bucket is full.
+
+
+class SharedTokenBucket:
+	"""
+	token buckets¹ shared by several processes (e.g. the workers of prog.py --workers), with the state of the buckets
+	(tokens, time of the last refill) kept in shared memory³ behind one process lock.
+
+	each bucket holds at most "burst" tokens and is refilled at a rate of (calls - burst) / period tokens per second, so
+	that the calls of all the processes together never exceed "calls" in any window of "period" seconds.
+
+	one bucket per api key: "n" buckets addressed by index. Create it in the parent process and pass it to the worker
+	processes when they are created (e.g. initargs of the pool), shared memory cannot be sent to a running process.
+
+	usage:
+	>>> from concurrent.futures import ProcessPoolExecutor
+	... from utils.rate_limiter import SharedTokenBucket
+	... bucket = SharedTokenBucket(calls=600, period=300, n=len(keys))
+	... executor = ProcessPoolExecutor(max_workers=4, initializer=configure_keys, initargs=(keys, 600, bucket))
+	"""
+
+	def __init__(self, calls: int, period: float, n: int = 1, burst: int = BURST, clock=time.monotonic,
+				 context=None):
+		if not 0 < burst < calls:
+			raise ValueError("\"burst\" should be greater than 0 and lower than \"calls\".")
+
+		self.calls = calls
+		self.period = period
+		self.capacity = burst
+		self.rate = (calls - burst) / period  # tokens added per second.
+		self.clock = clock  # CLOCK_MONOTONIC is the same for all the processes of the machine.
+
+		# created with the multiprocessing context (fork, spawn) of the processes it is shared with.
+		context = multiprocessing.get_context() if context is None else context
+		self._state = context.Array("d", [float(burst), clock()] * n, lock=False)  # tokens, last refill of each bucket.
+		self._lock = context.Lock()
+
+	def __len__(self):
+		return len(self._state) // 2
+
+	def reserve(self, index: int = 0) -> float:
+		"""takes a token from the bucket and returns the seconds to wait before it can be used (0 if available)."""
+		with self._lock:
+			now = self.clock()
+			tokens = min(self.capacity, self._state[2 * index] + (now - self._state[2 * index + 1]) * self.rate)
+			self._state[2 * index], self._state[2 * index + 1] = tokens - 1, now
+
+			# tokens can go negative: each caller queues behind the reservations made before its own.
+			return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+	def acquire(self, index: int = 0) -> None:
+		"""blocks the calling thread until a token is available."""
+		wait = self.reserve(index)
+		if wait > 0:
+			time.sleep(wait)
+
+
+def parse_window(window: str) -> float:
+	"""func to convert the X-Ratelimit-Window header ("5m", "300s", "1h") to seconds."""
+	match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", window)
+	if match is None:
+		raise ValueError(f"Cannot parse the rate limit window \"{window}\".")
+
+	value, unit = match.groups()
+	return float(value) * {"": 1, "s": 1, "m": 60, "h": 3600}[unit]
+
+
+class AdaptiveLimiter:
+	"""
+	thread safe rate limiter driven by the X-Ratelimit-* headers² CH returns with every response:
+	  X-Ratelimit-Limit: calls allowed in the window, X-Ratelimit-Remaining: calls left in the current window,
+	  X-Ratelimit-Reset: UTC epoch seconds at which the window resets, X-Ratelimit-Window: length of the window ("5m").
+
+	the calls are paced evenly over the time left before the reset, (reset - now) / remaining seconds apart, so that the
+	budget the server reports is used in full by the end of the window but never exceeded. Calls already lent but not
+	answered yet are subtracted from what the server reports, as the server has not counted them yet.
+
+	until the first response is received the limiter assumes a fresh window of "calls" per "period" seconds. When a
+	window resets and no new headers were received yet, the budget is assumed back in full.
+
+	a 429 response empties the budget: the next call is scheduled exactly at the reset reported by the server, or after
+	the Retry-After seconds (the window if none) of a 429 without the X-Ratelimit-* headers.
+
+	calls are booked with reserve() or acquire() and the responses are fed through update(). release() has to be
+	called once per reserve(), after update() if a response was received.
+
+	usage:
+	>>> from utils.rate_limiter import AdaptiveLimiter
+	... limiter = AdaptiveLimiter(calls=600, period=300)
+	... limiter.acquire()
+	... r = requests.get(url, auth=(key, ""))
+	... limiter.update(headers=r.headers, status_code=r.status_code)
+	... limiter.release()
+	"""
+
+	def __init__(self, calls: int, period: float, clock=time.time):
+		self.clock = clock  # wall clock, X-Ratelimit-Reset is an epoch timestamp.
+		self.limit = calls
+		self.window = float(period)
+
+		now = clock()
+		self.remaining = calls
+		self.reset = now + self.window
+		self.informed = False  # whether any X-Ratelimit-* header has been received yet.
+
+		self._next = now  # earliest time the next call can be made.
+		self._in_flight = 0
+		self._lock = threading.Lock()
+
+	def _next_slot(self, now: float) -> (float, float, float, int):
+		"""returns (slot, interval, reset, remaining) for the next call without booking it. Call with the lock held."""
+		slot = max(now, self._next)
+		reset, remaining = self.reset, self.remaining
+
+		# the window the slot falls in has reset: the budget is back in full.
+		if slot >= reset:
+			reset += self.window * (1 + (slot - reset) // self.window)
+			remaining = self.limit
+
+		# the budget is spent: wait for the reset.
+		if remaining <= 0:
+			slot, reset, remaining = reset, reset + self.window, self.limit
+
+		return slot, (reset - slot) / remaining, reset, remaining
+
+	def delay(self) -> float:
+		"""returns the seconds a call booked now would have to wait, without booking it."""
+		with self._lock:
+			now = self.clock()
+			return self._next_slot(now)[0] - now
+
+	def reserve(self) -> float:
+		"""books the next call and returns the seconds to wait before making it (0 if it can be made now)."""
+		with self._lock:
+			now = self.clock()
+			slot, interval, self.reset, remaining = self._next_slot(now)
+			self.remaining = remaining - 1
+			self._next = slot + interval
+			self._in_flight += 1
+			return slot - now
+
+	def acquire(self) -> None:
+		"""blocks the calling thread until the call can be made."""
+		wait = self.reserve()
+		if wait > 0:
+			time.sleep(wait)
+
+	def release(self) -> None:
+		"""marks a call booked with reserve() as finished (answered or failed)."""
+		with self._lock:
+			self._in_flight = max(0, self._in_flight - 1)
+
+	def throttle(self, retry_after: str = None) -> None:
+		"""empties the budget until Retry-After seconds from now, or the length of the window if it is missing."""
+		try:
+			wait = float(retry_after)
+		except (TypeError, ValueError):  # missing, or an HTTP date: not worth parsing, wait for the window.
+			wait = self.window
+
+		with self._lock:
+			self.reset, self.remaining = self.clock() + wait, 0
+
+	def update(self, headers, status_code: int = 200) -> None:
+		"""updates the budget with the X-Ratelimit-* headers of a response to a call booked with reserve()."""
+		remaining, reset = headers.get("X-Ratelimit-Remaining"), headers.get("X-Ratelimit-Reset")
+		if remaining is None or reset is None:
+			if status_code == 429:  # throttled all the same: wait as told, or for a whole window.
+				self.throttle(headers.get("Retry-After"))
+			return
+
+		with self._lock:
+			if headers.get("X-Ratelimit-Limit") is not None:
+				self.limit = int(headers["X-Ratelimit-Limit"])
+			if headers.get("X-Ratelimit-Window") is not None:
+				self.window = parse_window(headers["X-Ratelimit-Window"])
+
+			reset = float(reset)
+			# the other calls in flight were booked but are not counted by the server yet.
+			remaining = 0 if status_code == 429 else int(remaining) - (self._in_flight - 1)
+
+			if not self.informed or reset > self.reset + 1:  # first response or first of a new window.
+				self.reset, self.remaining = reset, remaining
+
+			elif abs(reset - self.reset) <= 1:  # same window: responses can arrive out of order, keep the lowest.
+				self.reset, self.remaining = reset, min(self.remaining, remaining)
+
+			# else: late response from a window that has already reset, nothing to learn from it.
+
+			self.informed = True
+
+
+# ¹ https://en.wikipedia.org/wiki/Token_bucket
+# ² https://developer-specs.company-information.service.gov.uk/guides/rateLimiting
+# ³ https://docs.python.org/3/library/multiprocessing.html#sharing-state-between-processes
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+import threading
+from concurrent.futures import Future
+
+
+class RequestCoalescer:
+	"""
+	thread safe coalescing of identical calls in flight: while a call for a key is being made, the other callers asking
+	for the same key wait for it and share its result instead of making the same call again.
+
+	the result is shared as it is, callers should share immutable results (e.g. the raw bytes of a response) and build
+	their own objects from them. Once the call completes the key is forgotten: a later call is made again.
+
+	usage:
+	>>> from utils.request_coalescer import RequestCoalescer
+	... coalescer = RequestCoalescer()
+	... status, body = coalescer.call(url, fetch, url)  # fetch(url) runs once for all the threads asking for url.
+	... print(coalescer.report())
+	"""
+
+	def __init__(self):
+		self.stats = {"calls": 0, "coalesced": 0}
+		self._in_flight = {}  # key: Future of the call being made.
+		self._lock = threading.Lock()
+
+	def call(self, key, fn: callable, *args, **kwargs):
+		"""returns fn(*args, **kwargs), or the result of the identical call already in flight for the key."""
+		with self._lock:
+			future = self._in_flight.get(key)
+			leader = future is None
+			if leader:
+				future = self._in_flight[key] = Future()
+				self.stats["calls"] += 1
+			else:
+				self.stats["coalesced"] += 1
+
+		if not leader:
+			return future.result()  # raises the exception of the call if it failed.
+
+		try:
+			result = fn(*args, **kwargs)
+		except BaseException as e:
+			future.set_exception(e)
+			raise
+		else:
+			future.set_result(result)
+			return result
+		finally:
+			with self._lock:
+				del self._in_flight[key]
+
+	def report(self) -> str:
+		return f"{self.stats['coalesced']} identical calls in flight coalesced."
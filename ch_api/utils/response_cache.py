@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+DAY = 24 * 60 * 60  # Number of seconds in a day.
+
+# time to live of the responses cached for each resource, keyed by the last segment of the path of the url.
+# "company" is the companyprofile resource: /company/{company_number}.
+RESOURCE_TTL = {"company": 7 * DAY,
+                "officers": 7 * DAY,
+                "persons-with-significant-control": 7 * DAY,
+                "appointments": 7 * DAY,
+                "filing-history": DAY,
+                "charges": DAY,
+                "insolvency": DAY}
+
+DEFAULT_TTL = DAY  # time to live of the resources not listed above (e.g. the searches).
+
+MAX_BYTES = 2 * 1024 ** 3  # once the bodies stored exceed 2GB the least recently used ones are evicted.
+
+CachedResponse = namedtuple("CachedResponse", ["body", "etag", "fresh"])
+
+
+def normalise_url(url: str) -> str:
+	"""
+	func to build the key of a url in the cache: scheme and host lower case, no trailing slash, no fragment and the
+	query parameters sorted, so that the same resource requested with differently written urls is cached once.
+	"""
+	scheme, netloc, path, query, _ = urlsplit(url)
+	query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+	return urlunsplit((scheme.lower(), netloc.lower(), path.rstrip("/") or "/", query, ""))
+
+
+def resource_of(url: str) -> str:
+	"""
+	func to get the resource of a url: /company/OC399321/officers -> "officers", /company/OC399321 -> "company".
+	"""
+	segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+	if len(segments) == 2 and segments[0] == "company":
+		return "company"
+	return segments[-1] if segments else ""
+
+
+class ResponseCache:
+	"""
+	persistent cache of the bodies of the responses of the API, stored in a SQLite¹ file and keyed by normalised url.
+
+	  * a response younger than the time to live of its resource is fresh and served without calling the API.
+	  * a stale response with an etag is revalidated with a conditional request (If-None-Match): a 304 Not Modified
+		makes it fresh again without downloading the body.
+	  * once the bodies stored exceed max_bytes the least recently used responses are evicted.
+
+	the hits, revalidations and misses are counted and reported with report().
+
+	usage:
+	>>> from utils.response_cache import ResponseCache
+	... cache = ResponseCache(path="cache/responses.sqlite")
+	... cached = cache.lookup(url)  # CachedResponse(body, etag, fresh) or None.
+	... cache.store(url, body=r.content, etag=r.headers.get("ETag"))
+	"""
+
+	def __init__(self, path: str, max_bytes: int = MAX_BYTES, ttl: dict = None, clock=time.time):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.ttl = RESOURCE_TTL if ttl is None else ttl
+		self.clock = clock
+		self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+
+		self._lock = threading.Lock()
+		self._pid = None
+		self._conn = None
+		self._size = 0
+
+	def _connection(self) -> sqlite3.Connection:
+		"""opens the file lazily, once per process: a SQLite connection cannot be shared with a forked process."""
+		if self._pid != os.getpid():
+			if os.path.dirname(self.path):
+				os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+			conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute("CREATE TABLE IF NOT EXISTS responses ("
+			             "url TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, "
+			             "stored_at REAL NOT NULL, used_at REAL NOT NULL, size INTEGER NOT NULL)")
+			conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+			self._conn, self._pid = conn, os.getpid()
+			self._size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+		return self._conn
+
+	def lookup(self, url: str) -> CachedResponse:
+		"""returns the CachedResponse of the url, None if not cached. Counts a hit if fresh."""
+		key = normalise_url(url)
+		now = self.clock()
+
+		with self._lock:
+			conn = self._connection()
+			row = conn.execute("SELECT body, etag, stored_at FROM responses WHERE url = ?", (key,)).fetchone()
+
+			if row is None:
+				return None
+
+			body, etag, stored_at = row
+			fresh = now - stored_at < self.ttl.get(resource_of(key), DEFAULT_TTL)
+
+			if fresh:
+				self.stats["hits"] += 1
+				conn.execute("UPDATE responses SET used_at = ? WHERE url = ?", (now, key))
+
+			return CachedResponse(body=body, etag=etag, fresh=fresh)
+
+	def revalidated(self, url: str) -> None:
+		"""marks a stale response as fresh again after the API answered 304 Not Modified to a conditional request."""
+		key = normalise_url(url)
+		now = self.clock()
+
+		with self._lock:
+			self.stats["revalidated"] += 1
+			self._connection().execute("UPDATE responses SET stored_at = ?, used_at = ? WHERE url = ?", (now, now, key))
+
+	def store(self, url: str, body: bytes, etag: str = None) -> None:
+		"""
+		stores (or replaces) the body of the response of a url, then evicts the least recently used if needed.
+		counts a miss: the body had to be downloaded, either not cached, stale or changed since cached.
+		"""
+		key = normalise_url(url)
+		now = self.clock()
+
+		with self._lock:
+			self.stats["misses"] += 1
+			conn = self._connection()
+			old = conn.execute("SELECT size FROM responses WHERE url = ?", (key,)).fetchone()
+			conn.execute("INSERT OR REPLACE INTO responses (url, body, etag, stored_at, used_at, size) "
+			             "VALUES (?, ?, ?, ?, ?, ?)", (key, body, etag, now, now, len(body)))
+			self._size += len(body) - (old[0] if old else 0)
+
+			if self._size > self.max_bytes:
+				self._evict(conn, target=int(self.max_bytes * 0.9))
+
+	def _evict(self, conn: sqlite3.Connection, target: int) -> None:
+		"""deletes the least recently used responses until the bodies stored are below target bytes."""
+		while self._size > target:
+			rows = conn.execute("SELECT url, size FROM responses ORDER BY used_at LIMIT 500").fetchall()
+			if not rows:
+				self._size = 0
+				return
+
+			evicted = []
+			for url, size in rows:
+				if self._size <= target:
+					break
+				evicted.append((url,))
+				self._size -= size
+
+			conn.executemany("DELETE FROM responses WHERE url = ?", evicted)
+			self.stats["evicted"] += len(evicted)
+
+	def report(self) -> str:
+		calls_saved = self.stats["hits"] + self.stats["revalidated"]
+		return (f"response cache: {self.stats['hits']} hits, {self.stats['revalidated']} revalidated (304), "
+		        f"{self.stats['misses']} misses, {self.stats['evicted']} evicted. "
+		        f"{calls_saved} bodies not downloaded, {self.stats['hits']} calls not counted against the rate limit.")
+
+	def close(self) -> None:
+		with self._lock:
+			if self._conn is not None and self._pid == os.getpid():
+				self._conn.close()
+			self._conn, self._pid = None, None
+
+
+# ¹ https://docs.python.org/3/library/sqlite3.html
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+
+"""
+readers of the bulk snapshots published by Companies House, turning their records into documents shaped like the API
+resources, so that they are normalised onto the same tables of companyprofile_params and psc_params:
+
+  * Basic Company Data¹: one CSV (zipped) with one row per live company -> companyprofile documents.
+  * People with significant control snapshot²: JSON lines (zipped), one line per psc -> psc documents, one per company.
+
+the documents are then normalised into rows (utils/json_plan.py) and loaded by utils/bulk_ingest.py.
+"""
+
+import csv
+import io
+import json
+import zipfile
+from itertools import groupby
+
+
+# CompanyCategory of the Basic Company Data -> "type" of the companyprofile resource.
+COMPANY_TYPES = {
+    "Private Limited Company": "ltd",
+    "Public Limited Company": "plc",
+    "Limited Liability Partnership": "llp",
+    "Limited Partnership": "limited-partnership",
+    "Community Interest Company": "ltd",
+    "Private Unlimited Company": "private-unlimited",
+    "Private Unlimited": "private-unlimited",
+    "PRI/LTD BY GUAR/NSC (Private, limited by guarantee, no share capital)": "private-limited-guarant-nsc",
+    "PRI/LBG/NSC (Private, Limited by guarantee, no share capital, use of 'Limited' exemption)":
+        "private-limited-guarant-nsc-limited-exemption",
+    "PRIV LTD SECT. 30 (Private limited company, section 30 of the Companies Act)":
+        "private-limited-shares-section-30-exemption",
+    "Old Public Company": "old-public-company",
+    "Scottish Partnership": "scottish-partnership",
+    "Charitable Incorporated Organisation": "charitable-incorporated-organisation",
+    "Scottish Charitable Incorporated Organisation": "scottish-charitable-incorporated-organisation",
+    "Royal Charter Company": "royal-charter",
+    "Investment Company with Variable Capital": "investment-company-with-variable-capital",
+    "Industrial and Provident Society": "industrial-and-provident-society",
+    "Registered Society": "registered-society-non-jurisdictional",
+    "Further Education and Sixth Form College Corps": "further-education-or-sixth-form-college-corporation",
+    "European Public Limited-Liability Company (SE)": "european-public-limited-liability-company-se",
+    "Protected Cell Company": "protected-cell-company",
+    "Overseas Entity": "registered-overseas-entity",
+    "Unregistered Company": "unregistered-company",
+    "Converted/Closed": "converted-or-closed",
+    "Other company type": "other",
+    }
+
+# CompanyStatus of the Basic Company Data -> "company_status" of the companyprofile resource, slugified otherwise.
+COMPANY_STATUSES = {
+    "Active - Proposal to Strike off": "active",
+    "In Administration": "administration",
+    "In Administration/Administrative Receiver": "administration",
+    "In Administration/Receiver Manager": "administration",
+    "ADMINISTRATION ORDER": "administration",
+    "ADMINISTRATIVE RECEIVER": "receivership",
+    "RECEIVER MANAGER / ADMINISTRATIVE RECEIVER": "receivership",
+    "RECEIVERSHIP": "receivership",
+    "Live but Receiver Manager on at least one charge": "receivership",
+    "Voluntary Arrangement": "voluntary-arrangement",
+    }
+
+PREVIOUS_NAMES = 10  # PreviousName_1 (the most recent) ... PreviousName_10 columns of the Basic Company Data.
+SIC_CODES = 4  # SICCode.SicText_1 ... SICCode.SicText_4 columns of the Basic Company Data.
+
+
+def open_snapshot(path: str) -> io.TextIOBase:
+    """func to open a snapshot file as text, reading the 1st file in the archive if zipped (as published by CH)."""
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        return io.TextIOWrapper(archive.open(archive.namelist()[0]), encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def iso_date(value: str):
+    """func to convert the DD/MM/YYYY dates of the Basic Company Data to ISO dates, None if empty."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    day, month, year = value.split("/")
+    return f"{year}-{month}-{day}"
+
+
+def slug(value: str) -> str:
+    """"Active - Proposal to Strike off" -> "active-proposal-to-strike-off"."""
+    return "-".join(value.lower().replace("-", " ").replace("/", " ").split())
+
+
+def companyprofile_from_csv(row: dict) -> dict:
+    """
+    func to turn a row of the Basic Company Data into a companyprofile document, as returned by the API.
+    the columns the snapshot does not have (e.g. etag, can_file) are left out and will be NULL.
+    """
+    def get(column):
+        value = row.get(column)
+        return value.strip() if value is not None and value.strip() else None
+
+    company_number = get("CompanyNumber")
+    category, status = get("CompanyCategory") or "", get("CompanyStatus") or ""
+    date_of_creation = iso_date(get("IncorporationDate"))
+
+    # PreviousName_1 is the most recent name: each name was effective from the change of name before it.
+    changes = [(get(f"PreviousName_{n}.CompanyName"), iso_date(get(f"PreviousName_{n}.CONDATE")))
+               for n in range(1, PREVIOUS_NAMES + 1)]
+    changes = [(name, ceased_on) for name, ceased_on in changes if name and ceased_on]
+    previous_company_names = [{"name": name,
+                               "ceased_on": ceased_on,
+                               "effective_from": changes[n + 1][1] if n + 1 < len(changes) else date_of_creation}
+                              for n, (name, ceased_on) in enumerate(changes)]
+
+    # "70229 - Management consultancy activities other than financial management" -> "70229".
+    sic_codes = [sic_text.split(" - ")[0].strip() for sic_text in
+                 (get(f"SICCode.SicText_{n}") for n in range(1, SIC_CODES + 1))
+                 if sic_text and sic_text != "None Supplied"]
+
+    document = {
+        "company_name": get("CompanyName"),
+        "company_number": company_number,
+        "company_status": COMPANY_STATUSES.get(status, slug(status)) or None,
+        "date_of_cessation": iso_date(get("DissolutionDate")),
+        "date_of_creation": date_of_creation,
+        "has_charges": int(get("Mortgages.NumMortCharges") or 0) > 0,
+        "is_community_interest_company": str(category == "Community Interest Company").lower(),
+        "type": COMPANY_TYPES.get(category, slug(category)) or "other",
+        "links": {"self": f"/company/{company_number}"},
+        "registered_office_address": {"care_of": get("RegAddress.CareOf"),
+                                      "po_box": get("RegAddress.POBox"),
+                                      "address_line_1": get("RegAddress.AddressLine1"),
+                                      "address_line_2": get("RegAddress.AddressLine2"),
+                                      "locality": get("RegAddress.PostTown"),
+                                      "region": get("RegAddress.County"),
+                                      "country": get("RegAddress.Country"),
+                                      "postal_code": get("RegAddress.PostCode")},
+        "accounts": {"accounting_reference_date": {"day": get("Accounts.AccountRefDay"),
+                                                   "month": get("Accounts.AccountRefMonth")},
+                     "next_due": iso_date(get("Accounts.NextDueDate")),
+                     "last_accounts": {"made_up_to": iso_date(get("Accounts.LastMadeUpDate")),
+                                       "type": slug(get("Accounts.AccountCategory") or "") or None}},
+        "annual_return": {"next_due": iso_date(get("Returns.NextDueDate")),
+                          "last_made_up_to": iso_date(get("Returns.LastMadeUpDate"))},
+        "confirmation_statement": {"next_due": iso_date(get("ConfStmtNextDueDate")),
+                                   "last_made_up_to": iso_date(get("ConfStmtLastMadeUpDate"))},
+        "sic_codes": sic_codes,
+        "previous_company_names": previous_company_names,
+        }
+
+    # no empty arrays: Inserter.unpack() only walks the arrays with at least one element.
+    return {k: v for k, v in document.items() if v != []}
+
+
+def read_basic_company_data(path: str):
+    """generator func yielding a companyprofile document for each row of the Basic Company Data (zipped or not)."""
+    with open_snapshot(path) as f:
+        reader = csv.reader(f)
+        header = [column.strip() for column in next(reader)]  # the published header has leading spaces.
+        for values in reader:
+            if values:
+                yield companyprofile_from_csv(dict(zip(header, values)))
+
+
+def psc_from_lines(company_number: str, items: list) -> dict:
+    """func to build the psc document (the persons-with-significant-control list) of a company from its psc."""
+    ceased = sum(1 for item in items if item.get("ceased_on") or item.get("ceased"))
+    return {"company_number": company_number,
+            "kind": "persons-with-significant-control#list",
+            "links": {"self": f"/company/{company_number}/persons-with-significant-control"},
+            "active_count": len(items) - ceased,
+            "ceased_count": ceased,
+            "total_results": len(items),
+            "items": items}
+
+
+def read_psc_snapshot(path: str):
+    """
+    generator func yielding a psc document per company of the PSC snapshot (zipped or not). The snapshot lists the
+    psc grouped by company: {"company_number": "...", "data": {... the psc, as an item of the API resource ...}}.
+    the statements, the exemptions and the totals line are skipped, as the API resource does not list them either.
+    a company whose lines are not contiguous raises a ValueError: its document would replace the one of its first lines
+    (BulkLoader.load_batch() deletes the rows of each company first), the snapshot must be sorted by company_number.
+    """
+    def records(f):
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                data = record.get("data", {})
+                if "company_number" in record and data.get("kind", "").endswith("person-with-significant-control"):
+                    yield record["company_number"], data
+
+    seen = set()
+    with open_snapshot(path) as f:
+        for company_number, group in groupby(records(f), key=lambda record: record[0]):
+            if company_number in seen:
+                raise ValueError(f"{path}: the psc of {company_number} are not contiguous, sort the snapshot by "
+                                 f"company_number.")
+            seen.add(company_number)
+            yield psc_from_lines(company_number, [data for _, data in group])
+
+
+# ¹ http://download.companieshouse.gov.uk/en_output.html
+# ² http://download.companieshouse.gov.uk/en_pscdata.html
@@ -5,6 +5,9 @@ import os
 # If you don't run in Docker make sure your working (root) directory is ch_api/
 cwd = os.getcwd()
 
-# absolute path to the file holding the api key.
+# absolute path to the file holding the api keys, one per line.
 API_KEY_ABS_PATH = cwd + "/utils/api_key"
 # print(API_KEY_ABS_PATH)
+
+# absolute path to the SQLite file of the on-disk response cache (--cache flag of prog.py).
+CACHE_ABS_PATH = cwd + "/cache/responses.sqlite"